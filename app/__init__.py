@@ -2,7 +2,10 @@ from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 import os
 
-db = SQLAlchemy()
+from app.roteamento import SessaoRoteada
+
+# Sessão que envia os SELECTs das rotas do catálogo ao bind de leitura (BANCO_LEITURA)
+db = SQLAlchemy(session_options={'class_': SessaoRoteada})
 
 def create_app(config_name='development'):
     """Factory function para criar a aplicação Flask"""
@@ -12,16 +15,88 @@ def create_app(config_name='development'):
     from config import config
     app.config.from_object(config[config_name])
     
-    # Inicializar banco de dados
+    # Atrás de proxy reverso: remote_addr (usado pelos limites por IP) passa a ser o do cliente
+    if app.config['PROXY_SALTOS'] > 0:
+        from werkzeug.middleware.proxy_fix import ProxyFix
+        saltos = app.config['PROXY_SALTOS']
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=saltos, x_proto=saltos, x_host=saltos)
+    
+    # Inicializar banco de dados (e o bind de leitura do catálogo, se configurado)
+    from app.roteamento import configurar_bind_leitura
+    configurar_bind_leitura(app)
     db.init_app(app)
     
+    # PRAGMAs do SQLite em cada conexão (WAL, busy_timeout, cache...)
+    from app.banco import init_banco
+    init_banco(app)
+    
+    # Cache do catálogo (compartilhado entre workers)
+    from app.cache import init_cache_catalogo
+    init_cache_catalogo(app)
+    
+    # Cache de fragmentos de template ({% cache %})
+    from app.fragmentos import init_fragmentos
+    init_fragmentos(app)
+    
+    # ETag/Cache-Control do catálogo e compressão das respostas
+    from app.respostas import init_respostas
+    init_respostas(app)
+    
+    # Hash de senhas em pool de processos com fila limitada
+    from app.senhas import init_senhas
+    init_senhas(app)
+    
+    # Limites de requisições e controle de admissão das rotas caras
+    from app.limites import init_limites
+    init_limites(app)
+    
+    # Imagens de produtos: helper imagem_produto nos templates
+    from app.imagens import imagens_cli, init_imagens
+    init_imagens(app)
+    app.cli.add_command(imagens_cli)
+    
     # Registrar blueprints (rotas)
     from app.routes import auth_bp, main_bp
     app.register_blueprint(auth_bp)
     app.register_blueprint(main_bp)
     
-    # Criar tabelas se não existirem
+    # API JSON do catálogo (/api/produtos)
+    from app.api import api_bp
+    app.register_blueprint(api_bp)
+    
+    # Comandos da fila de tarefas (flask fila worker | estatisticas | limpar)
+    from app.fila import fila_cli
+    app.cli.add_command(fila_cli)
+    
+    # Importação/exportação do catálogo (flask catalogo importar | exportar)
+    from app.carga_catalogo import catalogo_cli
+    app.cli.add_command(catalogo_cli)
+    
+    # Arquivamento de pedidos antigos (flask pedidos arquivar)
+    from app.arquivamento import pedidos_cli
+    app.cli.add_command(pedidos_cli)
+    
+    # Limpeza de carrinhos abandonados (flask carrinhos limpar e tarefa periódica da fila)
+    from app.carrinhos_abandonados import carrinhos_cli
+    app.cli.add_command(carrinhos_cli)
+    
+    # Agregados de vendas dos relatórios (flask vendas reconstruir)
+    from app.vendas import vendas_cli
+    app.cli.add_command(vendas_cli)
+    
+    # Réplica local do banco para o bind de leitura (flask banco replicar)
+    from app.roteamento import banco_cli
+    app.cli.add_command(banco_cli)
+    
+    # Instrumentação opcional (Server-Timing, log de lentidão e histogramas)
+    if app.config.get('INSTRUMENTACAO_ATIVA'):
+        from app.instrumentacao import init_instrumentacao
+        init_instrumentacao(app)
+    
+    # Esquema do banco: só confere a versão (migrações: flask esquema migrar)
+    from app.migracoes import esquema_cli, verificar_esquema
+    app.cli.add_command(esquema_cli)
     with app.app_context():
-        db.create_all()
+        verificar_esquema(app)
     
     return app
@@ -0,0 +1,259 @@
+"""
+API JSON do catálogo (somente leitura) e do carrinho.
+
+    GET /api/produtos                 página por cursor (keyset)
+    GET /api/produtos/<id>            um produto
+    GET /api/produtos/exportar        catálogo inteiro em streaming (NDJSON ou JSON)
+    GET /api/carrinho                 itens e total do carrinho atual
+    POST /api/carrinho                lote de operações (adicionar/definir/remover)
+
+Parâmetros comuns: ``campos`` (ex.: ``campos=id,nome,preco``), ``preco_min``,
+``preco_max`` e ``em_estoque=1``. A listagem aceita ainda ``ordem``
+(id, preco, nome, data_criacao), ``limite`` e ``cursor`` (o
+``proximo_cursor`` da página anterior).
+
+A consulta seleciona só as colunas pedidas (mais as necessárias ao cursor),
+sem montar objetos do ORM. A exportação percorre o resultado em lotes
+(yield_per) e envia cada lote já serializado como um pedaço da resposta
+chunked, então a memória usada não depende do tamanho do catálogo. O
+serializador é o orjson, se instalado, senão o json da biblioteca padrão.
+
+As respostas do catálogo usam o mesmo ETag das páginas do catálogo (versão
+do catálogo). As do carrinho usam a sessão (cookie) como as páginas HTML e
+passam pelo mesmo serviço (app/carrinho.aplicar_operacoes): o lote é aplicado
+em uma transação e a resposta traz só as linhas alteradas e o novo total.
+"""
+import json
+import math
+
+from flask import Blueprint, current_app, jsonify, request, session, stream_with_context
+from sqlalchemy import select, tuple_
+from sqlalchemy.exc import OperationalError
+
+from app import db
+from app.carrinho import (EstoqueInsuficiente, OperacaoCarrinhoInvalida, aplicar_operacoes,
+                          calcular_total_carrinho, get_carrinho_itens)
+from app.catalogo import ORDENACOES_KEYSET, codificar_cursor, decodificar_cursor
+from app.limites import limitar
+from app.models import Produto
+from app.respostas import pagina_catalogo
+from app.roteamento import somente_leitura
+
+try:
+    import orjson
+except ImportError:  # serializador rápido é opcional
+    orjson = None
+
+api_bp = Blueprint('api', __name__, url_prefix='/api')
+
+CAMPOS = {nome: getattr(Produto, nome) for nome in ('id', 'sku', 'nome', 'descricao', 'preco', 'estoque', 'data_criacao')}
+CAMPOS_PADRAO = ('id', 'sku', 'nome', 'preco', 'estoque')
+
+
+class ParametroInvalido(ValueError):
+    pass
+
+
+def _padrao_json(valor):
+    if hasattr(valor, 'isoformat'):
+        return valor.isoformat()
+    raise TypeError(f'{type(valor).__name__} não é serializável em JSON')
+
+
+if orjson is not None:
+    def serializar(valor):
+        return orjson.dumps(valor)
+else:
+    _codificador = json.JSONEncoder(ensure_ascii=False, separators=(',', ':'), default=_padrao_json)
+
+    def serializar(valor):
+        return _codificador.encode(valor).encode('utf-8')
+
+
+class Projecao:
+    """Colunas a selecionar e nomes dos campos de saída, montados uma vez por requisição."""
+
+    def __init__(self, campos, extras=()):
+        self.campos = campos
+        # Colunas extras (id e ordenação, para o cursor) vêm depois e ficam de fora do registro
+        self.colunas = [CAMPOS[campo] for campo in campos]
+        self.colunas += [CAMPOS[campo] for campo in extras if campo not in campos]
+
+    def registro(self, linha):
+        return dict(zip(self.campos, linha))
+
+
+# ==================== PARÂMETROS ====================
+
+def _campos():
+    valor = request.args.get('campos')
+    if not valor:
+        return CAMPOS_PADRAO
+    campos = tuple(dict.fromkeys(campo.strip() for campo in valor.split(',') if campo.strip()))
+    desconhecidos = [campo for campo in campos if campo not in CAMPOS]
+    if not campos or desconhecidos:
+        raise ParametroInvalido(f'campos desconhecidos: {", ".join(desconhecidos)} '
+                                f'(disponíveis: {", ".join(CAMPOS)})')
+    return campos
+
+
+def _numero(nome, tipo):
+    valor = request.args.get(nome)
+    if valor is None or valor == '':
+        return None
+    try:
+        numero = tipo(valor)
+    except ValueError:
+        raise ParametroInvalido(f'{nome} inválido: {valor!r}')
+    if not math.isfinite(numero):
+        # nan/inf chegariam ao SQLite como NULL e a página viria vazia
+        raise ParametroInvalido(f'{nome} inválido: {valor!r}')
+    return numero
+
+
+def _filtros():
+    condicoes = []
+    preco_min = _numero('preco_min', float)
+    preco_max = _numero('preco_max', float)
+    if preco_min is not None:
+        condicoes.append(Produto.preco >= preco_min)
+    if preco_max is not None:
+        condicoes.append(Produto.preco <= preco_max)
+    if request.args.get('em_estoque', '').lower() in ('1', 'true', 'sim'):
+        condicoes.append(Produto.estoque > 0)
+    return condicoes
+
+
+def _resposta_json(corpo, status=200):
+    return current_app.response_class(serializar(corpo), status=status, mimetype='application/json')
+
+
+@api_bp.errorhandler(ParametroInvalido)
+def _parametro_invalido(erro):
+    return jsonify({'erro': str(erro)}), 400
+
+
+@api_bp.errorhandler(OperacaoCarrinhoInvalida)
+def _operacao_carrinho_invalida(erro):
+    return jsonify({'erro': str(erro)}), 409 if isinstance(erro, EstoqueInsuficiente) else 400
+
+
+# ==================== ROTAS ====================
+
+@api_bp.route('/produtos')
+@somente_leitura
+@pagina_catalogo
+def listar_produtos():
+    """Página de produtos por cursor: {"produtos": [...], "proximo_cursor": "..." | null}"""
+    campos = _campos()
+    ordem = request.args.get('ordem', 'id')
+    if ordem not in ORDENACOES_KEYSET:
+        raise ParametroInvalido(f'ordem inválida: {ordem!r}')
+    limite = _numero('limite', int) or current_app.config['API_LIMITE_PADRAO']
+    limite = max(1, min(limite, current_app.config['API_LIMITE_MAXIMO']))
+
+    coluna = ORDENACOES_KEYSET[ordem]
+    projecao = Projecao(campos, extras=('id', ordem))
+    consulta = select(*projecao.colunas).where(*_filtros())
+
+    cursor = request.args.get('cursor')
+    if cursor:
+        posicao = decodificar_cursor(cursor, ordem)
+        if posicao is None or posicao[2] != 'depois':
+            raise ParametroInvalido('cursor inválido')
+        valor, produto_id, _ = posicao
+        consulta = consulta.where(tuple_(coluna, Produto.id) > tuple_(valor, produto_id))
+
+    # Um item a mais indica se existe próxima página
+    linhas = db.session.execute(consulta.order_by(coluna, Produto.id).limit(limite + 1)).all()
+    proximo_cursor = codificar_cursor(ordem, linhas[limite - 1], 'depois') if len(linhas) > limite else None
+    return _resposta_json({
+        'produtos': [projecao.registro(linha) for linha in linhas[:limite]],
+        'proximo_cursor': proximo_cursor,
+    })
+
+
+@api_bp.route('/produtos/<int:produto_id>')
+@somente_leitura
+@pagina_catalogo
+def obter_produto(produto_id):
+    projecao = Projecao(_campos())
+    linha = db.session.execute(select(*projecao.colunas).where(Produto.id == produto_id)).first()
+    if linha is None:
+        return _resposta_json({'erro': 'produto não encontrado'}, 404)
+    return _resposta_json(projecao.registro(linha))
+
+
+def _gerar_exportacao(consulta, projecao, formato, tamanho_lote):
+    """Gera a resposta lote a lote: cada pedaço tem até tamanho_lote produtos já serializados."""
+    resultado = db.session.execute(consulta.execution_options(yield_per=tamanho_lote))
+    registro = projecao.registro
+    if formato == 'ndjson':
+        for lote in resultado.partitions():
+            yield b'\n'.join([serializar(registro(linha)) for linha in lote]) + b'\n'
+        return
+
+    separador = b'['
+    for lote in resultado.partitions():
+        yield separador + b','.join([serializar(registro(linha)) for linha in lote])
+        separador = b','
+    yield b']' if separador == b',' else b'[]'
+
+
+@api_bp.route('/produtos/exportar')
+@somente_leitura
+@pagina_catalogo
+def exportar_produtos():
+    """Catálogo inteiro (com os filtros) em streaming: ?formato=ndjson (padrão) ou json."""
+    formato = request.args.get('formato', 'ndjson')
+    if formato not in ('ndjson', 'json'):
+        raise ParametroInvalido(f'formato inválido: {formato!r}')
+    projecao = Projecao(_campos())
+    consulta = select(*projecao.colunas).where(*_filtros()).order_by(Produto.id)
+
+    corpo = _gerar_exportacao(consulta, projecao, formato, current_app.config['API_EXPORTACAO_LOTE'])
+    return current_app.response_class(
+        stream_with_context(corpo),
+        mimetype='application/x-ndjson' if formato == 'ndjson' else 'application/json',
+    )
+
+
+# ==================== CARRINHO ====================
+
+def _resposta_carrinho(corpo, status=200):
+    resposta = _resposta_json(corpo, status)
+    resposta.cache_control.no_store = True
+    return resposta
+
+
+@api_bp.route('/carrinho')
+def obter_carrinho():
+    """Carrinho atual: {"linhas": [...], "total": 0.0}"""
+    cliente_id = session.get('cliente_id')
+    linhas = [{'produto_id': item.produto_id, 'nome': item.produto.nome, 'preco': item.produto.preco,
+               'quantidade': item.quantidade, 'subtotal': item.produto.preco * item.quantidade}
+              for item in get_carrinho_itens(cliente_id)]
+    return _resposta_carrinho({'linhas': linhas, 'total': calcular_total_carrinho(cliente_id)})
+
+
+@api_bp.route('/carrinho', methods=['POST'])
+@limitar('carrinho')
+def alterar_carrinho():
+    """
+    Aplica {"operacoes": [{"op": "adicionar" | "definir" | "remover", "produto_id": 1, "quantidade": 2}, ...]}
+    tudo ou nada; responde {"linhas": [linhas alteradas], "total": novo total}.
+    """
+    # Exigir JSON também impede que um formulário de outro site envie o pedido sem preflight
+    if not request.is_json:
+        return _resposta_carrinho({'erro': 'envie o corpo como application/json'}, 415)
+    corpo = request.get_json(silent=True)
+    if not isinstance(corpo, dict):
+        return _resposta_carrinho({'erro': 'JSON inválido'}, 400)
+
+    try:
+        linhas, total = aplicar_operacoes(corpo.get('operacoes'), session.get('cliente_id'))
+    except OperationalError:
+        resposta = _resposta_carrinho({'erro': 'carrinho ocupado, tente novamente'}, 503)
+        resposta.headers['Retry-After'] = '1'
+        return resposta
+    return _resposta_carrinho({'linhas': linhas, 'total': total})
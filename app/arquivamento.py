@@ -0,0 +1,114 @@
+"""
+Arquivamento de pedidos antigos (flask pedidos arquivar).
+
+Pedidos entregues ou cancelados há mais de PEDIDOS_ARQUIVAR_APOS_DIAS dias
+são movidos, com seus itens e pagamento, para pedidos_arquivo,
+itens_pedido_arquivo e pagamentos_arquivo. Assim pedidos, itens_pedido e
+pagamentos (e seus índices) ficam do tamanho do movimento recente.
+
+O trabalho é feito em lotes de PEDIDOS_ARQUIVO_LOTE pedidos. Os ids de cada
+lote são lidos fora de qualquer transação de escrita; cada lote é copiado e
+apagado em uma transação curta, seguida de uma pausa (PEDIDOS_ARQUIVO_PAUSA)
+para que checkouts e workers da fila consigam o lock de escrita.
+
+As tabelas de arquivo ficam no mesmo arquivo SQLite: com WAL, uma transação
+que envolve dois bancos (ATTACH) não é atômica entre eles, e um pedido
+poderia ser perdido ou duplicado em uma queda no meio do lote.
+
+O pedido arquivado mantém o seu id (as URLs continuam valendo); itens e
+pagamento recebem ids novos. O pedido de maior id nunca é arquivado, para
+que o SQLite não reutilize ids de pedidos que estão no arquivo.
+"""
+import time
+from datetime import datetime, timedelta
+
+import click
+from flask import current_app
+from flask.cli import AppGroup, with_appcontext
+from sqlalchemy import delete, insert, select
+
+from app import db
+from app.models import (ItemPedido, ItemPedidoArquivado, Pagamento, PagamentoArquivado, Pedido,
+                        PedidoArquivado)
+
+STATUS_ARQUIVAVEIS = ('entregue', 'cancelado')
+
+
+def _ids_do_lote(limite_data, tamanho_lote):
+    maior_id = select(db.func.max(Pedido.id)).scalar_subquery()
+    return db.session.execute(
+        select(Pedido.id)
+        .where(Pedido.status.in_(STATUS_ARQUIVAVEIS),
+               Pedido.data_pedido < limite_data,
+               Pedido.id < maior_id)
+        .order_by(Pedido.id)
+        .limit(tamanho_lote)
+    ).scalars().all()
+
+
+def _mover_lote(ids):
+    """Copia os pedidos para o arquivo e os apaga das tabelas principais (uma transação)."""
+    agora = datetime.utcnow()
+    db.session.execute(insert(PedidoArquivado).from_select(
+        ['id', 'cliente_id', 'data_pedido', 'total', 'status', 'arquivado_em'],
+        select(Pedido.id, Pedido.cliente_id, Pedido.data_pedido, Pedido.total, Pedido.status, db.literal(agora))
+        # O status é conferido de novo: o lote foi lido fora desta transação
+        .where(Pedido.id.in_(ids), Pedido.status.in_(STATUS_ARQUIVAVEIS))
+    ))
+    movidos = select(PedidoArquivado.id).where(PedidoArquivado.id.in_(ids))
+    db.session.execute(insert(ItemPedidoArquivado).from_select(
+        ['pedido_id', 'produto_id', 'quantidade', 'preco_unitario'],
+        select(ItemPedido.pedido_id, ItemPedido.produto_id, ItemPedido.quantidade, ItemPedido.preco_unitario)
+        .where(ItemPedido.pedido_id.in_(movidos))
+        .order_by(ItemPedido.id)
+    ))
+    db.session.execute(insert(PagamentoArquivado).from_select(
+        ['pedido_id', 'metodo', 'status', 'data_pagamento'],
+        select(Pagamento.pedido_id, Pagamento.metodo, Pagamento.status, Pagamento.data_pagamento)
+        .where(Pagamento.pedido_id.in_(movidos))
+    ))
+    db.session.execute(delete(ItemPedido).where(ItemPedido.pedido_id.in_(movidos)))
+    db.session.execute(delete(Pagamento).where(Pagamento.pedido_id.in_(movidos)))
+    resultado = db.session.execute(delete(Pedido).where(Pedido.id.in_(movidos)))
+    db.session.commit()
+    return resultado.rowcount
+
+
+def arquivar_pedidos(dias=None, tamanho_lote=None, pausa=None, progresso=None):
+    """Move os pedidos arquiváveis em lotes; retorna quantos pedidos foram arquivados."""
+    config = current_app.config
+    dias = config['PEDIDOS_ARQUIVAR_APOS_DIAS'] if dias is None else dias
+    tamanho_lote = tamanho_lote or config['PEDIDOS_ARQUIVO_LOTE']
+    pausa = config['PEDIDOS_ARQUIVO_PAUSA'] if pausa is None else pausa
+    limite_data = datetime.utcnow() - timedelta(days=dias)
+
+    arquivados = 0
+    while True:
+        ids = _ids_do_lote(limite_data, tamanho_lote)
+        db.session.commit()  # encerra a leitura antes da transação de escrita
+        if not ids:
+            break
+        arquivados += _mover_lote(ids)
+        if progresso:
+            progresso(arquivados)
+        if len(ids) < tamanho_lote:
+            break
+        time.sleep(pausa)
+    return arquivados
+
+
+# ==================== COMANDOS (flask pedidos ...) ====================
+
+pedidos_cli = AppGroup('pedidos', help='Manutenção das tabelas de pedidos.')
+
+
+@pedidos_cli.command('arquivar')
+@click.option('--dias', type=int, default=None, help='Idade mínima do pedido (padrão: PEDIDOS_ARQUIVAR_APOS_DIAS).')
+@click.option('--lote', type=int, default=None, help='Pedidos por transação (padrão: PEDIDOS_ARQUIVO_LOTE).')
+@click.option('--pausa', type=float, default=None, help='Segundos entre lotes (padrão: PEDIDOS_ARQUIVO_PAUSA).')
+@with_appcontext
+def comando_arquivar(dias, lote, pausa):
+    """Move pedidos entregues/cancelados antigos para as tabelas de arquivo."""
+    inicio = time.perf_counter()
+    arquivados = arquivar_pedidos(dias, lote, pausa, progresso=lambda n: click.echo(f'{n} pedido(s) arquivado(s)', err=True))
+    click.echo(f'{arquivados} pedido(s) arquivado(s) em {time.perf_counter() - inicio:.1f}s.', err=True)
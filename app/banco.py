@@ -0,0 +1,98 @@
+"""
+Perfil de conexão do SQLite.
+
+Os PRAGMAs configurados (SQLITE_* em config.py) são aplicados em toda nova
+conexão do pool, já que a maioria deles (busy_timeout, synchronous,
+cache_size, mmap_size) vale só para a conexão que os executou. O
+journal_mode=WAL fica gravado no arquivo, mas é reaplicado por garantia.
+
+Com WAL, leitores não bloqueiam o escritor (e vice-versa), o que elimina a
+maior parte dos "database is locked" com vários workers do gunicorn; o
+busy_timeout faz o escritor esperar pelo lock em vez de falhar na hora.
+"""
+import logging
+
+from sqlalchemy import event
+
+from app import db
+
+logger = logging.getLogger('app.banco')
+
+MODOS_JOURNAL = ('DELETE', 'TRUNCATE', 'PERSIST', 'MEMORY', 'WAL', 'OFF')
+MODOS_SYNCHRONOUS = ('OFF', 'NORMAL', 'FULL', 'EXTRA')
+
+
+def pragmas_configurados(config):
+    """Monta a lista de PRAGMAs a partir da configuração (valores None são ignorados)."""
+    pragmas = []
+
+    journal_mode = config.get('SQLITE_JOURNAL_MODE')
+    if journal_mode:
+        journal_mode = journal_mode.upper()
+        if journal_mode not in MODOS_JOURNAL:
+            raise ValueError(f'SQLITE_JOURNAL_MODE inválido: {journal_mode}')
+        pragmas.append(f'PRAGMA journal_mode = {journal_mode}')
+
+    if config.get('SQLITE_BUSY_TIMEOUT_MS') is not None:
+        pragmas.append(f'PRAGMA busy_timeout = {int(config["SQLITE_BUSY_TIMEOUT_MS"])}')
+
+    synchronous = config.get('SQLITE_SYNCHRONOUS')
+    if synchronous:
+        synchronous = synchronous.upper()
+        if synchronous not in MODOS_SYNCHRONOUS:
+            raise ValueError(f'SQLITE_SYNCHRONOUS inválido: {synchronous}')
+        pragmas.append(f'PRAGMA synchronous = {synchronous}')
+
+    if config.get('SQLITE_CACHE_SIZE_KB') is not None:
+        # Valor negativo = tamanho em KiB (positivo seria em páginas)
+        pragmas.append(f'PRAGMA cache_size = -{int(config["SQLITE_CACHE_SIZE_KB"])}')
+
+    if config.get('SQLITE_MMAP_SIZE_MB') is not None:
+        pragmas.append(f'PRAGMA mmap_size = {int(config["SQLITE_MMAP_SIZE_MB"]) * 1024 * 1024}')
+
+    if config.get('SQLITE_TEMP_STORE_MEMORIA'):
+        pragmas.append('PRAGMA temp_store = MEMORY')
+
+    return pragmas
+
+
+def init_banco(app):
+    """Registra a aplicação dos PRAGMAs nas novas conexões dos engines do SQLite."""
+    pragmas = pragmas_configurados(app.config)
+    app.extensions['sqlite_pragmas'] = pragmas
+
+    with app.app_context():
+        engines = dict(db.engines)
+    for bind_key, engine in engines.items():
+        if bind_key == 'leitura':
+            # O bind de leitura pode ser somente leitura: o journal_mode é do arquivo (primário)
+            _registrar_pragmas(engine, [p for p in pragmas if not p.startswith('PRAGMA journal_mode')])
+        else:
+            _registrar_pragmas(engine, pragmas)
+
+    logger.debug('PRAGMAs do SQLite: %s', '; '.join(pragmas))
+
+
+def _registrar_pragmas(engine, pragmas):
+    if engine.dialect.name != 'sqlite' or not pragmas:
+        return
+
+    @event.listens_for(engine, 'connect')
+    def _aplicar_pragmas(conexao_dbapi, registro_conexao):
+        cursor = conexao_dbapi.cursor()
+        try:
+            for pragma in pragmas:
+                cursor.execute(pragma)
+        finally:
+            cursor.close()
+
+
+def descartar_conexoes_herdadas(app):
+    """
+    Chamado no worker logo após o fork (gunicorn --preload): o pool herdado
+    do master é substituído por um novo sem fechar as conexões, que ainda
+    pertencem ao processo pai.
+    """
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=False)
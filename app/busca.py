@@ -0,0 +1,159 @@
+"""
+Busca textual de produtos com um índice FTS5 do SQLite.
+
+A tabela virtual produtos_fts usa produtos como conteúdo externo (não duplica
+o texto) e é mantida em sincronia por triggers de INSERT, DELETE e UPDATE de
+nome/descricao; baixas de estoque não tocam o índice. Os resultados são
+ordenados por relevância (bm25, com peso maior para o nome) e cada termo
+digitado é buscado também como prefixo ("note" encontra "Notebook").
+
+Se o SQLite não tiver FTS5, a busca recorre a LIKE sobre nome e descrição.
+"""
+import logging
+import re
+
+from flask import current_app
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+from app import db
+from app.catalogo import produto_para_registro
+from app.models import Produto
+
+logger = logging.getLogger('app.busca')
+
+# Peso das colunas no bm25 (nome, descricao)
+PESO_NOME = 10.0
+PESO_DESCRICAO = 1.0
+
+DDL_FTS = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS produtos_fts USING fts5(
+        nome, descricao,
+        content='produtos', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2',
+        prefix='2 3'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS produtos_fts_ai AFTER INSERT ON produtos BEGIN
+        INSERT INTO produtos_fts (rowid, nome, descricao) VALUES (new.id, new.nome, new.descricao);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS produtos_fts_ad AFTER DELETE ON produtos BEGIN
+        INSERT INTO produtos_fts (produtos_fts, rowid, nome, descricao)
+        VALUES ('delete', old.id, old.nome, old.descricao);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS produtos_fts_au AFTER UPDATE OF nome, descricao ON produtos BEGIN
+        INSERT INTO produtos_fts (produtos_fts, rowid, nome, descricao)
+        VALUES ('delete', old.id, old.nome, old.descricao);
+        INSERT INTO produtos_fts (rowid, nome, descricao) VALUES (new.id, new.nome, new.descricao);
+    END
+    """,
+]
+
+
+class PaginaBusca:
+    """Página de resultados da busca (ordenados por relevância)."""
+
+    def __init__(self, termo, items, page, per_page, total):
+        self.termo = termo
+        self.items = items
+        self.page = page
+        self.per_page = per_page
+        self.total = total
+
+    @property
+    def has_prev(self):
+        return self.page > 1
+
+    @property
+    def has_next(self):
+        return self.page * self.per_page < self.total
+
+
+def garantir_indice_busca():
+    """
+    Cria a tabela FTS5 e os triggers se ainda não existirem; na criação o
+    índice é reconstruído a partir de produtos. Retorna False se o SQLite não
+    tiver suporte a FTS5.
+    """
+    try:
+        existe = db.session.execute(text(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'produtos_fts'"
+        )).first()
+        for ddl in DDL_FTS:
+            db.session.execute(text(ddl))
+        if not existe:
+            db.session.execute(text("INSERT INTO produtos_fts (produtos_fts) VALUES ('rebuild')"))
+        db.session.commit()
+        return True
+    except OperationalError as e:
+        db.session.rollback()
+        logger.warning('FTS5 indisponível, a busca usará LIKE: %s', e)
+        return False
+
+
+def reconstruir_indice_busca():
+    """Reconstrói o índice inteiro a partir de produtos (após cargas fora do ORM/triggers)."""
+    db.session.execute(text("INSERT INTO produtos_fts (produtos_fts) VALUES ('rebuild')"))
+    db.session.commit()
+
+
+def montar_consulta_fts(termo):
+    """
+    Converte o texto digitado em uma consulta FTS5 segura: cada palavra vira
+    um token entre aspas com busca por prefixo, combinados com AND.
+    """
+    palavras = re.findall(r'\w+', termo or '', flags=re.UNICODE)
+    if not palavras:
+        return None
+    return ' '.join(f'"{palavra}"*' for palavra in palavras)
+
+
+def _buscar_fts(consulta, page, per_page):
+    total = db.session.execute(
+        text('SELECT COUNT(*) FROM produtos_fts WHERE produtos_fts MATCH :consulta'),
+        {'consulta': consulta},
+    ).scalar()
+    ids = [produto_id for (produto_id,) in db.session.execute(
+        text(f"""
+            SELECT rowid FROM produtos_fts
+            WHERE produtos_fts MATCH :consulta
+            ORDER BY bm25(produtos_fts, {PESO_NOME}, {PESO_DESCRICAO})
+            LIMIT :limite OFFSET :deslocamento
+        """),
+        {'consulta': consulta, 'limite': per_page, 'deslocamento': (page - 1) * per_page},
+    )]
+    produtos = {p.id: p for p in Produto.query.filter(Produto.id.in_(ids))} if ids else {}
+    return [produtos[produto_id] for produto_id in ids if produto_id in produtos], total
+
+
+def _buscar_like(termo, page, per_page):
+    # % e _ digitados são literais, não curingas
+    padrao = '%' + termo.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+    consulta = Produto.query.filter(db.or_(Produto.nome.ilike(padrao, escape='\\'),
+                                           Produto.descricao.ilike(padrao, escape='\\')))
+    total = consulta.count()
+    produtos = consulta.order_by(Produto.id).limit(per_page).offset((page - 1) * per_page).all()
+    return produtos, total
+
+
+def buscar_produtos(termo, page=1, per_page=12):
+    """Busca produtos por nome/descrição, com ranking e paginação."""
+    termo = (termo or '').strip()
+    page = max(page, 1)
+    consulta = montar_consulta_fts(termo)
+    if consulta is None:
+        return PaginaBusca(termo, [], page, per_page, 0)
+
+    if current_app.extensions.get('busca_fts'):
+        produtos, total = _buscar_fts(consulta, page, per_page)
+    else:
+        produtos, total = _buscar_like(termo, page, per_page)
+
+    return PaginaBusca(termo, [produto_para_registro(p) for p in produtos], page, per_page, total)
+
@@ -0,0 +1,269 @@
+"""
+Cache do catálogo com limite de tamanho e expiração LRU/TTL.
+
+Dois backends estão disponíveis:
+
+* ``sqlite`` (padrão): um arquivo SQLite local em modo WAL, compartilhado por
+  todos os workers do gunicorn na mesma máquina;
+* ``memoria``: um dicionário ordenado por processo (útil em testes).
+
+Cada entrada pode ser marcada com *tags* (ex.: ``produto:3``), o que permite
+invalidar exatamente as entradas afetadas quando um produto muda.
+"""
+import logging
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger('app.cache')
+
+
+class CacheMemoria:
+    """Backend em memória (por processo) com LRU + TTL."""
+
+    def __init__(self, max_itens, ttl):
+        self.max_itens = max_itens
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entradas = OrderedDict()  # chave -> (expira, valor, tags)
+        self._tags = {}  # tag -> set(chaves)
+        self._contadores = {'hits': 0, 'misses': 0, 'invalidacoes': 0, 'remocoes_lru': 0}
+
+    def _remover(self, chave):
+        _, _, tags = self._entradas.pop(chave)
+        for tag in tags:
+            chaves = self._tags.get(tag)
+            if chaves:
+                chaves.discard(chave)
+                if not chaves:
+                    del self._tags[tag]
+
+    def get(self, chave):
+        with self._lock:
+            entrada = self._entradas.get(chave)
+            if entrada is None or entrada[0] < time.time():
+                if entrada is not None:
+                    self._remover(chave)
+                self._contadores['misses'] += 1
+                return None
+            self._entradas.move_to_end(chave)
+            self._contadores['hits'] += 1
+            return entrada[1]
+
+    def set(self, chave, valor, tags=()):
+        with self._lock:
+            if chave in self._entradas:
+                self._remover(chave)
+            self._entradas[chave] = (time.time() + self.ttl, valor, tuple(tags))
+            for tag in tags:
+                self._tags.setdefault(tag, set()).add(chave)
+            while len(self._entradas) > self.max_itens:
+                self._remover(next(iter(self._entradas)))
+                self._contadores['remocoes_lru'] += 1
+
+    def invalidar_tags(self, tags):
+        with self._lock:
+            removidas = 0
+            for tag in tags:
+                for chave in list(self._tags.get(tag, ())):
+                    self._remover(chave)
+                    removidas += 1
+            self._contadores['invalidacoes'] += removidas
+            return removidas
+
+    def limpar(self):
+        with self._lock:
+            self._entradas.clear()
+            self._tags.clear()
+
+    def estatisticas(self):
+        with self._lock:
+            return dict(self._contadores, entradas=len(self._entradas), max_itens=self.max_itens,
+                        ttl=self.ttl, backend='memoria')
+
+
+class CacheSQLite:
+    """
+    Backend SQLite compartilhado entre processos com LRU + TTL.
+    Cada thread/processo abre sua própria conexão (reaberta após fork).
+
+    Um hit só lê: o instante de acesso (ordem do LRU) é regravado no máximo a
+    cada ``intervalo_acesso`` segundos por entrada, e hits/misses são somados
+    em memória no processo e gravados na tabela contadores a cada
+    ``intervalo_acesso`` segundos (ou junto com a próxima escrita).
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS entradas (
+            chave TEXT PRIMARY KEY,
+            valor BLOB NOT NULL,
+            expira REAL NOT NULL,
+            acesso REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS ix_entradas_acesso ON entradas (acesso);
+        CREATE TABLE IF NOT EXISTS tags (
+            tag TEXT NOT NULL,
+            chave TEXT NOT NULL,
+            PRIMARY KEY (tag, chave)
+        ) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS ix_tags_chave ON tags (chave);
+        CREATE TABLE IF NOT EXISTS contadores (
+            nome TEXT PRIMARY KEY,
+            valor INTEGER NOT NULL DEFAULT 0
+        );
+    """
+
+    def __init__(self, caminho, max_itens, ttl, intervalo_acesso=30):
+        self.caminho = caminho
+        self.max_itens = max_itens
+        self.ttl = ttl
+        self.intervalo_acesso = intervalo_acesso
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._pendentes = {}  # contadores ainda não gravados neste processo
+        self._pendentes_pid = os.getpid()
+        self._gravado_em = time.time()
+        with self._conexao() as conn:
+            conn.executescript(self.SCHEMA)
+
+    def _conexao(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.caminho, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    @staticmethod
+    def _incrementar(conn, nome, n=1):
+        conn.execute(
+            'INSERT INTO contadores (nome, valor) VALUES (?, ?) '
+            'ON CONFLICT(nome) DO UPDATE SET valor = valor + excluded.valor',
+            (nome, n),
+        )
+
+    @staticmethod
+    def _remover_chaves(conn, chaves):
+        conn.executemany('DELETE FROM entradas WHERE chave = ?', [(c,) for c in chaves])
+        conn.executemany('DELETE FROM tags WHERE chave = ?', [(c,) for c in chaves])
+
+    def _contar(self, nome, n=1):
+        with self._lock:
+            if self._pendentes_pid != os.getpid():
+                # Contagens herdadas do processo pai no fork já são dele
+                self._pendentes, self._pendentes_pid = {}, os.getpid()
+            self._pendentes[nome] = self._pendentes.get(nome, 0) + n
+
+    def _gravar_contadores(self, conn, forcar=False):
+        """Grava os contadores pendentes deste processo (deve rodar dentro de uma transação)."""
+        with self._lock:
+            if self._pendentes_pid != os.getpid():
+                self._pendentes, self._pendentes_pid = {}, os.getpid()
+            if not self._pendentes or not (forcar or time.time() - self._gravado_em >= self.intervalo_acesso):
+                return
+            pendentes, self._pendentes = self._pendentes, {}
+            self._gravado_em = time.time()
+        for nome, n in pendentes.items():
+            self._incrementar(conn, nome, n)
+
+    def get(self, chave):
+        try:
+            conn = self._conexao()
+            agora = time.time()
+            linha = conn.execute('SELECT valor, expira, acesso FROM entradas WHERE chave = ?', (chave,)).fetchone()
+            if linha is None or linha[1] < agora:
+                self._contar('misses')
+                if linha is not None:
+                    with conn:
+                        self._remover_chaves(conn, [chave])
+                        self._gravar_contadores(conn)
+                return None
+            self._contar('hits')
+            if agora - linha[2] >= self.intervalo_acesso:
+                with conn:
+                    conn.execute('UPDATE entradas SET acesso = ? WHERE chave = ?', (agora, chave))
+                    self._gravar_contadores(conn)
+            return pickle.loads(linha[0])
+        except sqlite3.Error as e:
+            logger.warning('Falha ao ler o cache do catálogo: %s', e)
+            return None
+
+    def set(self, chave, valor, tags=()):
+        try:
+            conn = self._conexao()
+            agora = time.time()
+            with conn:
+                conn.execute(
+                    'INSERT OR REPLACE INTO entradas (chave, valor, expira, acesso) VALUES (?, ?, ?, ?)',
+                    (chave, pickle.dumps(valor, pickle.HIGHEST_PROTOCOL), agora + self.ttl, agora),
+                )
+                conn.execute('DELETE FROM tags WHERE chave = ?', (chave,))
+                conn.executemany('INSERT OR IGNORE INTO tags (tag, chave) VALUES (?, ?)',
+                                 [(tag, chave) for tag in tags])
+                excesso = conn.execute('SELECT COUNT(*) FROM entradas').fetchone()[0] - self.max_itens
+                if excesso > 0:
+                    antigas = [c for (c,) in conn.execute(
+                        'SELECT chave FROM entradas ORDER BY acesso LIMIT ?', (excesso,))]
+                    self._remover_chaves(conn, antigas)
+                    self._incrementar(conn, 'remocoes_lru', len(antigas))
+                self._gravar_contadores(conn)
+        except sqlite3.Error as e:
+            logger.warning('Falha ao gravar no cache do catálogo: %s', e)
+
+    def invalidar_tags(self, tags):
+        tags = list(tags)
+        if not tags:
+            return 0
+        try:
+            conn = self._conexao()
+            marcadores = ','.join('?' * len(tags))
+            with conn:
+                chaves = [c for (c,) in conn.execute(
+                    f'SELECT DISTINCT chave FROM tags WHERE tag IN ({marcadores})', tags)]
+                self._remover_chaves(conn, chaves)
+                self._incrementar(conn, 'invalidacoes', len(chaves))
+                self._gravar_contadores(conn)
+            return len(chaves)
+        except sqlite3.Error as e:
+            logger.warning('Falha ao invalidar o cache do catálogo: %s', e)
+            return 0
+
+    def limpar(self):
+        conn = self._conexao()
+        with conn:
+            conn.execute('DELETE FROM entradas')
+            conn.execute('DELETE FROM tags')
+
+    def estatisticas(self):
+        conn = self._conexao()
+        with conn:
+            self._gravar_contadores(conn, forcar=True)
+        contadores = {'hits': 0, 'misses': 0, 'invalidacoes': 0, 'remocoes_lru': 0}
+        contadores.update(dict(conn.execute('SELECT nome, valor FROM contadores')))
+        entradas = conn.execute('SELECT COUNT(*) FROM entradas').fetchone()[0]
+        return dict(contadores, entradas=entradas, max_itens=self.max_itens, ttl=self.ttl, backend='sqlite')
+
+
+def init_cache_catalogo(app):
+    """Cria o backend configurado e o registra em app.extensions['cache_catalogo']."""
+    if not app.config.get('CACHE_CATALOGO_ATIVO'):
+        app.extensions['cache_catalogo'] = None
+        return None
+
+    max_itens = app.config['CACHE_CATALOGO_MAX_ITENS']
+    ttl = app.config['CACHE_CATALOGO_TTL']
+
+    if app.config['CACHE_CATALOGO_BACKEND'] == 'memoria':
+        cache = CacheMemoria(max_itens, ttl)
+    else:
+        caminho = app.config.get('CACHE_CATALOGO_ARQUIVO') or os.path.join(app.instance_path, 'cache_catalogo.db')
+        os.makedirs(os.path.dirname(caminho), exist_ok=True)
+        cache = CacheSQLite(caminho, max_itens, ttl, app.config['CACHE_CATALOGO_ACESSO_INTERVALO'])
+
+    app.extensions['cache_catalogo'] = cache
+    return cache
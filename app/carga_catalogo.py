@@ -0,0 +1,229 @@
+"""
+Importação e exportação do catálogo em CSV/JSONL (flask catalogo ...).
+
+A importação lê o arquivo em streaming e grava em lotes: cada lote é um
+único executemany de INSERT ... ON CONFLICT(sku) DO UPDATE em sua própria
+transação, então a memória usada não depende do tamanho do arquivo. Linhas
+cujo conteúdo não mudou não são reescritas (nem disparam os triggers do
+índice de busca). A exportação percorre produtos com um cursor do servidor
+(yield_per), também em memória constante.
+
+Colunas: sku, nome, descricao, preco, estoque. O SKU é a chave estável do
+produto entre sistemas e é obrigatório na importação; colunas ausentes no
+arquivo são gravadas como vazias (descricao) ou zero (estoque).
+"""
+import csv
+import json
+import math
+import time
+
+import click
+from flask.cli import AppGroup, with_appcontext
+from sqlalchemy import inspect, or_, select, text
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import SQLAlchemyError
+
+from app import db
+from app.catalogo import get_cache
+from app.models import Produto
+
+COLUNAS = ('sku', 'nome', 'descricao', 'preco', 'estoque')
+
+
+class LinhaInvalida(ValueError):
+    pass
+
+
+def garantir_sku_produtos():
+    """Adiciona a coluna sku (e seu índice único) em bancos criados antes dela."""
+    colunas = {coluna['name'] for coluna in inspect(db.engine).get_columns(Produto.__tablename__)}
+    if 'sku' in colunas:
+        return
+    with db.engine.begin() as conn:
+        conn.execute(text('ALTER TABLE produtos ADD COLUMN sku VARCHAR(64)'))
+        conn.execute(text('CREATE UNIQUE INDEX IF NOT EXISTS ix_produtos_sku ON produtos (sku)'))
+
+
+def _texto(valor):
+    """Texto sem espaços nas pontas; no JSONL os campos podem vir como números."""
+    return '' if valor is None else str(valor).strip()
+
+
+def normalizar_linha(registro):
+    """Valida e converte um registro lido do arquivo para os tipos de Produto."""
+    sku = _texto(registro.get('sku'))
+    nome = _texto(registro.get('nome'))
+    if not sku:
+        raise LinhaInvalida('sku ausente')
+    if not nome:
+        raise LinhaInvalida('nome ausente')
+    try:
+        preco = float(registro.get('preco'))
+        estoque = int(registro.get('estoque') or 0)
+    except (TypeError, ValueError, OverflowError):
+        raise LinhaInvalida('preco/estoque inválido')
+    if not math.isfinite(preco):
+        raise LinhaInvalida('preco não finito')
+    if preco < 0 or estoque < 0:
+        raise LinhaInvalida('preco/estoque negativo')
+    return {
+        'sku': sku[:64],
+        'nome': nome[:120],
+        'descricao': _texto(registro.get('descricao')) or None,
+        'preco': preco,
+        'estoque': estoque,
+    }
+
+
+def _instrucao_upsert():
+    novo = sqlite_insert(Produto)
+    atualizar = {coluna: novo.excluded[coluna] for coluna in COLUNAS if coluna != 'sku'}
+    return novo.on_conflict_do_update(
+        index_elements=[Produto.sku],
+        set_=atualizar,
+        # Só reescreve a linha se algo mudou (IS NOT compara NULLs corretamente)
+        where=or_(*[getattr(Produto, coluna).is_not(valor) for coluna, valor in atualizar.items()]),
+    )
+
+
+def _ler_registros(arquivo, formato):
+    """Gera (numero_da_linha, registro) sem carregar o arquivo inteiro."""
+    if formato == 'csv':
+        leitor = csv.DictReader(arquivo)
+        for registro in leitor:
+            yield leitor.line_num, registro
+    else:
+        for numero, linha in enumerate(arquivo, start=1):
+            if linha.strip():
+                try:
+                    yield numero, json.loads(linha)
+                except ValueError:
+                    yield numero, None
+
+
+def importar_produtos(arquivo, formato, tamanho_lote=5000, progresso=None):
+    """
+    Importa produtos por upsert em lotes (uma transação por lote).
+    Retorna (linhas_gravadas, erros), onde erros é uma lista de (linha, motivo).
+    """
+    instrucao = _instrucao_upsert()
+    gravadas = 0
+    erros = []
+    lote = []
+
+    def gravar(lote):
+        try:
+            db.session.execute(instrucao, lote)
+            db.session.commit()
+        except SQLAlchemyError:
+            # Os lotes anteriores já foram confirmados; este é desfeito inteiro
+            db.session.rollback()
+            raise
+
+    for numero, registro in _ler_registros(arquivo, formato):
+        try:
+            if not isinstance(registro, dict):
+                raise LinhaInvalida('JSON inválido')
+            lote.append(normalizar_linha(registro))
+        except LinhaInvalida as e:
+            erros.append((numero, str(e)))
+            continue
+
+        if len(lote) >= tamanho_lote:
+            gravar(lote)
+            gravadas += len(lote)
+            lote = []
+            if progresso:
+                progresso(gravadas)
+
+    if lote:
+        gravar(lote)
+        gravadas += len(lote)
+        if progresso:
+            progresso(gravadas)
+
+    # Cargas em massa não passam pelos eventos do ORM: descarta o cache do catálogo
+    cache = get_cache()
+    if cache is not None and gravadas:
+        cache.limpar()
+    return gravadas, erros
+
+
+def exportar_produtos(arquivo, formato, tamanho_lote=5000):
+    """Escreve todos os produtos no arquivo em streaming; retorna quantos foram exportados."""
+    consulta = (select(*[getattr(Produto, coluna) for coluna in COLUNAS])
+                .order_by(Produto.id)
+                .execution_options(yield_per=tamanho_lote))
+    escritor = csv.writer(arquivo) if formato == 'csv' else None
+    if escritor:
+        escritor.writerow(COLUNAS)
+
+    exportados = 0
+    for linha in db.session.execute(consulta):
+        if escritor:
+            escritor.writerow(linha)
+        else:
+            arquivo.write(json.dumps(dict(zip(COLUNAS, linha)), ensure_ascii=False) + '\n')
+        exportados += 1
+    return exportados
+
+
+def _abrir(caminho, modo):
+    if caminho == '-':
+        return click.open_file(caminho, modo)  # stdin/stdout (não são fechados ao sair)
+    return open(caminho, modo, encoding='utf-8', newline='')
+
+
+def _formato(caminho, formato):
+    if formato:
+        return formato
+    return 'jsonl' if caminho.endswith(('.jsonl', '.ndjson')) else 'csv'
+
+
+# ==================== COMANDOS (flask catalogo ...) ====================
+
+catalogo_cli = AppGroup('catalogo', help='Importação e exportação do catálogo de produtos.')
+
+
+@catalogo_cli.command('importar')
+@click.argument('caminho', type=click.Path(allow_dash=True))
+@click.option('--formato', type=click.Choice(['csv', 'jsonl']), default=None,
+              help='Padrão: pela extensão do arquivo (csv).')
+@click.option('--lote', type=int, default=5000, show_default=True, help='Linhas por transação.')
+@with_appcontext
+def comando_importar(caminho, formato, lote):
+    """Importa produtos de CAMINHO ('-' para stdin), com upsert pelo SKU."""
+    formato = _formato(caminho, formato)
+    inicio = time.perf_counter()
+
+    def progresso(gravadas):
+        decorrido = time.perf_counter() - inicio
+        click.echo(f'{gravadas} linhas ({gravadas / decorrido:.0f} linhas/s)', err=True)
+
+    with _abrir(caminho, 'r') as arquivo:
+        gravadas, erros = importar_produtos(arquivo, formato, lote, progresso)
+
+    decorrido = time.perf_counter() - inicio
+    for numero, motivo in erros[:20]:
+        click.echo(f'linha {numero}: {motivo}', err=True)
+    if len(erros) > 20:
+        click.echo(f'... e mais {len(erros) - 20} erro(s)', err=True)
+    click.echo(f'{gravadas} linha(s) importada(s), {len(erros)} ignorada(s) em {decorrido:.1f}s '
+               f'({gravadas / decorrido if decorrido else 0:.0f} linhas/s).', err=True)
+
+
+@catalogo_cli.command('exportar')
+@click.argument('caminho', type=click.Path(allow_dash=True), default='-')
+@click.option('--formato', type=click.Choice(['csv', 'jsonl']), default=None,
+              help='Padrão: pela extensão do arquivo (csv).')
+@click.option('--lote', type=int, default=5000, show_default=True, help='Linhas buscadas por vez.')
+@with_appcontext
+def comando_exportar(caminho, formato, lote):
+    """Exporta os produtos para CAMINHO ('-' para stdout)."""
+    formato = _formato(caminho, formato)
+    inicio = time.perf_counter()
+    with _abrir(caminho, 'w') as arquivo:
+        exportados = exportar_produtos(arquivo, formato, lote)
+    decorrido = time.perf_counter() - inicio
+    click.echo(f'{exportados} produto(s) exportado(s) em {decorrido:.1f}s '
+               f'({exportados / decorrido if decorrido else 0:.0f} linhas/s).', err=True)
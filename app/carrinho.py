@@ -1,112 +1,315 @@
-from flask import session, flash
+import uuid
+from datetime import datetime
+
+from flask import session, flash, current_app
 from app import db
+from app import carrinho_anonimo
 from app.models import Produto, CarrinhoCompras
+from sqlalchemy import case, delete, inspect, literal, select, text
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import joinedload
 
 def get_session_id():
-    """Retorna o ID da sessão para usuários não logados."""
+    """Retorna o ID da sessão para usuários não logados (gerado localmente, sem ir ao banco)."""
     if 'session_id' not in session:
-        # Gera um ID de sessão simples, pode ser melhorado para um UUID
-        session['session_id'] = db.session.query(db.func.uuid_v4()).scalar()
+        session['session_id'] = uuid.uuid4().hex
     return session['session_id']
 
-def get_carrinho_itens(cliente_id=None):
+def _carrinho_anonimo_no_banco():
+    """Indica se carrinhos de visitantes ainda são gravados em carrinho_compras."""
+    return carrinho_anonimo.backend() == 'banco'
+
+def _filtro_carrinho(cliente_id=None):
     """
-    Retorna os itens do carrinho.
-    Prioriza o cliente_id se logado, senão usa o session_id.
+    Retorna o critério de filtro do carrinho atual em carrinho_compras.
+    Prioriza o cliente_id se logado, senão usa o session_id
+    (apenas quando o carrinho anônimo é guardado no banco).
     """
     if cliente_id:
-        return CarrinhoCompras.query.filter_by(cliente_id=cliente_id).all()
-    
+        return CarrinhoCompras.cliente_id == cliente_id
+
     session_id = session.get('session_id')
-    if session_id:
-        return CarrinhoCompras.query.filter_by(sessao_id=session_id).all()
-        
-    return []
+    if session_id and _carrinho_anonimo_no_banco():
+        return CarrinhoCompras.sessao_id == session_id
 
-def adicionar_ao_carrinho(produto_id, quantidade=1):
-    """Adiciona um produto ao carrinho."""
-    produto = Produto.query.get(produto_id)
-    if not produto:
-        flash('Produto não encontrado.', 'danger')
-        return False
+    return None
 
-    if produto.estoque < quantidade:
-        flash(f'Estoque insuficiente para {produto.nome}. Disponível: {produto.estoque}', 'danger')
-        return False
+def _upsert_carrinho(insercao, chave):
+    """
+    Completa um INSERT em carrinho_compras com ON CONFLICT na chave única
+    (cliente_id, produto_id) ou (sessao_id, produto_id), somando as quantidades.
+    """
+    return insercao.on_conflict_do_update(
+        index_elements=[chave, 'produto_id'],
+        set_={
+            'quantidade': CarrinhoCompras.quantidade + insercao.excluded.quantidade,
+            'data_adicao': insercao.excluded.data_adicao,
+        },
+    )
 
-    cliente_id = session.get('cliente_id')
-    sessao_id = get_session_id() if not cliente_id else None
+def get_carrinho_itens(cliente_id=None):
+    """
+    Retorna os itens do carrinho com o produto já carregado (uma única consulta).
+    Prioriza o cliente_id se logado, senão usa o session_id.
+    """
+    if not cliente_id and not _carrinho_anonimo_no_banco():
+        itens = carrinho_anonimo.get_itens()
+        if not itens:
+            return []
+        produtos = {p.id: p for p in Produto.query.filter(Produto.id.in_(list(itens)))}
+        return [carrinho_anonimo.ItemCarrinhoAnonimo(produto_id, produto_id, produtos[produto_id], quantidade)
+                for produto_id, quantidade in itens.items() if produto_id in produtos]
 
-    # Tenta encontrar o item no carrinho
-    if cliente_id:
-        item_carrinho = CarrinhoCompras.query.filter_by(cliente_id=cliente_id, produto_id=produto_id).first()
-    else:
-        item_carrinho = CarrinhoCompras.query.filter_by(sessao_id=sessao_id, produto_id=produto_id).first()
+    filtro = _filtro_carrinho(cliente_id)
+    if filtro is None:
+        return []
 
-    try:
-        if item_carrinho:
-            # Se o item já existe, apenas atualiza a quantidade
-            item_carrinho.quantidade += quantidade
+    return (CarrinhoCompras.query
+            .options(joinedload(CarrinhoCompras.produto))
+            .filter(filtro)
+            .order_by(CarrinhoCompras.id)
+            .all())
+
+class OperacaoCarrinhoInvalida(ValueError):
+    """Operação de carrinho recusada; nenhuma operação do lote foi aplicada."""
+    pass
+
+class EstoqueInsuficiente(OperacaoCarrinhoInvalida):
+    pass
+
+OPERACOES_CARRINHO = ('adicionar', 'definir', 'remover')
+
+def _inteiro(valor):
+    return isinstance(valor, int) and not isinstance(valor, bool)
+
+def _reduzir_operacoes(operacoes):
+    """
+    Valida as operações e as reduz a um efeito por produto, na ordem recebida:
+    {produto_id: ('somar' | 'definir', quantidade)}; remover é definir 0.
+    """
+    if not isinstance(operacoes, list) or not operacoes:
+        raise OperacaoCarrinhoInvalida('Informe uma lista de operações.')
+    if len(operacoes) > current_app.config['CARRINHO_MAX_OPERACOES']:
+        raise OperacaoCarrinhoInvalida(
+            f'Máximo de {current_app.config["CARRINHO_MAX_OPERACOES"]} operações por requisição.')
+
+    def invalida(posicao, mensagem):
+        # A posição só interessa quando o lote tem mais de uma operação
+        prefixo = f'Operação {posicao}: ' if len(operacoes) > 1 else ''
+        return OperacaoCarrinhoInvalida(prefixo + mensagem)
+
+    efeitos = {}
+    for posicao, operacao in enumerate(operacoes, 1):
+        if not isinstance(operacao, dict) or operacao.get('op') not in OPERACOES_CARRINHO:
+            raise invalida(posicao, f'"op" deve ser {", ".join(OPERACOES_CARRINHO)}.')
+        op, produto_id = operacao['op'], operacao.get('produto_id')
+        quantidade = 0 if op == 'remover' else operacao.get('quantidade', 1 if op == 'adicionar' else None)
+        if not _inteiro(produto_id) or not _inteiro(quantidade):
+            raise invalida(posicao, 'produto_id e quantidade devem ser inteiros.')
+        if quantidade < 0 or (op == 'adicionar' and quantidade == 0):
+            raise invalida(posicao, 'Quantidade inválida.')
+
+        if op == 'adicionar':
+            tipo, atual = efeitos.get(produto_id, ('somar', 0))
+            efeitos[produto_id] = (tipo, atual + quantidade)
         else:
-            # Se o item não existe, cria um novo
-            item_carrinho = CarrinhoCompras(
-                cliente_id=cliente_id,
-                produto_id=produto_id,
-                quantidade=quantidade,
-                sessao_id=sessao_id
-            )
-            db.session.add(item_carrinho)
-        
+            efeitos[produto_id] = ('definir', quantidade)
+    return efeitos
+
+def _conferir_estoque(produtos, quantidades):
+    """Levanta EstoqueInsuficiente se alguma quantidade final passa do estoque (0 = removido)."""
+    for produto_id, quantidade in quantidades.items():
+        produto = produtos.get(produto_id)
+        if quantidade and quantidade > produto.estoque:
+            raise EstoqueInsuficiente(f'Estoque insuficiente para {produto.nome}. Disponível: {produto.estoque}')
+
+def _aplicar_no_carrinho_anonimo(efeitos, produtos):
+    """Aplica os efeitos ao carrinho em cookie/memória; retorna {produto_id: nova quantidade} dos alterados."""
+    itens = carrinho_anonimo.get_itens()
+    alteradas = {}
+    for produto_id, (tipo, quantidade) in efeitos.items():
+        atual = itens.get(produto_id, 0)
+        nova = atual + quantidade if tipo == 'somar' else quantidade
+        if nova != atual:
+            alteradas[produto_id] = nova
+
+    _conferir_estoque(produtos, alteradas)
+    novos = sum(1 for produto_id, nova in alteradas.items() if nova and produto_id not in itens)
+    if novos and len(itens) + novos > current_app.config['CARRINHO_ANONIMO_MAX_ITENS']:
+        raise OperacaoCarrinhoInvalida('Seu carrinho atingiu o limite de itens. Faça login para continuar adicionando.')
+
+    for produto_id, nova in alteradas.items():
+        if nova:
+            itens[produto_id] = nova
+        else:
+            itens.pop(produto_id, None)
+    carrinho_anonimo.salvar_itens(itens)
+    return alteradas
+
+def _aplicar_no_banco(efeitos, produtos, cliente_id):
+    """
+    Aplica os efeitos em carrinho_compras em uma transação, com no máximo
+    três comandos (upsert somando, upsert definindo e DELETE), todos com
+    RETURNING; retorna {produto_id: nova quantidade} das linhas alteradas.
+    """
+    chave = 'cliente_id' if cliente_id else 'sessao_id'
+    dono = cliente_id or get_session_id()
+    agora = datetime.utcnow()
+
+    def linhas(tipo):
+        return [{chave: dono, 'produto_id': produto_id, 'quantidade': quantidade, 'data_adicao': agora}
+                for produto_id, (tipo_efeito, quantidade) in efeitos.items()
+                if tipo_efeito == tipo and quantidade > 0]
+
+    alteradas = {}
+    try:
+        somar, definir = linhas('somar'), linhas('definir')
+        if somar:
+            insercao = sqlite_insert(CarrinhoCompras).values(somar)
+            alteradas.update(db.session.execute(
+                _upsert_carrinho(insercao, chave).returning(CarrinhoCompras.produto_id, CarrinhoCompras.quantidade)
+            ).all())
+        if definir:
+            insercao = sqlite_insert(CarrinhoCompras).values(definir)
+            alteradas.update(db.session.execute(
+                insercao.on_conflict_do_update(
+                    index_elements=[chave, 'produto_id'],
+                    set_={'quantidade': insercao.excluded.quantidade, 'data_adicao': insercao.excluded.data_adicao},
+                ).returning(CarrinhoCompras.produto_id, CarrinhoCompras.quantidade)
+            ).all())
+        remover = [produto_id for produto_id, (tipo, quantidade) in efeitos.items() if tipo == 'definir' and not quantidade]
+        if remover:
+            removidas = db.session.execute(
+                delete(CarrinhoCompras)
+                .where(getattr(CarrinhoCompras, chave) == dono, CarrinhoCompras.produto_id.in_(remover))
+                .returning(CarrinhoCompras.produto_id)
+            ).scalars().all()
+            alteradas.update(dict.fromkeys(removidas, 0))
+
+        # Conferido depois da escrita: a quantidade final já inclui o que estava no carrinho
+        _conferir_estoque(produtos, alteradas)
         db.session.commit()
-        flash(f'{quantidade}x {produto.nome} adicionado(s) ao carrinho.', 'success')
-        return True
-    except SQLAlchemyError as e:
+    except (SQLAlchemyError, OperacaoCarrinhoInvalida):
         db.session.rollback()
-        flash(f'Erro ao adicionar ao carrinho: {str(e)}', 'danger')
+        raise
+    return alteradas
+
+def aplicar_operacoes(operacoes, cliente_id=None):
+    """
+    Aplica um lote de operações ao carrinho atual, tudo ou nada:
+
+        {"op": "adicionar", "produto_id": 3, "quantidade": 2}   soma à quantidade
+        {"op": "definir", "produto_id": 3, "quantidade": 5}     substitui (0 remove)
+        {"op": "remover", "produto_id": 3}
+
+    Retorna (linhas alteradas, total do carrinho); cada linha tem produto_id,
+    nome, preco, quantidade (0 se removida) e subtotal. Levanta
+    OperacaoCarrinhoInvalida/EstoqueInsuficiente (nada é aplicado) ou
+    SQLAlchemyError.
+    """
+    efeitos = _reduzir_operacoes(operacoes)
+    produtos = {produto.id: produto for produto in db.session.execute(
+        select(Produto.id, Produto.nome, Produto.preco, Produto.estoque).where(Produto.id.in_(list(efeitos)))
+    )}
+    # Remover um produto que não existe mais é permitido (não altera nada)
+    if any(produto_id not in produtos for produto_id, efeito in efeitos.items() if efeito != ('definir', 0)):
+        raise OperacaoCarrinhoInvalida('Produto não encontrado.')
+
+    if not cliente_id and not _carrinho_anonimo_no_banco():
+        alteradas = _aplicar_no_carrinho_anonimo(efeitos, produtos)
+    else:
+        alteradas = _aplicar_no_banco(efeitos, produtos, cliente_id)
+
+    linhas = []
+    for produto_id, quantidade in alteradas.items():
+        produto = produtos.get(produto_id)
+        preco = produto.preco if produto else None
+        linhas.append({'produto_id': produto_id, 'nome': produto.nome if produto else None, 'preco': preco,
+                       'quantidade': quantidade, 'subtotal': preco * quantidade if produto else 0.0})
+    return linhas, calcular_total_carrinho(cliente_id)
+
+def _aplicar_com_flash(operacoes, acao):
+    """Versão das rotas HTML: aplica as operações e informa erros com flash; retorna as linhas ou None."""
+    try:
+        linhas, _ = aplicar_operacoes(operacoes, session.get('cliente_id'))
+        return linhas
+    except OperacaoCarrinhoInvalida as e:
+        flash(str(e), 'danger')
+    except SQLAlchemyError as e:
+        flash(f'Erro ao {acao}: {str(e)}', 'danger')
+    return None
+
+def adicionar_ao_carrinho(produto_id, quantidade=1):
+    """Adiciona um produto ao carrinho."""
+    linhas = _aplicar_com_flash([{'op': 'adicionar', 'produto_id': produto_id, 'quantidade': quantidade}],
+                                'adicionar ao carrinho')
+    if linhas is None:
+        return False
+    flash(f'{quantidade}x {linhas[0]["nome"]} adicionado(s) ao carrinho.', 'success')
+    return True
+
+def atualizar_quantidade_carrinho(produto_id, quantidade):
+    """Define a quantidade de um produto no carrinho (0 remove)."""
+    linhas = _aplicar_com_flash([{'op': 'definir', 'produto_id': produto_id, 'quantidade': quantidade}],
+                                'atualizar o carrinho')
+    if linhas is None:
         return False
+    if linhas:
+        flash('Carrinho atualizado.', 'info')
+    return True
 
-def remover_do_carrinho(item_carrinho_id):
-    """Remove um item específico do carrinho."""
-    item = CarrinhoCompras.query.get(item_carrinho_id)
-    if not item:
+def remover_do_carrinho(produto_id):
+    """Remove um produto do carrinho."""
+    linhas = _aplicar_com_flash([{'op': 'remover', 'produto_id': produto_id}], 'remover do carrinho')
+    if linhas is None:
+        return False
+    if not linhas:
         flash('Item do carrinho não encontrado.', 'danger')
         return False
+    flash('Item removido do carrinho.', 'info')
+    return True
 
-    # Verifica se o item pertence ao usuário logado ou à sessão
-    cliente_id = session.get('cliente_id')
-    sessao_id = session.get('session_id')
+def calcular_total_carrinho(cliente_id=None):
+    """Calcula o valor total do carrinho diretamente no banco (SUM com JOIN)."""
+    if not cliente_id and not _carrinho_anonimo_no_banco():
+        itens = carrinho_anonimo.get_itens()
+        if not itens:
+            return 0.0
+        total = (db.session.query(db.func.sum(Produto.preco * case(itens, value=Produto.id)))
+                 .filter(Produto.id.in_(list(itens)))
+                 .scalar())
+        return total or 0.0
 
-    if (cliente_id and item.cliente_id == cliente_id) or (not cliente_id and item.sessao_id == sessao_id):
-        try:
-            db.session.delete(item)
-            db.session.commit()
-            flash('Item removido do carrinho.', 'info')
-            return True
-        except SQLAlchemyError as e:
-            db.session.rollback()
-            flash(f'Erro ao remover do carrinho: {str(e)}', 'danger')
-            return False
-    else:
-        flash('Acesso negado ao item do carrinho.', 'danger')
-        return False
+    filtro = _filtro_carrinho(cliente_id)
+    if filtro is None:
+        return 0.0
 
-def calcular_total_carrinho(itens_carrinho):
-    """Calcula o valor total do carrinho."""
-    total = 0.0
-    for item in itens_carrinho:
-        total += item.produto.preco * item.quantidade
-    return total
+    total = (db.session.query(db.func.sum(Produto.preco * CarrinhoCompras.quantidade))
+             .select_from(CarrinhoCompras)
+             .join(Produto, CarrinhoCompras.produto_id == Produto.id)
+             .filter(filtro)
+             .scalar())
+    return total or 0.0
 
-def limpar_carrinho(cliente_id=None):
-    """Limpa o carrinho após a finalização do pedido."""
+def limpar_carrinho(cliente_id=None, commit=True):
+    """
+    Limpa o carrinho após a finalização do pedido.
+    Com commit=False a exclusão fica na transação corrente (usado no checkout).
+    """
     if cliente_id:
         CarrinhoCompras.query.filter_by(cliente_id=cliente_id).delete()
+    elif not _carrinho_anonimo_no_banco():
+        carrinho_anonimo.limpar()
+        return True
     else:
         session_id = session.get('session_id')
         if session_id:
             CarrinhoCompras.query.filter_by(sessao_id=session_id).delete()
     
+    if not commit:
+        return True
+
     try:
         db.session.commit()
         return True
@@ -116,25 +319,84 @@ def limpar_carrinho(cliente_id=None):
 
 def migrar_carrinho_sessao_para_cliente(cliente_id):
     """Migra itens do carrinho de sessão para o cliente logado."""
+    if not _carrinho_anonimo_no_banco():
+        return _persistir_carrinho_anonimo(cliente_id)
+
     sessao_id = session.get('session_id')
-    if sessao_id:
-        itens_sessao = CarrinhoCompras.query.filter_by(sessao_id=sessao_id).all()
-        for item in itens_sessao:
-            # Verifica se o produto já está no carrinho do cliente
-            item_existente = CarrinhoCompras.query.filter_by(cliente_id=cliente_id, produto_id=item.produto_id).first()
-            if item_existente:
-                item_existente.quantidade += item.quantidade
-                db.session.delete(item) # Remove o item duplicado da sessão
-            else:
-                item.cliente_id = cliente_id
-                item.sessao_id = None
-        
-        try:
-            db.session.commit()
-            # O session_id pode ser mantido para o caso de logout, mas o carrinho agora é do cliente
-            # session.pop('session_id', None)
-            return True
-        except SQLAlchemyError:
-            db.session.rollback()
-            return False
-    return False
+    if not sessao_id:
+        return False
+
+    # Mescla todo o carrinho da sessão com dois comandos, independente do tamanho:
+    # INSERT ... SELECT com ON CONFLICT somando quantidades e DELETE das linhas da sessão
+    insercao = sqlite_insert(CarrinhoCompras).from_select(
+        ['cliente_id', 'produto_id', 'quantidade', 'data_adicao'],
+        select(literal(cliente_id), CarrinhoCompras.produto_id, CarrinhoCompras.quantidade,
+               CarrinhoCompras.data_adicao)
+        .where(CarrinhoCompras.sessao_id == sessao_id)
+    )
+    try:
+        resultado = db.session.execute(_upsert_carrinho(insercao, 'cliente_id'))
+        db.session.execute(CarrinhoCompras.__table__.delete().where(CarrinhoCompras.sessao_id == sessao_id))
+        db.session.commit()
+        # O session_id pode ser mantido para o caso de logout, mas o carrinho agora é do cliente
+        return resultado.rowcount > 0
+    except SQLAlchemyError:
+        db.session.rollback()
+        return False
+
+def _persistir_carrinho_anonimo(cliente_id):
+    """
+    Grava o carrinho anônimo (cookie/memória) em carrinho_compras no login,
+    somando as quantidades aos itens que o cliente já tinha.
+    """
+    itens = carrinho_anonimo.get_itens()
+    if not itens:
+        return False
+
+    # Um único INSERT ... SELECT a partir de produtos (descarta ids inexistentes)
+    # com ON CONFLICT somando as quantidades
+    insercao = sqlite_insert(CarrinhoCompras).from_select(
+        ['cliente_id', 'produto_id', 'quantidade', 'data_adicao'],
+        select(literal(cliente_id), Produto.id, case(itens, value=Produto.id), literal(datetime.utcnow()))
+        .where(Produto.id.in_(list(itens)))
+    )
+    try:
+        db.session.execute(_upsert_carrinho(insercao, 'cliente_id'))
+        db.session.commit()
+        carrinho_anonimo.limpar()
+        return True
+    except SQLAlchemyError:
+        db.session.rollback()
+        return False
+
+def garantir_chaves_carrinho():
+    """
+    Garante as chaves únicas de carrinho_compras em bancos criados antes delas:
+    consolida linhas duplicadas (somando quantidades) e cria os índices únicos.
+    """
+    existentes = {indice['name'] for indice in inspect(db.engine).get_indexes(CarrinhoCompras.__tablename__)}
+    faltando = [indice for indice in CarrinhoCompras.__table__.indexes if indice.name not in existentes]
+    if not faltando:
+        return
+
+    for chave in ('cliente_id', 'sessao_id'):
+        db.session.execute(text(f"""
+            UPDATE carrinho_compras SET quantidade = (
+                SELECT SUM(c2.quantidade) FROM carrinho_compras c2
+                WHERE c2.{chave} = carrinho_compras.{chave} AND c2.produto_id = carrinho_compras.produto_id
+            )
+            WHERE {chave} IS NOT NULL AND id IN (
+                SELECT MIN(id) FROM carrinho_compras WHERE {chave} IS NOT NULL
+                GROUP BY {chave}, produto_id HAVING COUNT(*) > 1
+            )
+        """))
+        db.session.execute(text(f"""
+            DELETE FROM carrinho_compras
+            WHERE {chave} IS NOT NULL AND id NOT IN (
+                SELECT MIN(id) FROM carrinho_compras WHERE {chave} IS NOT NULL GROUP BY {chave}, produto_id
+            )
+        """))
+    db.session.commit()
+
+    for indice in faltando:
+        indice.create(db.engine)
@@ -0,0 +1,90 @@
+"""
+Carrinho de visitantes (usuários não logados) fora do banco de dados.
+
+O backend é escolhido por CARRINHO_ANONIMO_BACKEND:
+
+* ``cookie`` (padrão): os itens ficam na própria sessão do Flask, que é um
+  cookie assinado, no formato compacto {"<produto_id>": quantidade};
+* ``memoria``: os itens ficam em um dicionário LRU limitado no processo,
+  indexado pelo session_id (adequado apenas para um único worker);
+* ``banco``: comportamento original, com linhas em carrinho_compras
+  identificadas por sessao_id (tratado diretamente em app/carrinho.py).
+
+Em todos os casos o carrinho só é gravado em carrinho_compras quando o
+visitante faz login (migrar_carrinho_sessao_para_cliente).
+"""
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+from flask import current_app, session
+
+# Item do carrinho anônimo com a mesma interface usada pelos templates (o "id" é o próprio produto_id).
+ItemCarrinhoAnonimo = namedtuple('ItemCarrinhoAnonimo', ['id', 'produto_id', 'produto', 'quantidade'])
+
+
+class ArmazemCarrinhosMemoria:
+    """Carrinhos anônimos em memória, com limite de sessões (LRU) e expiração."""
+
+    def __init__(self, max_sessoes, ttl):
+        self.max_sessoes = max_sessoes
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._carrinhos = OrderedDict()  # session_id -> (expira, {produto_id: quantidade})
+
+    def get(self, session_id):
+        with self._lock:
+            entrada = self._carrinhos.get(session_id)
+            if entrada is None:
+                return {}
+            if entrada[0] < time.time():
+                del self._carrinhos[session_id]
+                return {}
+            self._carrinhos.move_to_end(session_id)
+            return dict(entrada[1])
+
+    def set(self, session_id, itens):
+        with self._lock:
+            self._carrinhos.pop(session_id, None)
+            if itens:
+                self._carrinhos[session_id] = (time.time() + self.ttl, dict(itens))
+                while len(self._carrinhos) > self.max_sessoes:
+                    self._carrinhos.popitem(last=False)
+
+
+def backend():
+    return current_app.config['CARRINHO_ANONIMO_BACKEND']
+
+
+def _armazem():
+    armazem = current_app.extensions.get('carrinhos_anonimos')
+    if armazem is None:
+        armazem = current_app.extensions['carrinhos_anonimos'] = ArmazemCarrinhosMemoria(
+            current_app.config['CARRINHO_ANONIMO_MAX_SESSOES'],
+            current_app.config['PERMANENT_SESSION_LIFETIME'],
+        )
+    return armazem
+
+
+def get_itens():
+    """Retorna {produto_id: quantidade} do carrinho do visitante."""
+    if backend() == 'memoria':
+        session_id = session.get('session_id')
+        return _armazem().get(session_id) if session_id else {}
+    return {int(produto_id): quantidade for produto_id, quantidade in session.get('carrinho', {}).items()}
+
+
+def salvar_itens(itens):
+    """Grava {produto_id: quantidade} no carrinho do visitante."""
+    if backend() == 'memoria':
+        from app.carrinho import get_session_id
+        _armazem().set(get_session_id(), itens)
+    elif itens:
+        session['carrinho'] = {str(produto_id): quantidade for produto_id, quantidade in itens.items()}
+    else:
+        session.pop('carrinho', None)
+
+
+def limpar():
+    """Esvazia o carrinho do visitante."""
+    salvar_itens({})
@@ -0,0 +1,118 @@
+"""
+Limpeza de carrinhos abandonados em carrinho_compras (flask carrinhos limpar).
+
+Um carrinho é abandonado quando o item mais recente foi adicionado há mais
+do que a expiração do seu tipo:
+
+* visitante (cliente_id NULL, chave sessao_id): CARRINHO_VISITANTE_EXPIRACAO
+  segundos, por padrão a duração da sessão; depois disso o sessao_id não é
+  mais apresentado por nenhum navegador;
+* cliente: CARRINHO_CLIENTE_EXPIRACAO_DIAS dias.
+
+Carrinhos com algum item recente são mantidos inteiros. As linhas são
+apagadas em lotes de CARRINHO_LIMPEZA_LOTE, cada um em uma transação curta
+com pausa (CARRINHO_LIMPEZA_PAUSA) entre eles, para que checkouts e
+alterações de carrinho consigam o lock de escrita. Os lotes são lidos do
+índice ix_carrinho_cliente_data (cliente_id, data_adicao), que também
+confere se um cliente tem item recente; para visitantes a conferência usa o
+índice único (sessao_id, produto_id).
+
+Além do comando, a limpeza roda como tarefa periódica da fila a cada
+CARRINHO_LIMPEZA_INTERVALO segundos (`flask fila worker`).
+"""
+import logging
+import time
+from datetime import datetime, timedelta
+
+import click
+from flask import current_app
+from flask.cli import AppGroup, with_appcontext
+from sqlalchemy import delete, exists, select
+from sqlalchemy.orm import aliased
+
+from app import db
+from app.fila import tarefa_periodica
+from app.models import CarrinhoCompras
+
+logger = logging.getLogger('app.carrinhos_abandonados')
+
+
+def _apagar_lote(chave, limite_data, tamanho_lote):
+    """Apaga até tamanho_lote linhas de carrinhos abandonados (uma transação); retorna quantas."""
+    antigo = aliased(CarrinhoCompras)
+    recente = aliased(CarrinhoCompras)
+    if chave == 'sessao_id':
+        do_tipo = antigo.cliente_id.is_(None)
+    else:
+        do_tipo = antigo.cliente_id.isnot(None)
+
+    # Seleção e exclusão no mesmo comando: um item adicionado enquanto isso mantém o carrinho
+    ids = (select(antigo.id)
+           .where(do_tipo,
+                  antigo.data_adicao < limite_data,
+                  ~exists().where(getattr(recente, chave) == getattr(antigo, chave),
+                                  recente.data_adicao >= limite_data))
+           .order_by(antigo.cliente_id, antigo.data_adicao)  # ordem do índice ix_carrinho_cliente_data
+           .limit(tamanho_lote))
+    resultado = db.session.execute(
+        delete(CarrinhoCompras)
+        .where(CarrinhoCompras.id.in_(ids))
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+    return resultado.rowcount
+
+
+def limpar_carrinhos_abandonados(tamanho_lote=None, pausa=None, progresso=None):
+    """
+    Apaga os carrinhos abandonados de visitantes e de clientes em lotes.
+    Retorna {'visitantes': linhas, 'clientes': linhas, 'lotes': n, 'segundos': duração}.
+    """
+    config = current_app.config
+    tamanho_lote = tamanho_lote or config['CARRINHO_LIMPEZA_LOTE']
+    pausa = config['CARRINHO_LIMPEZA_PAUSA'] if pausa is None else pausa
+    agora = datetime.utcnow()
+    limites = {
+        'visitantes': ('sessao_id', agora - timedelta(seconds=config['CARRINHO_VISITANTE_EXPIRACAO'])),
+        'clientes': ('cliente_id', agora - timedelta(days=config['CARRINHO_CLIENTE_EXPIRACAO_DIAS'])),
+    }
+
+    inicio = time.perf_counter()
+    relatorio = {'visitantes': 0, 'clientes': 0, 'lotes': 0}
+    for tipo, (chave, limite_data) in limites.items():
+        while True:
+            apagadas = _apagar_lote(chave, limite_data, tamanho_lote)
+            relatorio[tipo] += apagadas
+            relatorio['lotes'] += 1
+            if progresso and apagadas:
+                progresso(tipo, relatorio[tipo])
+            if apagadas < tamanho_lote:
+                break
+            time.sleep(pausa)
+    relatorio['segundos'] = round(time.perf_counter() - inicio, 3)
+    return relatorio
+
+
+@tarefa_periodica('limpar_carrinhos_abandonados', 'CARRINHO_LIMPEZA_INTERVALO')
+def tarefa_limpar_carrinhos():
+    """Tarefa periódica da fila: limpa os carrinhos e registra o resultado em log."""
+    relatorio = limpar_carrinhos_abandonados()
+    logger.info('Carrinhos abandonados: %s linha(s) de visitantes e %s de clientes apagadas em %.3fs',
+                relatorio['visitantes'], relatorio['clientes'], relatorio['segundos'])
+
+
+# ==================== COMANDOS (flask carrinhos ...) ====================
+
+carrinhos_cli = AppGroup('carrinhos', help='Manutenção da tabela carrinho_compras.')
+
+
+@carrinhos_cli.command('limpar')
+@click.option('--lote', type=int, default=None, help='Linhas por transação (padrão: CARRINHO_LIMPEZA_LOTE).')
+@click.option('--pausa', type=float, default=None, help='Segundos entre lotes (padrão: CARRINHO_LIMPEZA_PAUSA).')
+@with_appcontext
+def comando_limpar(lote, pausa):
+    """Apaga os carrinhos abandonados de visitantes e clientes."""
+    relatorio = limpar_carrinhos_abandonados(
+        lote, pausa, progresso=lambda tipo, n: click.echo(f'{n} linha(s) de {tipo} apagada(s)', err=True))
+    click.echo(f'{relatorio["visitantes"]} linha(s) de visitantes e {relatorio["clientes"]} de clientes '
+               f'apagada(s) em {relatorio["lotes"]} lote(s), {relatorio["segundos"]:.1f}s.', err=True)
@@ -0,0 +1,342 @@
+"""
+Consultas do catálogo (listagem e detalhes de produto) servidas pelo cache.
+
+Os produtos são guardados no cache como registros simples (sem vínculo com a
+sessão do SQLAlchemy). Toda alteração em Produto feita pelo ORM invalida, após
+o commit, apenas as entradas marcadas com a tag do produto; inserções e
+exclusões invalidam também as páginas da listagem, e uma mudança em uma
+coluna de ordenação (preco, nome, data_criacao) invalida as páginas por
+cursor ordenadas por ela, pois o produto muda de posição.
+
+Leituras feitas na réplica (BANCO_LEITURA=replica) usam o cache, mas não o
+alimentam: a réplica pode estar atrasada em relação a uma invalidação.
+"""
+import hashlib
+import math
+from datetime import datetime
+from types import SimpleNamespace
+
+from flask import current_app, has_app_context
+from itsdangerous import BadSignature, URLSafeSerializer
+from sqlalchemy import event, inspect, tuple_
+from sqlalchemy.orm import Session
+
+from app import db
+from app.models import Produto
+from app.roteamento import leitura_na_replica
+
+COLUNAS_PRODUTO = ('id', 'nome', 'descricao', 'preco', 'estoque', 'data_criacao', 'imagem')
+
+TAG_LISTAGEM = 'listagem'
+
+# Colunas aceitas como ordenação na paginação por cursor (sempre desempatadas pelo id)
+ORDENACOES_KEYSET = {
+    'id': Produto.id,
+    'preco': Produto.preco,
+    'nome': Produto.nome,
+    'data_criacao': Produto.data_criacao,
+}
+
+
+def tag_produto(produto_id):
+    return f'produto:{produto_id}'
+
+
+def tag_ordem(ordem):
+    return f'ordem:{ordem}'
+
+
+def produto_para_registro(produto):
+    """
+    Copia as colunas de um Produto para um registro desvinculado da sessão.
+    O campo ``versao`` é um hash dessas colunas (muda sempre que o produto muda)
+    e serve de chave para o cache de fragmentos dos templates.
+    """
+    valores = {coluna: getattr(produto, coluna) for coluna in COLUNAS_PRODUTO}
+    valores['versao'] = hashlib.blake2b(repr(sorted(valores.items())).encode(), digest_size=8).hexdigest()
+    return SimpleNamespace(**valores)
+
+
+class PaginaCatalogo:
+    """Página da listagem com a mesma interface usada pelo template (Pagination)."""
+
+    keyset = False
+
+    def __init__(self, items, page, per_page, total):
+        self.items = items
+        self.page = page
+        self.per_page = per_page
+        self.total = total
+
+    @property
+    def pages(self):
+        if not self.total or not self.per_page:
+            return 0
+        return math.ceil(self.total / self.per_page)
+
+    @property
+    def has_prev(self):
+        return self.page > 1
+
+    @property
+    def prev_num(self):
+        return self.page - 1 if self.has_prev else None
+
+    @property
+    def has_next(self):
+        return self.page < self.pages
+
+    @property
+    def next_num(self):
+        return self.page + 1 if self.has_next else None
+
+    def iter_pages(self, left_edge=2, left_current=2, right_current=4, right_edge=2):
+        """Mesmo algoritmo de flask_sqlalchemy.pagination.Pagination.iter_pages."""
+        pages_end = self.pages + 1
+        if pages_end == 1:
+            return
+
+        left_end = min(1 + left_edge, pages_end)
+        yield from range(1, left_end)
+        if left_end == pages_end:
+            return
+
+        mid_start = max(left_end, self.page - left_current)
+        mid_end = min(self.page + right_current + 1, pages_end)
+        if mid_start - left_end > 0:
+            yield None
+        yield from range(mid_start, mid_end)
+        if mid_end == pages_end:
+            return
+
+        right_start = max(mid_end, pages_end - right_edge)
+        if right_start - mid_end > 0:
+            yield None
+        yield from range(right_start, pages_end)
+
+
+class PaginaKeyset:
+    """Página da listagem por cursor (keyset): só conhece a página anterior e a próxima."""
+
+    keyset = True
+
+    def __init__(self, items, ordem, per_page, next_cursor, prev_cursor, total):
+        self.items = items
+        self.ordem = ordem
+        self.per_page = per_page
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+        self.total = total  # contagem em cache (pode estar levemente desatualizada)
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_prev(self):
+        return self.prev_cursor is not None
+
+
+def _serializador_cursor():
+    return URLSafeSerializer(current_app.config['SECRET_KEY'], salt='cursor-catalogo')
+
+
+def codificar_cursor(ordem, produto, direcao):
+    """Gera o token opaco que aponta para antes/depois do produto informado."""
+    valor = getattr(produto, ordem)
+    if hasattr(valor, 'isoformat'):
+        valor = valor.isoformat()
+    return _serializador_cursor().dumps([ordem, valor, produto.id, direcao])
+
+
+def decodificar_cursor(cursor, ordem):
+    """Retorna (valor, id, direcao) do cursor, ou None se inválido/de outra ordenação."""
+    try:
+        ordem_cursor, valor, produto_id, direcao = _serializador_cursor().loads(cursor)
+    except (BadSignature, ValueError, TypeError):
+        return None
+    if ordem_cursor != ordem or direcao not in ('depois', 'antes'):
+        return None
+    if ordem == 'data_criacao' and valor is not None:
+        valor = datetime.fromisoformat(valor)
+    return valor, produto_id, direcao
+
+
+def get_cache():
+    """Retorna o backend de cache do catálogo (ou None se desativado)."""
+    return current_app.extensions.get('cache_catalogo')
+
+
+def _gravar_no_cache(cache, chave, valor, tags):
+    if cache is not None and not leitura_na_replica():
+        cache.set(chave, valor, tags)
+
+
+def get_pagina_produtos(page, per_page=12):
+    """Retorna uma página da listagem de produtos, usando o cache quando possível."""
+    cache = get_cache()
+    chave = f'listagem:{page}:{per_page}'
+
+    if cache is not None:
+        pagina = cache.get(chave)
+        if pagina is not None:
+            return pagina
+
+    paginacao = Produto.query.order_by(Produto.id).paginate(page=page, per_page=per_page)
+    pagina = PaginaCatalogo(
+        items=[produto_para_registro(p) for p in paginacao.items],
+        page=paginacao.page,
+        per_page=paginacao.per_page,
+        total=paginacao.total,
+    )
+
+    _gravar_no_cache(cache, chave, pagina, [TAG_LISTAGEM] + [tag_produto(p.id) for p in pagina.items])
+    return pagina
+
+
+def get_produto(produto_id):
+    """Retorna o registro de um produto (ou None), usando o cache quando possível."""
+    cache = get_cache()
+    chave = tag_produto(produto_id)
+
+    if cache is not None:
+        registro = cache.get(chave)
+        if registro is not None:
+            return registro
+
+    produto = Produto.query.get(produto_id)
+    if produto is None:
+        return None
+
+    registro = produto_para_registro(produto)
+    _gravar_no_cache(cache, chave, registro, [chave])
+    return registro
+
+
+def contar_produtos():
+    """Total de produtos, mantido no cache até a listagem mudar (evita COUNT(*) por página)."""
+    cache = get_cache()
+    if cache is not None:
+        total = cache.get('total_produtos')
+        if total is not None:
+            return total
+
+    total = db.session.query(db.func.count(Produto.id)).scalar()
+    _gravar_no_cache(cache, 'total_produtos', total, [TAG_LISTAGEM])
+    return total
+
+
+def get_pagina_produtos_keyset(cursor=None, ordem='id', per_page=12):
+    """
+    Retorna uma página da listagem por cursor (seek): o custo é o mesmo em
+    qualquer profundidade, pois a consulta parte do último item visto usando
+    o índice de (ordem, id), sem OFFSET nem COUNT(*).
+    """
+    if ordem not in ORDENACOES_KEYSET:
+        ordem = 'id'
+    coluna = ORDENACOES_KEYSET[ordem]
+
+    # Cursores inválidos caem na primeira página (e na mesma entrada de cache)
+    posicao = decodificar_cursor(cursor, ordem) if cursor else None
+    cache = get_cache()
+    chave = f'keyset:{ordem}:{per_page}:{cursor if posicao else ""}'
+    if cache is not None:
+        pagina = cache.get(chave)
+        if pagina is not None:
+            return pagina
+
+    consulta = Produto.query
+    if posicao is None:
+        direcao = 'depois'
+    else:
+        valor, produto_id, direcao = posicao
+        if direcao == 'depois':
+            consulta = consulta.filter(tuple_(coluna, Produto.id) > tuple_(valor, produto_id))
+        else:
+            consulta = consulta.filter(tuple_(coluna, Produto.id) < tuple_(valor, produto_id))
+
+    if direcao == 'depois':
+        consulta = consulta.order_by(coluna.asc(), Produto.id.asc())
+    else:
+        consulta = consulta.order_by(coluna.desc(), Produto.id.desc())
+
+    # Um item a mais indica se existe página seguinte nessa direção
+    linhas = consulta.limit(per_page + 1).all()
+    ha_mais = len(linhas) > per_page
+    linhas = linhas[:per_page]
+    if direcao == 'antes':
+        linhas.reverse()
+
+    items = [produto_para_registro(p) for p in linhas]
+    next_cursor = prev_cursor = None
+    if items:
+        if direcao == 'antes' or ha_mais:
+            next_cursor = codificar_cursor(ordem, items[-1], 'depois')
+        if (direcao == 'depois' and posicao is not None) or (direcao == 'antes' and ha_mais):
+            prev_cursor = codificar_cursor(ordem, items[0], 'antes')
+
+    pagina = PaginaKeyset(items, ordem, per_page, next_cursor, prev_cursor, contar_produtos())
+    tags = [TAG_LISTAGEM] + [tag_produto(p.id) for p in items]
+    if ordem != 'id':
+        # Um produto de fora da página pode entrar nela quando a coluna da ordenação muda
+        tags.append(tag_ordem(ordem))
+    _gravar_no_cache(cache, chave, pagina, tags)
+    return pagina
+
+
+def invalidar_produtos(produto_ids, listagem=False, ordens=()):
+    """Invalida as entradas do cache que dependem dos produtos informados."""
+    if not has_app_context():
+        return 0
+    cache = get_cache()
+    if cache is None:
+        return 0
+
+    tags = [tag_produto(produto_id) for produto_id in produto_ids]
+    if listagem:
+        tags.append(TAG_LISTAGEM)
+    tags.extend(tag_ordem(ordem) for ordem in ordens)
+    return cache.invalidar_tags(tags)
+
+
+def invalidar_produtos_apos_commit(produto_ids):
+    """
+    Para UPDATEs em massa feitos dentro de uma transação ainda aberta (ex.: em
+    uma tarefa da fila): invalida os produtos quando a sessão fizer commit.
+    """
+    db.session.info.setdefault('produtos_alterados', set()).update(produto_ids)
+
+
+# ==================== INVALIDAÇÃO AUTOMÁTICA ====================
+
+@event.listens_for(Session, 'after_flush')
+def _registrar_produtos_alterados(session, flush_context):
+    """Anota na sessão os produtos alterados; a invalidação ocorre após o commit."""
+    alterados = session.info.setdefault('produtos_alterados', set())
+    for obj in session.dirty:
+        if isinstance(obj, Produto) and session.is_modified(obj):
+            alterados.add(obj.id)
+            estado = inspect(obj)
+            for ordem in ORDENACOES_KEYSET:
+                if ordem != 'id' and estado.attrs[ordem].history.has_changes():
+                    session.info.setdefault('ordens_alteradas', set()).add(ordem)
+    for obj in list(session.new) + list(session.deleted):
+        if isinstance(obj, Produto):
+            alterados.add(obj.id)
+            session.info['listagem_alterada'] = True
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidar_apos_commit(session):
+    alterados = session.info.pop('produtos_alterados', None)
+    listagem = session.info.pop('listagem_alterada', False)
+    ordens = session.info.pop('ordens_alteradas', ())
+    if alterados or listagem or ordens:
+        invalidar_produtos(alterados or (), listagem=listagem, ordens=ordens)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _descartar_apos_rollback(session):
+    session.info.pop('produtos_alterados', None)
+    session.info.pop('listagem_alterada', None)
+    session.info.pop('ordens_alteradas', None)
@@ -0,0 +1,330 @@
+"""
+Fila de tarefas durável em SQLite para o processamento pós-checkout.
+
+As tarefas ficam na tabela ``tarefas`` do próprio banco da aplicação, então
+``enfileirar`` participa da mesma transação de quem a chama: se o pedido for
+desfeito, a tarefa também é. Os workers (``flask fila worker``) reservam uma
+tarefa por vez com um único UPDATE ... RETURNING, executam o handler
+registrado com ``@tarefa`` e gravam o resultado na mesma transação dos
+efeitos do handler.
+
+Falhas são repetidas com espera exponencial até ``max_tentativas``; uma
+tarefa cujo worker morreu no meio da execução volta a ficar disponível
+quando a reserva (FILA_TEMPO_RESERVA) expira. Por isso os handlers devem ser
+idempotentes.
+
+Com FILA_SINCRONA as tarefas são executadas logo após o commit, na própria
+requisição (testes e desenvolvimento sem worker).
+
+Tarefas registradas com ``@tarefa_periodica`` se reagendam ao terminar (na
+mesma transação da conclusão), inclusive quando esgotam as tentativas, para
+que uma falha não interrompa o ciclo; ao iniciar, ``flask fila worker`` agenda as
+que não têm execução pendente.
+"""
+import functools
+import json
+import logging
+import multiprocessing
+import os
+import signal
+import time
+from datetime import datetime, timedelta
+
+import click
+from flask import current_app
+from flask.cli import AppGroup, with_appcontext
+from sqlalchemy import select, update
+from sqlalchemy.exc import OperationalError
+
+from app import db
+from app.models import Tarefa
+
+logger = logging.getLogger('app.fila')
+
+HANDLERS = {}
+PERIODICAS = {}  # tipo -> chave de configuração com o intervalo em segundos
+
+
+def tarefa(tipo):
+    """Registra a função como handler das tarefas do tipo informado."""
+    def registrar(funcao):
+        HANDLERS[tipo] = funcao
+        return funcao
+    return registrar
+
+
+def tarefa_periodica(tipo, intervalo):
+    """
+    Como @tarefa, mas ao concluir a tarefa enfileira a próxima execução
+    `config[intervalo]` segundos depois (0 desativa). Se a tarefa falhar
+    de vez, executar_tarefa agenda a próxima execução do mesmo jeito.
+    """
+    def registrar(funcao):
+        @functools.wraps(funcao)
+        def executar_e_reagendar(**argumentos):
+            funcao(**argumentos)
+            _reagendar(tipo, argumentos)
+        HANDLERS[tipo] = executar_e_reagendar
+        PERIODICAS[tipo] = intervalo
+        return funcao
+    return registrar
+
+
+def _reagendar(tipo, argumentos):
+    """Enfileira a próxima execução de uma tarefa periódica (sem commit)."""
+    atraso = current_app.config[PERIODICAS[tipo]]
+    if atraso > 0:
+        enfileirar(tipo, atraso=atraso, **argumentos)
+
+
+def enfileirar(tipo, atraso=0, max_tentativas=None, **argumentos):
+    """
+    Adiciona uma tarefa à sessão atual (sem commit): ela só fica visível para
+    os workers quando a transação de quem enfileirou for confirmada.
+    """
+    agora = datetime.utcnow()
+    nova = Tarefa(
+        tipo=tipo,
+        payload=json.dumps(argumentos),
+        max_tentativas=max_tentativas or current_app.config['FILA_MAX_TENTATIVAS'],
+        disponivel_em=agora + timedelta(seconds=atraso),
+        data_criacao=agora,
+    )
+    db.session.add(nova)
+    return nova
+
+
+def despachar():
+    """Chamada após o commit: em modo síncrono executa as tarefas pendentes."""
+    if current_app.config['FILA_SINCRONA']:
+        return processar_pendentes()
+    return 0
+
+
+def reservar_tarefa():
+    """
+    Reserva atomicamente a próxima tarefa pronta (ou com reserva expirada) e
+    retorna a linha reservada, ou None se a fila estiver vazia/ocupada.
+    """
+    agora = datetime.utcnow()
+    proxima = (select(Tarefa.id)
+               .where(Tarefa.status.in_(('pendente', 'executando')), Tarefa.disponivel_em <= agora)
+               .order_by(Tarefa.disponivel_em, Tarefa.id)
+               .limit(1)
+               .scalar_subquery())
+    try:
+        linha = db.session.execute(
+            update(Tarefa)
+            .where(Tarefa.id == proxima)
+            .values(
+                status='executando',
+                tentativas=Tarefa.tentativas + 1,
+                iniciada_em=agora,
+                disponivel_em=agora + timedelta(seconds=current_app.config['FILA_TEMPO_RESERVA']),
+            )
+            .returning(Tarefa.id, Tarefa.tipo, Tarefa.payload, Tarefa.tentativas, Tarefa.max_tentativas)
+            .execution_options(synchronize_session=False)
+        ).first()
+        db.session.commit()
+    except OperationalError as e:
+        # Outro worker está escrevendo; a próxima consulta tenta de novo
+        db.session.rollback()
+        logger.debug('Fila ocupada ao reservar tarefa: %s', e)
+        return None
+    return linha
+
+
+def _encerrar(tarefa_id, **valores):
+    db.session.execute(
+        update(Tarefa)
+        .where(Tarefa.id == tarefa_id)
+        .values(**valores)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def executar_tarefa(reservada):
+    """Executa uma tarefa reservada; retorna True se ela foi concluída."""
+    handler = HANDLERS.get(reservada.tipo)
+    try:
+        if reservada.tentativas > reservada.max_tentativas:
+            raise RuntimeError('Número máximo de tentativas excedido (reserva expirada).')
+        if handler is None:
+            raise LookupError(f'Nenhum handler registrado para "{reservada.tipo}".')
+        handler(**json.loads(reservada.payload))
+        # Efeitos do handler e conclusão da tarefa na mesma transação
+        _encerrar(reservada.id, status='concluida', concluida_em=datetime.utcnow(), erro=None)
+        db.session.commit()
+        return True
+    except Exception as e:
+        db.session.rollback()
+        agora = datetime.utcnow()
+        if handler is not None and reservada.tentativas < reservada.max_tentativas:
+            espera = current_app.config['FILA_ESPERA_BASE'] * (2 ** (reservada.tentativas - 1))
+            _encerrar(reservada.id, status='pendente', disponivel_em=agora + timedelta(seconds=espera), erro=repr(e))
+        else:
+            _encerrar(reservada.id, status='falha', concluida_em=agora, erro=repr(e))
+            if reservada.tipo in PERIODICAS:
+                _reagendar(reservada.tipo, json.loads(reservada.payload))
+        db.session.commit()
+        logger.warning('Tarefa %s (%s) falhou na tentativa %s: %r',
+                       reservada.id, reservada.tipo, reservada.tentativas, e)
+        return False
+
+
+def processar_pendentes(limite=None):
+    """Executa tarefas prontas até a fila esvaziar (ou até o limite); retorna quantas rodaram."""
+    executadas = 0
+    while limite is None or executadas < limite:
+        reservada = reservar_tarefa()
+        if reservada is None:
+            break
+        executar_tarefa(reservada)
+        executadas += 1
+    return executadas
+
+
+def agendar_periodicas():
+    """Enfileira as tarefas periódicas ativas que não têm execução pendente; retorna os tipos agendados."""
+    agendadas = []
+    for tipo, intervalo in PERIODICAS.items():
+        if current_app.config[intervalo] <= 0:
+            continue
+        pendente = (db.session.query(Tarefa.id)
+                    .filter(Tarefa.tipo == tipo, Tarefa.status.in_(('pendente', 'executando')))
+                    .first())
+        if pendente is None:
+            enfileirar(tipo)
+            agendadas.append(tipo)
+    db.session.commit()
+    return agendadas
+
+
+def limpar_concluidas(dias=7):
+    """Remove tarefas concluídas há mais de `dias` dias; retorna quantas foram removidas."""
+    limite = datetime.utcnow() - timedelta(days=dias)
+    removidas = (Tarefa.query
+                 .filter(Tarefa.status == 'concluida', Tarefa.concluida_em < limite)
+                 .delete(synchronize_session=False))
+    db.session.commit()
+    return removidas
+
+
+def _percentil(valores, p):
+    if not valores:
+        return 0.0
+    indice = min(len(valores) - 1, int(round(p / 100.0 * (len(valores) - 1))))
+    return round(valores[indice], 3)
+
+
+def estatisticas_fila(amostra=1000):
+    """Profundidade da fila por status e latências das últimas tarefas concluídas."""
+    agora = datetime.utcnow()
+    por_status = dict(db.session.query(Tarefa.status, db.func.count(Tarefa.id)).group_by(Tarefa.status).all())
+    prontas, mais_antiga = (db.session.query(db.func.count(Tarefa.id), db.func.min(Tarefa.data_criacao))
+                            .filter(Tarefa.status == 'pendente', Tarefa.disponivel_em <= agora)
+                            .one())
+
+    # Latência = criação até conclusão (espera na fila + execução)
+    concluidas = (db.session.query(Tarefa.data_criacao, Tarefa.iniciada_em, Tarefa.concluida_em)
+                  .filter(Tarefa.status == 'concluida')
+                  .order_by(Tarefa.concluida_em.desc())
+                  .limit(amostra)
+                  .all())
+    latencias = sorted((fim - criada).total_seconds() for criada, _, fim in concluidas)
+    execucoes = sorted((fim - inicio).total_seconds() for _, inicio, fim in concluidas)
+
+    return {
+        'por_status': {status: por_status.get(status, 0)
+                       for status in ('pendente', 'executando', 'concluida', 'falha')},
+        'prontas': prontas,
+        'idade_mais_antiga_s': round((agora - mais_antiga).total_seconds(), 3) if mais_antiga else 0.0,
+        'latencia_s': {'amostra': len(latencias), 'p50': _percentil(latencias, 50),
+                       'p95': _percentil(latencias, 95), 'max': _percentil(latencias, 100)},
+        'execucao_s': {'p50': _percentil(execucoes, 50), 'p95': _percentil(execucoes, 95),
+                       'max': _percentil(execucoes, 100)},
+    }
+
+
+# ==================== WORKERS ====================
+
+def _loop_worker(app, intervalo):
+    """Laço de um processo worker: reserva e executa tarefas até receber SIGTERM/SIGINT."""
+    parar = []
+    signal.signal(signal.SIGTERM, lambda *_: parar.append(True))
+    signal.signal(signal.SIGINT, lambda *_: parar.append(True))
+
+    with app.app_context():
+        # Conexões herdadas do processo pai não podem ser reaproveitadas após o fork
+        db.engine.dispose(close=False)
+        logger.info('Worker %s iniciado', os.getpid())
+        while not parar:
+            reservada = reservar_tarefa()
+            if reservada is None:
+                db.session.remove()
+                time.sleep(intervalo)
+                continue
+            executar_tarefa(reservada)
+        logger.info('Worker %s encerrado', os.getpid())
+
+
+def executar_workers(app, processos, intervalo):
+    """Inicia `processos` workers (fork) e aguarda até todos terminarem."""
+    contexto = multiprocessing.get_context('fork')
+    workers = [contexto.Process(target=_loop_worker, args=(app, intervalo), daemon=True)
+               for _ in range(processos)]
+    for worker in workers:
+        worker.start()
+
+    def encerrar(*_):
+        for worker in workers:
+            if worker.is_alive():
+                worker.terminate()
+
+    signal.signal(signal.SIGTERM, encerrar)
+    try:
+        for worker in workers:
+            worker.join()
+    except KeyboardInterrupt:
+        encerrar()
+        for worker in workers:
+            worker.join()
+
+
+# ==================== COMANDOS (flask fila ...) ====================
+
+fila_cli = AppGroup('fila', help='Fila de tarefas em segundo plano.')
+
+
+@fila_cli.command('worker')
+@click.option('--processos', type=int, default=None, help='Quantidade de processos (padrão: FILA_PROCESSOS).')
+@click.option('--intervalo', type=float, default=None, help='Espera com a fila vazia (padrão: FILA_INTERVALO).')
+@click.option('--uma-vez', is_flag=True, help='Processa as tarefas prontas e termina.')
+@with_appcontext
+def comando_worker(processos, intervalo, uma_vez):
+    """Executa os workers da fila."""
+    if uma_vez:
+        click.echo(f'{processar_pendentes()} tarefa(s) executada(s).')
+        return
+    app = current_app._get_current_object()
+    processos = processos or app.config['FILA_PROCESSOS']
+    intervalo = intervalo if intervalo is not None else app.config['FILA_INTERVALO']
+    for tipo in agendar_periodicas():
+        click.echo(f'Tarefa periódica "{tipo}" agendada.')
+    click.echo(f'Iniciando {processos} worker(s) da fila.')
+    executar_workers(app, processos, intervalo)
+
+
+@fila_cli.command('estatisticas')
+@with_appcontext
+def comando_estatisticas():
+    """Mostra a profundidade e a latência da fila (JSON)."""
+    click.echo(json.dumps(estatisticas_fila(), indent=2))
+
+
+@fila_cli.command('limpar')
+@click.option('--dias', type=int, default=7, show_default=True)
+@with_appcontext
+def comando_limpar(dias):
+    """Remove tarefas concluídas antigas."""
+    click.echo(f'{limpar_concluidas(dias)} tarefa(s) removida(s).')
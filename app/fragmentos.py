@@ -0,0 +1,83 @@
+"""
+Cache de fragmentos de template: ``{% cache 'nome', id, versao %}...{% endcache %}``.
+
+A chave é formada pelas expressões da tag, que devem incluir o id e a
+versão do objeto renderizado (ex.: ``produto.versao``, ``pedido.status``).
+Quando o objeto muda, a chave muda junto e o fragmento antigo simplesmente
+deixa de ser usado até sair do LRU, sem nenhuma invalidação explícita. Por
+isso o armazenamento fica na memória de cada processo, limitado por
+FRAGMENTOS_MAX_ITENS e FRAGMENTOS_TTL.
+
+Os acertos, as falhas e o tempo de renderização economizado ficam em
+/_stats/fragmentos (ADMIN_TOKEN ou localhost, veja somente_admin).
+"""
+import time
+
+from flask import current_app
+from jinja2 import nodes
+from jinja2.ext import Extension
+from markupsafe import Markup
+
+from app.cache import CacheMemoria
+
+
+class CacheFragmentos(CacheMemoria):
+    """CacheMemoria que também contabiliza o tempo de renderização economizado."""
+
+    def __init__(self, max_itens, ttl):
+        super().__init__(max_itens, ttl)
+        self._tempos = {'renderizacao_ms': 0.0, 'economizado_ms': 0.0}
+
+    def registrar_tempo(self, campo, ms):
+        with self._lock:
+            self._tempos[campo] += ms
+
+    def estatisticas(self):
+        estatisticas = super().estatisticas()
+        with self._lock:
+            estatisticas.update({f'tempo_{campo}': round(ms, 3) for campo, ms in self._tempos.items()})
+        return estatisticas
+
+
+class ExtensaoCacheFragmentos(Extension):
+    """Tag {% cache partes_da_chave... %} ... {% endcache %}."""
+
+    tags = {'cache'}
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        partes = [parser.parse_expression()]
+        while parser.stream.skip_if('comma'):
+            partes.append(parser.parse_expression())
+        corpo = parser.parse_statements(('name:endcache',), drop_needle=True)
+        chamada = self.call_method('_renderizar', [nodes.List(partes)])
+        return nodes.CallBlock(chamada, [], [], corpo).set_lineno(lineno)
+
+    def _renderizar(self, partes, caller):
+        cache = current_app.extensions.get('cache_fragmentos')
+        if cache is None:
+            return caller()
+
+        chave = 'fragmento:' + ':'.join(str(parte) for parte in partes)
+        entrada = cache.get(chave)
+        if entrada is not None:
+            html, render_ms = entrada
+            cache.registrar_tempo('economizado_ms', render_ms)
+            return Markup(html)
+
+        inicio = time.perf_counter()
+        html = caller()
+        render_ms = (time.perf_counter() - inicio) * 1000.0
+        cache.registrar_tempo('renderizacao_ms', render_ms)
+        cache.set(chave, (str(html), render_ms))
+        return html
+
+
+def init_fragmentos(app):
+    """Registra a extensão no Jinja e cria o cache em app.extensions['cache_fragmentos']."""
+    app.jinja_env.add_extension(ExtensaoCacheFragmentos)
+    if app.config.get('FRAGMENTOS_ATIVO'):
+        app.extensions['cache_fragmentos'] = CacheFragmentos(
+            app.config['FRAGMENTOS_MAX_ITENS'], app.config['FRAGMENTOS_TTL'])
+    else:
+        app.extensions['cache_fragmentos'] = None
@@ -0,0 +1,327 @@
+"""
+Imagens de produtos: originais, derivados redimensionados e URLs imutáveis.
+
+O original de cada produto é guardado uma vez em IMAGENS_DIR/originais,
+com o hash do conteúdo como nome (Produto.imagem_original). A partir dele
+são gerados os derivados de IMAGENS_TAMANHOS (miniatura do carrinho, card
+da listagem, página de detalhes), JPEGs progressivos que cabem em um
+quadrado do lado configurado, chamados ``<hash>-<lado>.jpg``. Como o nome
+muda sempre que o conteúdo muda, /imagens/<nome> responde com
+``Cache-Control: public, max-age=31536000, immutable`` e o navegador nunca
+revalida. Produto.imagem só recebe o hash depois que todos os derivados
+existem; até lá os templates continuam com o placeholder.
+
+A geração roda fora das requisições: na tarefa gerar_imagens_produto da fila
+(definir_imagem_produto, usada por `flask imagens definir SKU ARQUIVO`) ou em
+lote com `flask imagens gerar` /
+`flask imagens importar DIRETORIO`, que distribuem os produtos por um pool
+de IMAGENS_PROCESSOS processos. Requer o Pillow (pip install Pillow); sem
+ele as páginas continuam funcionando com os placeholders.
+
+Nos templates: ``imagem_produto(produto, 'card')`` devolve a URL do derivado
+ou None se o produto ainda não tem imagem.
+"""
+import hashlib
+import logging
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import click
+from flask import current_app, url_for
+from flask.cli import AppGroup, with_appcontext
+from sqlalchemy import case, inspect, select, text, update
+
+from app import db
+from app.catalogo import invalidar_produtos
+from app.fila import despachar, enfileirar, tarefa
+from app.models import Produto
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # geração de derivados é opcional
+    Image = ImageOps = None
+
+logger = logging.getLogger('app.imagens')
+
+EXTENSOES_ACEITAS = ('.jpg', '.jpeg', '.png', '.webp')
+CACHE_IMUTAVEL = 'public, max-age=31536000, immutable'
+LOTE_ATUALIZACAO = 200  # produtos por UPDATE/commit durante a geração em lote
+
+
+class ImagemInvalida(ValueError):
+    pass
+
+
+def diretorio_imagens(app=None):
+    app = app or current_app
+    return app.config.get('IMAGENS_DIR') or os.path.join(app.instance_path, 'imagens')
+
+
+def nome_derivado(imagem, lado):
+    return f'{imagem}-{lado}.jpg'
+
+
+def imagem_produto(produto, tamanho='card'):
+    """URL do derivado `tamanho` da imagem do produto, ou None (helper dos templates)."""
+    imagem = getattr(produto, 'imagem', None)  # registros antigos do cache não têm o campo
+    if not imagem:
+        return None
+    lado = current_app.config['IMAGENS_TAMANHOS'][tamanho]
+    return url_for('main.imagem', nome=nome_derivado(imagem, lado))
+
+
+def garantir_colunas_imagem():
+    """Adiciona imagem_original e imagem em bancos criados antes delas (migração)."""
+    colunas = {coluna['name'] for coluna in inspect(db.engine).get_columns(Produto.__tablename__)}
+    with db.engine.begin() as conn:
+        for coluna in ('imagem_original', 'imagem'):
+            if coluna not in colunas:
+                conn.execute(text(f'ALTER TABLE produtos ADD COLUMN {coluna} VARCHAR(32)'))
+
+
+# ==================== ORIGINAIS ====================
+
+def _gravar_atomicamente(destino, escrever):
+    fd, temporario = tempfile.mkstemp(dir=os.path.dirname(destino), prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'wb') as arquivo:
+            escrever(arquivo)
+        os.replace(temporario, destino)
+    except BaseException:
+        os.unlink(temporario)
+        raise
+
+
+def guardar_original(caminho, diretorio):
+    """Copia o arquivo para diretorio/originais (uma vez por conteúdo); retorna o hash."""
+    resumo = hashlib.blake2b(digest_size=16)
+    with open(caminho, 'rb') as arquivo:
+        for bloco in iter(lambda: arquivo.read(1 << 20), b''):
+            resumo.update(bloco)
+    imagem = resumo.hexdigest()
+
+    destino = os.path.join(diretorio, 'originais', imagem)
+    if not os.path.exists(destino):
+        os.makedirs(os.path.dirname(destino), exist_ok=True)
+        with open(caminho, 'rb') as origem:
+            _gravar_atomicamente(destino, lambda arquivo: shutil.copyfileobj(origem, arquivo))
+    return imagem
+
+
+# ==================== DERIVADOS ====================
+
+def gerar_derivados(diretorio, imagem, lados, qualidade):
+    """
+    Gera os derivados que ainda não existem a partir do original (roda nos
+    processos do pool: só recebe e devolve valores simples). Retorna
+    (imagem, erro), com erro None em caso de sucesso.
+    """
+    faltando = [lado for lado in lados if not os.path.exists(os.path.join(diretorio, nome_derivado(imagem, lado)))]
+    if not faltando:
+        return imagem, None
+    try:
+        with Image.open(os.path.join(diretorio, 'originais', imagem)) as original:
+            # JPEGs grandes são decodificados já reduzidos (escala 1/2, 1/4 ou 1/8)
+            original.draft('RGB', (max(faltando), max(faltando)))
+            base = ImageOps.exif_transpose(original)
+            if base.mode in ('RGBA', 'LA', 'P'):
+                base = base.convert('RGBA')
+                fundo = Image.new('RGB', base.size, (255, 255, 255))
+                fundo.paste(base, mask=base.getchannel('A'))
+                base = fundo
+            elif base.mode != 'RGB':
+                base = base.convert('RGB')
+
+            for lado in sorted(faltando, reverse=True):
+                derivado = base.copy()
+                derivado.thumbnail((lado, lado), Image.LANCZOS)
+                _gravar_atomicamente(
+                    os.path.join(diretorio, nome_derivado(imagem, lado)),
+                    lambda arquivo: derivado.save(arquivo, 'JPEG', quality=qualidade, optimize=True, progressive=True),
+                )
+                base = derivado  # o próximo lado (menor) parte deste derivado
+    except (OSError, ValueError, Image.DecompressionBombError) as e:
+        return imagem, f'{type(e).__name__}: {e}'
+    return imagem, None
+
+
+def _exigir_pillow():
+    if Image is None:
+        raise click.ClickException('A geração de imagens requer o Pillow: pip install Pillow')
+
+
+def _parametros_geracao():
+    config = current_app.config
+    return diretorio_imagens(), sorted(set(config['IMAGENS_TAMANHOS'].values())), config['IMAGENS_QUALIDADE']
+
+
+def _publicar(prontas):
+    """Aponta Produto.imagem para os hashes cujos derivados ficaram prontos ({produto_id: hash})."""
+    if not prontas:
+        return
+    db.session.execute(
+        update(Produto)
+        # Um produto que recebeu outro original durante a geração fica para a próxima
+        .where(Produto.id.in_(list(prontas)), Produto.imagem_original == case(prontas, value=Produto.id))
+        .values(imagem=Produto.imagem_original)
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+    # O UPDATE em massa não passa pelos eventos do ORM: invalida o cache manualmente
+    invalidar_produtos(prontas)
+
+
+def gerar_pendentes(processos=None, todos=False, progresso=None):
+    """
+    Gera os derivados dos produtos cuja imagem_original ainda não foi
+    publicada (todos=True: de todos os produtos com imagem), distribuindo os
+    originais por um pool de processos. Retorna (geradas, falhas).
+    """
+    condicao = Produto.imagem_original.isnot(None)
+    if not todos:
+        condicao &= (Produto.imagem.is_(None) | (Produto.imagem != Produto.imagem_original))
+    pendentes = db.session.execute(select(Produto.id, Produto.imagem_original).where(condicao)).all()
+    db.session.commit()  # encerra a leitura: a geração pode demorar
+    if not pendentes:
+        return 0, 0
+
+    produtos_por_imagem = {}
+    for produto_id, imagem in pendentes:
+        produtos_por_imagem.setdefault(imagem, []).append(produto_id)
+
+    diretorio, lados, qualidade = _parametros_geracao()
+    processos = processos or current_app.config['IMAGENS_PROCESSOS'] or os.cpu_count()
+    geradas = falhas = 0
+    prontas = {}
+    with ProcessPoolExecutor(processos, mp_context=multiprocessing.get_context('spawn')) as executor:
+        imagens = list(produtos_por_imagem)
+        resultados = executor.map(gerar_derivados, [diretorio] * len(imagens), imagens,
+                                  [lados] * len(imagens), [qualidade] * len(imagens), chunksize=4)
+        for imagem, erro in resultados:
+            if erro:
+                falhas += 1
+                logger.warning('Imagem %s (produtos %s) não gerada: %s', imagem, produtos_por_imagem[imagem], erro)
+                continue
+            geradas += 1
+            prontas.update(dict.fromkeys(produtos_por_imagem[imagem], imagem))
+            if len(prontas) >= LOTE_ATUALIZACAO:
+                _publicar(prontas)
+                prontas = {}
+            if progresso:
+                progresso(geradas + falhas, len(imagens))
+    _publicar(prontas)
+    return geradas, falhas
+
+
+def definir_imagem_produto(produto, caminho):
+    """
+    Guarda o original e agenda a geração dos derivados na fila (sem commit).
+    A imagem atual continua sendo exibida até os novos derivados ficarem prontos.
+    """
+    produto.imagem_original = guardar_original(caminho, diretorio_imagens())
+    enfileirar('gerar_imagens_produto', produto_id=produto.id)
+
+
+@tarefa('gerar_imagens_produto')
+def tarefa_gerar_imagens(produto_id):
+    """Gera os derivados de um produto no próprio worker da fila (idempotente)."""
+    produto = db.session.get(Produto, produto_id)
+    if produto is None or not produto.imagem_original or produto.imagem == produto.imagem_original:
+        return
+    if Image is None:
+        raise RuntimeError('A geração de imagens requer o Pillow')
+    diretorio, lados, qualidade = _parametros_geracao()
+    imagem, erro = gerar_derivados(diretorio, produto.imagem_original, lados, qualidade)
+    if erro:
+        raise ImagemInvalida(erro)
+    produto.imagem = imagem
+
+
+# ==================== COMANDOS (flask imagens ...) ====================
+
+imagens_cli = AppGroup('imagens', help='Imagens dos produtos e seus derivados.')
+
+
+def _eco_progresso(feitas, total):
+    if feitas % 50 == 0 or feitas == total:
+        click.echo(f'{feitas}/{total} imagem(ns) processada(s)', err=True)
+
+
+@imagens_cli.command('importar')
+@click.argument('diretorio', type=click.Path(exists=True, file_okay=False))
+@click.option('--processos', type=int, default=None, help='Processos do pool (padrão: IMAGENS_PROCESSOS ou nº de CPUs).')
+@with_appcontext
+def comando_importar(diretorio, processos):
+    """Associa DIRETORIO/<sku>.jpg|png|webp aos produtos e gera os derivados."""
+    _exigir_pillow()
+    inicio = time.perf_counter()
+    arquivos = {}
+    for nome in sorted(os.listdir(diretorio)):
+        sku, extensao = os.path.splitext(nome)
+        if extensao.lower() in EXTENSOES_ACEITAS:
+            arquivos[sku] = os.path.join(diretorio, nome)
+
+    destino = diretorio_imagens()
+    associadas = 0
+    skus = list(arquivos)
+    for i in range(0, len(skus), LOTE_ATUALIZACAO):
+        ids = dict(db.session.execute(
+            select(Produto.sku, Produto.id).where(Produto.sku.in_(skus[i:i + LOTE_ATUALIZACAO]))
+        ).all())
+        originais = {produto_id: guardar_original(arquivos[sku], destino) for sku, produto_id in ids.items()}
+        if originais:
+            db.session.execute(
+                update(Produto)
+                .where(Produto.id.in_(list(originais)))
+                .values(imagem_original=case(originais, value=Produto.id))
+                .execution_options(synchronize_session=False)
+            )
+        db.session.commit()
+        associadas += len(originais)
+    click.echo(f'{associadas} de {len(arquivos)} arquivo(s) associado(s) a produtos pelo SKU.', err=True)
+
+    geradas, falhas = gerar_pendentes(processos, progresso=_eco_progresso)
+    click.echo(f'{geradas} imagem(ns) gerada(s), {falhas} com erro, em {time.perf_counter() - inicio:.1f}s.', err=True)
+
+
+@imagens_cli.command('gerar')
+@click.option('--processos', type=int, default=None, help='Processos do pool (padrão: IMAGENS_PROCESSOS ou nº de CPUs).')
+@click.option('--todos', is_flag=True, help='Confere os derivados de todos os produtos (após mudar IMAGENS_TAMANHOS).')
+@with_appcontext
+def comando_gerar(processos, todos):
+    """Gera os derivados das imagens ainda não publicadas."""
+    _exigir_pillow()
+    inicio = time.perf_counter()
+    geradas, falhas = gerar_pendentes(processos, todos, progresso=_eco_progresso)
+    click.echo(f'{geradas} imagem(ns) gerada(s), {falhas} com erro, em {time.perf_counter() - inicio:.1f}s.', err=True)
+
+
+@imagens_cli.command('definir')
+@click.argument('sku')
+@click.argument('arquivo', type=click.Path(exists=True, dir_okay=False))
+@with_appcontext
+def comando_definir(sku, arquivo):
+    """Troca a imagem do produto SKU; os derivados são gerados pelo worker da fila."""
+    _exigir_pillow()
+    if os.path.splitext(arquivo)[1].lower() not in EXTENSOES_ACEITAS:
+        raise click.UsageError(f'Formato não aceito (use {", ".join(EXTENSOES_ACEITAS)}).')
+    produto = db.session.execute(select(Produto).where(Produto.sku == sku)).scalar_one_or_none()
+    if produto is None:
+        raise click.UsageError(f'Nenhum produto com o SKU {sku!r}.')
+    definir_imagem_produto(produto, arquivo)
+    db.session.commit()
+    despachar()
+    click.echo(f'Imagem do produto #{produto.id} enviada para a fila (gerar_imagens_produto).', err=True)
+
+
+def init_imagens(app):
+    """Valida IMAGENS_TAMANHOS e registra o helper imagem_produto nos templates."""
+    tamanhos = app.config['IMAGENS_TAMANHOS']
+    for tamanho in ('miniatura', 'card', 'detalhe'):
+        if not isinstance(tamanhos.get(tamanho), int) or tamanhos[tamanho] <= 0:
+            raise ValueError(f'IMAGENS_TAMANHOS[{tamanho!r}] deve ser um inteiro positivo')
+    app.add_template_global(imagem_produto)
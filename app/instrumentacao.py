@@ -0,0 +1,381 @@
+"""
+Instrumentação opcional por requisição.
+
+Quando INSTRUMENTACAO_ATIVA está ligada, cada requisição passa a contar e
+cronometrar as instruções SQL executadas e o tempo de renderização dos
+templates. O resultado é enviado no cabeçalho Server-Timing, requisições e
+consultas lentas são registradas em log estruturado (JSON) e os tempos são
+agregados em histogramas por endpoint, consultáveis em /_stats/instrumentacao
+(ADMIN_TOKEN ou localhost, veja somente_admin).
+
+Como no cache do catálogo, dois backends guardam os histogramas:
+
+* ``sqlite`` (padrão): cada worker soma as requisições em memória e grava o
+  acumulado a cada INSTRUMENTACAO_GRAVACAO_INTERVALO segundos em um arquivo
+  SQLite compartilhado (WAL), de modo que /_stats/instrumentacao mostra o
+  tráfego de todos os workers do gunicorn da máquina;
+* ``memoria``: por processo (testes e um único worker).
+"""
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from flask import (Blueprint, before_render_template, current_app, g,
+                   has_request_context, jsonify, request, template_rendered)
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from app.routes import somente_admin
+
+logger = logging.getLogger('app.instrumentacao')
+
+instrumentacao_bp = Blueprint('instrumentacao', __name__)
+
+# Limites superiores (ms) dos baldes do histograma; o último é "infinito"
+BALDES_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, float('inf'))
+
+
+SERIES = ('total', 'sql', 'template')
+
+
+class Histograma:
+    """Histograma de latência com baldes fixos, contagem, soma e máximo."""
+
+    def __init__(self, baldes=None, contagem=0, soma=0.0, maximo=0.0):
+        self.baldes = list(baldes) if baldes is not None else [0] * len(BALDES_MS)
+        self.contagem = contagem
+        self.soma = soma
+        self.maximo = maximo
+
+    def registrar(self, valor_ms):
+        for i, limite in enumerate(BALDES_MS):
+            if valor_ms <= limite:
+                self.baldes[i] += 1
+                break
+        self.contagem += 1
+        self.soma += valor_ms
+        self.maximo = max(self.maximo, valor_ms)
+
+    def percentil(self, p):
+        """Estimativa do percentil p (0-100) pelo limite superior do balde."""
+        if not self.contagem:
+            return 0.0
+        alvo = self.contagem * p / 100.0
+        acumulado = 0
+        for limite, n in zip(BALDES_MS, self.baldes):
+            acumulado += n
+            if acumulado >= alvo:
+                return min(limite, self.maximo)
+        return self.maximo
+
+    def to_dict(self):
+        return {
+            'contagem': self.contagem,
+            'media_ms': round(self.soma / self.contagem, 3) if self.contagem else 0.0,
+            'max_ms': round(self.maximo, 3),
+            'p50_ms': self.percentil(50),
+            'p95_ms': self.percentil(95),
+            'p99_ms': self.percentil(99),
+            'baldes': {('+inf' if limite == float('inf') else str(limite)): n
+                       for limite, n in zip(BALDES_MS, self.baldes)},
+        }
+
+
+def _resumo(dados):
+    """Converte {endpoint: {'total'|'sql'|'template': Histograma, 'sql_instrucoes': n}} para o JSON da rota."""
+    return {
+        endpoint: {
+            'total': series['total'].to_dict(),
+            'sql': series['sql'].to_dict(),
+            'template': series['template'].to_dict(),
+            'sql_instrucoes_por_requisicao': round(
+                series['sql_instrucoes'] / series['total'].contagem, 2
+            ) if series['total'].contagem else 0.0,
+        }
+        for endpoint, series in dados.items()
+    }
+
+
+class EstatisticasEndpoints:
+    """Agrega, por endpoint, histogramas de tempo total, SQL e template (por processo)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._dados = {}
+
+    def registrar(self, endpoint, total_ms, sql_ms, sql_n, template_ms):
+        with self._lock:
+            dados = self._dados.get(endpoint)
+            if dados is None:
+                dados = self._dados[endpoint] = {
+                    'total': Histograma(),
+                    'sql': Histograma(),
+                    'template': Histograma(),
+                    'sql_instrucoes': 0,
+                }
+            dados['total'].registrar(total_ms)
+            dados['sql'].registrar(sql_ms)
+            dados['template'].registrar(template_ms)
+            dados['sql_instrucoes'] += sql_n
+
+    def retirar(self):
+        """Devolve os dados acumulados e recomeça do zero."""
+        with self._lock:
+            dados, self._dados = self._dados, {}
+            return dados
+
+    def snapshot(self):
+        with self._lock:
+            return _resumo(self._dados)
+
+    def limpar(self):
+        with self._lock:
+            self._dados.clear()
+
+
+class EstatisticasSQLite:
+    """
+    Histogramas compartilhados entre os workers em um arquivo SQLite.
+    Cada processo acumula em memória e soma ao arquivo a cada `intervalo` segundos.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS series (
+            endpoint TEXT NOT NULL,
+            serie TEXT NOT NULL,
+            contagem INTEGER NOT NULL,
+            soma REAL NOT NULL,
+            maximo REAL NOT NULL,
+            PRIMARY KEY (endpoint, serie)
+        ) WITHOUT ROWID;
+        CREATE TABLE IF NOT EXISTS baldes (
+            endpoint TEXT NOT NULL,
+            serie TEXT NOT NULL,
+            indice INTEGER NOT NULL,
+            n INTEGER NOT NULL,
+            PRIMARY KEY (endpoint, serie, indice)
+        ) WITHOUT ROWID;
+        CREATE TABLE IF NOT EXISTS instrucoes (
+            endpoint TEXT PRIMARY KEY,
+            n INTEGER NOT NULL
+        ) WITHOUT ROWID;
+    """
+
+    def __init__(self, caminho, intervalo=5.0):
+        self.caminho = caminho
+        self.intervalo = intervalo
+        self._local = threading.local()
+        self._pendentes = EstatisticasEndpoints()
+        self._pendentes_pid = os.getpid()
+        self._gravado_em = time.time()
+        self._lock = threading.Lock()
+        self._conexao().executescript(self.SCHEMA)
+
+    def _conexao(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.caminho, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _acumulador(self):
+        if self._pendentes_pid != os.getpid():
+            # Requisições herdadas do processo pai no fork já são dele
+            self._pendentes, self._pendentes_pid = EstatisticasEndpoints(), os.getpid()
+        return self._pendentes
+
+    def registrar(self, endpoint, total_ms, sql_ms, sql_n, template_ms):
+        self._acumulador().registrar(endpoint, total_ms, sql_ms, sql_n, template_ms)
+        if time.time() - self._gravado_em >= self.intervalo:
+            self.gravar()
+
+    def gravar(self):
+        """Soma ao arquivo o que este processo acumulou desde a última gravação."""
+        with self._lock:
+            self._gravado_em = time.time()
+            dados = self._acumulador().retirar()
+        if not dados:
+            return
+        series, baldes, instrucoes = [], [], []
+        for endpoint, dados_endpoint in dados.items():
+            for serie in SERIES:
+                histograma = dados_endpoint[serie]
+                series.append((endpoint, serie, histograma.contagem, histograma.soma, histograma.maximo))
+                baldes.extend((endpoint, serie, indice, n) for indice, n in enumerate(histograma.baldes) if n)
+            instrucoes.append((endpoint, dados_endpoint['sql_instrucoes']))
+        try:
+            conn = self._conexao()
+            with conn:
+                conn.executemany(
+                    'INSERT INTO series (endpoint, serie, contagem, soma, maximo) VALUES (?, ?, ?, ?, ?) '
+                    'ON CONFLICT(endpoint, serie) DO UPDATE SET contagem = contagem + excluded.contagem, '
+                    'soma = soma + excluded.soma, maximo = MAX(maximo, excluded.maximo)', series)
+                conn.executemany(
+                    'INSERT INTO baldes (endpoint, serie, indice, n) VALUES (?, ?, ?, ?) '
+                    'ON CONFLICT(endpoint, serie, indice) DO UPDATE SET n = n + excluded.n', baldes)
+                conn.executemany(
+                    'INSERT INTO instrucoes (endpoint, n) VALUES (?, ?) '
+                    'ON CONFLICT(endpoint) DO UPDATE SET n = n + excluded.n', instrucoes)
+        except sqlite3.Error as e:
+            logger.warning('Falha ao gravar os histogramas da instrumentação: %s', e)
+
+    def snapshot(self):
+        self.gravar()
+        conn = self._conexao()
+        dados = {}
+        for endpoint, serie, contagem, soma, maximo in conn.execute(
+                'SELECT endpoint, serie, contagem, soma, maximo FROM series'):
+            dados.setdefault(endpoint, {'sql_instrucoes': 0})[serie] = Histograma(
+                contagem=contagem, soma=soma, maximo=maximo)
+        for endpoint, serie, indice, n in conn.execute('SELECT endpoint, serie, indice, n FROM baldes'):
+            if endpoint in dados and indice < len(BALDES_MS):
+                dados[endpoint][serie].baldes[indice] = n
+        for endpoint, n in conn.execute('SELECT endpoint, n FROM instrucoes'):
+            if endpoint in dados:
+                dados[endpoint]['sql_instrucoes'] = n
+        return _resumo({endpoint: series for endpoint, series in dados.items()
+                        if all(serie in series for serie in SERIES)})
+
+    def limpar(self):
+        self._acumulador().limpar()
+        conn = self._conexao()
+        with conn:
+            for tabela in ('series', 'baldes', 'instrucoes'):
+                conn.execute(f'DELETE FROM {tabela}')
+
+
+def get_estatisticas():
+    """Backend dos histogramas da aplicação atual (ver init_instrumentacao)."""
+    return current_app.extensions['instrumentacao']
+
+
+def _log_estruturado(evento, **campos):
+    logger.warning(json.dumps({'evento': evento, **campos}, ensure_ascii=False, default=str))
+
+
+# ==================== SQL ====================
+
+def _antes_cursor(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('instrumentacao_inicio', []).append(time.perf_counter())
+
+
+def _depois_cursor(conn, cursor, statement, parameters, context, executemany):
+    pilha = conn.info.get('instrumentacao_inicio')
+    if not pilha:
+        return
+    duracao_ms = (time.perf_counter() - pilha.pop()) * 1000.0
+
+    if not has_request_context() or 'instrumentacao' not in g:
+        return
+
+    dados = g.instrumentacao
+    dados['sql_n'] += 1
+    dados['sql_ms'] += duracao_ms
+
+    if duracao_ms >= dados['limite_consulta_ms']:
+        _log_estruturado(
+            'consulta_lenta',
+            endpoint=request.endpoint,
+            duracao_ms=round(duracao_ms, 3),
+            sql=statement,
+        )
+
+
+# ==================== TEMPLATES ====================
+
+def _antes_template(sender, template, context, **extra):
+    if 'instrumentacao' in g:
+        g.instrumentacao['template_inicio'].append(time.perf_counter())
+
+
+def _depois_template(sender, template, context, **extra):
+    if 'instrumentacao' in g and g.instrumentacao['template_inicio']:
+        inicio = g.instrumentacao['template_inicio'].pop()
+        g.instrumentacao['template_ms'] += (time.perf_counter() - inicio) * 1000.0
+
+
+# ==================== REQUISIÇÃO ====================
+
+def _iniciar_requisicao():
+    g.instrumentacao = {
+        'inicio': time.perf_counter(),
+        'sql_n': 0,
+        'sql_ms': 0.0,
+        'template_ms': 0.0,
+        'template_inicio': [],
+        'limite_consulta_ms': current_app.config['LIMITE_CONSULTA_LENTA_MS'],
+    }
+
+
+def _finalizar_requisicao(response):
+    dados = g.pop('instrumentacao', None)
+    if dados is None:
+        return response
+
+    total_ms = (time.perf_counter() - dados['inicio']) * 1000.0
+    endpoint = request.endpoint or 'desconhecido'
+
+    response.headers.add(
+        'Server-Timing',
+        f'db;dur={dados["sql_ms"]:.2f};desc="{dados["sql_n"]} SQL", '
+        f'tpl;dur={dados["template_ms"]:.2f}, '
+        f'total;dur={total_ms:.2f}'
+    )
+
+    get_estatisticas().registrar(endpoint, total_ms, dados['sql_ms'], dados['sql_n'], dados['template_ms'])
+
+    if total_ms >= current_app.config['LIMITE_REQUISICAO_LENTA_MS']:
+        _log_estruturado(
+            'requisicao_lenta',
+            endpoint=endpoint,
+            metodo=request.method,
+            caminho=request.path,
+            status=response.status_code,
+            total_ms=round(total_ms, 3),
+            sql_ms=round(dados['sql_ms'], 3),
+            sql_instrucoes=dados['sql_n'],
+            template_ms=round(dados['template_ms'], 3),
+        )
+
+    return response
+
+
+_listeners_sql_registrados = False
+
+
+def init_instrumentacao(app):
+    """Liga a instrumentação na aplicação (chamada por create_app quando habilitada)."""
+    global _listeners_sql_registrados
+    if not _listeners_sql_registrados:
+        # Registrado na classe Engine para cobrir todos os engines/binds
+        event.listen(Engine, 'before_cursor_execute', _antes_cursor)
+        event.listen(Engine, 'after_cursor_execute', _depois_cursor)
+        _listeners_sql_registrados = True
+
+    if app.config['INSTRUMENTACAO_BACKEND'] == 'memoria':
+        app.extensions['instrumentacao'] = EstatisticasEndpoints()
+    else:
+        caminho = app.config.get('INSTRUMENTACAO_ARQUIVO') or os.path.join(app.instance_path, 'instrumentacao.db')
+        os.makedirs(os.path.dirname(caminho), exist_ok=True)
+        app.extensions['instrumentacao'] = EstatisticasSQLite(caminho, app.config['INSTRUMENTACAO_GRAVACAO_INTERVALO'])
+
+    before_render_template.connect(_antes_template, app)
+    template_rendered.connect(_depois_template, app)
+    app.before_request(_iniciar_requisicao)
+    app.after_request(_finalizar_requisicao)
+    app.register_blueprint(instrumentacao_bp)
+
+
+# ==================== ROTA DE ESTATÍSTICAS ====================
+
+@instrumentacao_bp.route('/_stats/instrumentacao')
+@somente_admin
+def stats():
+    """Histogramas por endpoint, somando todos os workers no backend sqlite."""
+    return jsonify(get_estatisticas().snapshot())
@@ -0,0 +1,360 @@
+"""
+Limites de requisições e controle de admissão das rotas caras.
+
+Cada regra (login, cadastro, carrinho, checkout) é configurada em
+LIMITES_REGRAS por uma especificação como ``ip=20/60 sessao=10/60
+rota=200/10 simultaneas=6``:
+
+* ``ip``, ``sessao`` e ``rota`` são baldes de fichas (token bucket) no
+  formato ``capacidade/segundos``: até `capacidade` requisições seguidas,
+  recarregadas por completo em `segundos`. ``sessao`` usa o cliente logado
+  ou o session_id (requisições sem sessão só contam no IP) e ``rota`` é um
+  balde único da regra, somando todos os clientes;
+* ``simultaneas`` limita as requisições da regra em andamento ao mesmo
+  tempo, somando todos os workers.
+
+Requisições acima de um balde recebem 429 com Retry-After; acima do limite
+de simultâneas, 503. As fichas só são consumidas quando a requisição é
+admitida.
+
+Dois backends estão disponíveis, como no cache do catálogo:
+
+* ``sqlite`` (padrão): um arquivo SQLite local em modo WAL, compartilhado por
+  todos os workers do gunicorn na mesma máquina. A decisão é uma transação
+  curta (BEGIN IMMEDIATE) com um upsert por balde. As vagas ocupadas ficam
+  registradas por pid: as de um worker que morreu são liberadas quando o
+  limite é atingido;
+* ``memoria``: por processo (testes e um único worker).
+
+Falhas do backend não bloqueiam requisições (a requisição é admitida e a
+falha registrada em log). As decisões por regra ficam em /_stats/limites.
+"""
+import logging
+import math
+import os
+import sqlite3
+import threading
+import time
+from collections import Counter, namedtuple
+from functools import wraps
+
+from flask import current_app, jsonify, request, session
+
+logger = logging.getLogger('app.limites')
+
+ESCOPOS = ('ip', 'sessao', 'rota')
+RESULTADOS = ('permitida',) + ESCOPOS + ('concorrencia',)
+
+Balde = namedtuple('Balde', ['escopo', 'chave', 'capacidade', 'taxa'])  # taxa em fichas por segundo
+
+
+class Regra:
+    """Especificação de uma regra lida de LIMITES_REGRAS."""
+
+    def __init__(self, nome, especificacao):
+        self.nome = nome
+        self.baldes = {}  # escopo -> (capacidade, segundos)
+        self.simultaneas = 0
+        for parte in especificacao.replace(',', ' ').split():
+            escopo, _, valor = parte.partition('=')
+            try:
+                if escopo == 'simultaneas':
+                    self.simultaneas = int(valor)
+                elif escopo in ESCOPOS:
+                    capacidade, segundos = valor.split('/')
+                    self.baldes[escopo] = (int(capacidade), float(segundos))
+                else:
+                    raise ValueError(escopo)
+            except ValueError:
+                raise ValueError(f'LIMITES_REGRAS["{nome}"]: "{parte}" inválido '
+                                 '(use ip=N/S sessao=N/S rota=N/S simultaneas=N)')
+
+    @property
+    def maior_periodo(self):
+        return max((segundos for _, segundos in self.baldes.values()), default=0)
+
+    def baldes_da_requisicao(self):
+        """Baldes que esta requisição precisa consumir."""
+        identificacoes = {
+            'ip': request.remote_addr or 'desconhecido',
+            'sessao': session.get('cliente_id') or session.get('session_id'),
+            'rota': '*',
+        }
+        baldes = []
+        for escopo, (capacidade, segundos) in self.baldes.items():
+            identificacao = identificacoes[escopo]
+            if identificacao is not None:
+                baldes.append(Balde(escopo, f'{self.nome}:{escopo}:{identificacao}',
+                                    capacidade, capacidade / segundos))
+        return baldes
+
+
+def _disponiveis(fichas, atualizado, balde, agora):
+    return min(balde.capacidade, fichas + (agora - atualizado) * balde.taxa)
+
+
+class LimitadorMemoria:
+    """Backend em memória (por processo)."""
+
+    def __init__(self, regras):
+        self.regras = regras
+        self._lock = threading.Lock()
+        self._baldes = {}  # chave -> (fichas, atualizado)
+        self._ocupacao = Counter()
+        self._contadores = Counter()
+        self._retencao = max((regra.maior_periodo for regra in regras.values()), default=0)
+
+    def admitir(self, regra, baldes, agora=None):
+        """Retorna (motivo da recusa ou None, segundos até uma nova tentativa)."""
+        agora = time.time() if agora is None else agora
+        with self._lock:
+            motivo, espera = None, 0.0
+            novos = {}
+            for balde in baldes:
+                fichas, atualizado = self._baldes.get(balde.chave, (balde.capacidade, agora))
+                disponiveis = _disponiveis(fichas, atualizado, balde, agora)
+                if disponiveis < 1:
+                    motivo, espera = balde.escopo, (1 - disponiveis) / balde.taxa
+                    break
+                novos[balde.chave] = (disponiveis - 1, agora)
+
+            if motivo is None and regra.simultaneas:
+                if self._ocupacao[regra.nome] >= regra.simultaneas:
+                    motivo, espera = 'concorrencia', 1.0
+                else:
+                    self._ocupacao[regra.nome] += 1
+            if motivo is None:
+                self._baldes.update(novos)
+            self._contadores[(regra.nome, motivo or 'permitida')] += 1
+
+            if len(self._baldes) > 10000:
+                self._baldes = {chave: valor for chave, valor in self._baldes.items()
+                                if valor[1] >= agora - self._retencao}
+            return motivo, espera
+
+    def liberar(self, regra):
+        with self._lock:
+            if self._ocupacao[regra.nome] > 0:
+                self._ocupacao[regra.nome] -= 1
+
+    def estatisticas(self):
+        with self._lock:
+            return _montar_estatisticas(self.regras, self._contadores.items(), self._ocupacao.items(),
+                                        len(self._baldes), 'memoria')
+
+
+class LimitadorSQLite:
+    """
+    Backend SQLite compartilhado entre processos.
+    Cada thread/processo abre sua própria conexão (reaberta após fork).
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS baldes (
+            chave TEXT PRIMARY KEY,
+            fichas REAL NOT NULL,
+            atualizado REAL NOT NULL
+        ) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS ix_baldes_atualizado ON baldes (atualizado);
+        CREATE TABLE IF NOT EXISTS ocupacao (
+            regra TEXT NOT NULL,
+            pid INTEGER NOT NULL,
+            n INTEGER NOT NULL,
+            PRIMARY KEY (regra, pid)
+        ) WITHOUT ROWID;
+        CREATE TABLE IF NOT EXISTS contadores (
+            regra TEXT NOT NULL,
+            resultado TEXT NOT NULL,
+            valor INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (regra, resultado)
+        ) WITHOUT ROWID;
+    """
+
+    # Consome uma ficha se houver; sem linha no RETURNING o balde está vazio
+    CONSUMIR = """
+        INSERT INTO baldes (chave, fichas, atualizado) VALUES (:chave, :capacidade - 1, :agora)
+        ON CONFLICT(chave) DO UPDATE SET
+            fichas = MIN(:capacidade, fichas + (:agora - atualizado) * :taxa) - 1,
+            atualizado = :agora
+        WHERE MIN(:capacidade, fichas + (:agora - atualizado) * :taxa) >= 1
+        RETURNING fichas
+    """
+
+    LIMPEZA_A_CADA = 1000  # decisões (por processo) entre remoções de baldes inativos
+
+    def __init__(self, caminho, regras, timeout=1.0):
+        self.caminho = caminho
+        self.regras = regras
+        self.timeout = timeout
+        self._local = threading.local()
+        self._decisoes = 0
+        # Um balde parado há mais que o seu período está cheio: equivale a não existir
+        self._retencao = max((regra.maior_periodo for regra in regras.values()), default=0)
+        self._conexao().executescript(self.SCHEMA)
+
+    def _conexao(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.caminho, timeout=self.timeout, isolation_level=None,
+                                   check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    @staticmethod
+    def _processo_vivo(pid):
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            pass
+        return True
+
+    def _consumir(self, conn, baldes, agora):
+        for balde in baldes:
+            parametros = dict(balde._asdict(), agora=agora)
+            if conn.execute(self.CONSUMIR, parametros).fetchone() is None:
+                fichas, atualizado = conn.execute(
+                    'SELECT fichas, atualizado FROM baldes WHERE chave = ?', (balde.chave,)).fetchone()
+                return balde.escopo, (1 - _disponiveis(fichas, atualizado, balde, agora)) / balde.taxa
+        return None, 0.0
+
+    def _ocupar(self, conn, regra):
+        def ocupadas():
+            return conn.execute('SELECT COALESCE(SUM(n), 0) FROM ocupacao WHERE regra = ?',
+                                (regra.nome,)).fetchone()[0]
+
+        if ocupadas() >= regra.simultaneas:
+            # Vagas de workers que morreram no meio de uma requisição (ex.: timeout do gunicorn)
+            mortos = [(regra.nome, pid) for (pid,) in conn.execute(
+                'SELECT pid FROM ocupacao WHERE regra = ?', (regra.nome,)) if not self._processo_vivo(pid)]
+            if not mortos:
+                return False
+            conn.executemany('DELETE FROM ocupacao WHERE regra = ? AND pid = ?', mortos)
+            if ocupadas() >= regra.simultaneas:
+                return False
+        conn.execute('INSERT INTO ocupacao (regra, pid, n) VALUES (?, ?, 1) '
+                     'ON CONFLICT(regra, pid) DO UPDATE SET n = n + 1', (regra.nome, os.getpid()))
+        return True
+
+    def admitir(self, regra, baldes, agora=None):
+        """Retorna (motivo da recusa ou None, segundos até uma nova tentativa)."""
+        agora = time.time() if agora is None else agora
+        try:
+            conn = self._conexao()
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                conn.execute('SAVEPOINT decisao')
+                motivo, espera = self._consumir(conn, baldes, agora)
+                if motivo is None and regra.simultaneas and not self._ocupar(conn, regra):
+                    motivo, espera = 'concorrencia', 1.0
+                # Recusada: nenhuma ficha é consumida, só a contagem da decisão é gravada
+                conn.execute('ROLLBACK TO decisao' if motivo else 'RELEASE decisao')
+                conn.execute('INSERT INTO contadores (regra, resultado, valor) VALUES (?, ?, 1) '
+                             'ON CONFLICT(regra, resultado) DO UPDATE SET valor = valor + 1',
+                             (regra.nome, motivo or 'permitida'))
+                self._decisoes += 1
+                if self._decisoes % self.LIMPEZA_A_CADA == 0:
+                    conn.execute('DELETE FROM baldes WHERE atualizado < ?', (agora - self._retencao,))
+                conn.execute('COMMIT')
+            except BaseException:
+                conn.execute('ROLLBACK')
+                raise
+            return motivo, espera
+        except sqlite3.Error as e:
+            logger.warning('Falha ao consultar os limites de requisições: %s', e)
+            return None, 0.0
+
+    def liberar(self, regra):
+        try:
+            self._conexao().execute('UPDATE ocupacao SET n = n - 1 WHERE regra = ? AND pid = ? AND n > 0',
+                                    (regra.nome, os.getpid()))
+        except sqlite3.Error as e:
+            logger.warning('Falha ao liberar vaga de "%s": %s', regra.nome, e)
+
+    def estatisticas(self):
+        conn = self._conexao()
+        contadores = [((regra, resultado), valor) for regra, resultado, valor in conn.execute(
+            'SELECT regra, resultado, valor FROM contadores')]
+        ocupacao = conn.execute('SELECT regra, SUM(n) FROM ocupacao GROUP BY regra').fetchall()
+        baldes = conn.execute('SELECT COUNT(*) FROM baldes').fetchone()[0]
+        return _montar_estatisticas(self.regras, contadores, ocupacao, baldes, 'sqlite')
+
+
+def _montar_estatisticas(regras, contadores, ocupacao, baldes, backend):
+    ocupacao = dict(ocupacao)
+    por_regra = {nome: {'decisoes': dict.fromkeys(RESULTADOS, 0), 'em_andamento': ocupacao.get(nome, 0),
+                        'simultaneas': regra.simultaneas}
+                 for nome, regra in regras.items()}
+    for (nome, resultado), valor in contadores:
+        if nome in por_regra:
+            por_regra[nome]['decisoes'][resultado] = valor
+    for estatisticas in por_regra.values():
+        decisoes = estatisticas['decisoes']
+        total = sum(decisoes.values())
+        estatisticas['recusadas'] = total - decisoes['permitida']
+        estatisticas['taxa_recusa'] = round(estatisticas['recusadas'] / total, 4) if total else 0.0
+    return {'backend': backend, 'baldes': baldes, 'regras': por_regra}
+
+
+# ==================== DECORADOR ====================
+
+def _resposta_recusada(motivo, espera):
+    if motivo == 'concorrencia':
+        status, mensagem = 503, 'Servidor ocupado. Tente novamente em instantes.'
+    else:
+        status, mensagem = 429, 'Muitas requisições. Tente novamente em instantes.'
+    if request.path.startswith('/api/'):
+        resposta = jsonify({'erro': mensagem})
+        resposta.status_code = status
+    else:
+        resposta = current_app.response_class(mensagem, status=status, mimetype='text/plain')
+    resposta.headers['Retry-After'] = str(max(1, math.ceil(espera)))
+    return resposta
+
+
+def limitar(nome_regra, metodos=('POST',)):
+    """
+    Decorador das rotas caras: aplica a regra LIMITES_REGRAS[nome_regra] às
+    requisições com os métodos informados (por padrão só POST).
+    """
+    def decorador(view):
+        @wraps(view)
+        def decorated_function(*args, **kwargs):
+            limitador = current_app.extensions.get('limitador')
+            regra = limitador.regras.get(nome_regra) if limitador is not None else None
+            if regra is None or request.method not in metodos:
+                return view(*args, **kwargs)
+
+            motivo, espera = limitador.admitir(regra, regra.baldes_da_requisicao())
+            if motivo is not None:
+                return _resposta_recusada(motivo, espera)
+            if not regra.simultaneas:
+                return view(*args, **kwargs)
+            try:
+                return view(*args, **kwargs)
+            finally:
+                limitador.liberar(regra)
+        return decorated_function
+    return decorador
+
+
+def init_limites(app):
+    """Cria o backend configurado e o registra em app.extensions['limitador']."""
+    if not app.config.get('LIMITES_ATIVOS'):
+        app.extensions['limitador'] = None
+        return None
+
+    regras = {nome: Regra(nome, especificacao) for nome, especificacao in app.config['LIMITES_REGRAS'].items()}
+    if app.config['LIMITES_BACKEND'] == 'memoria':
+        limitador = LimitadorMemoria(regras)
+    else:
+        caminho = app.config.get('LIMITES_ARQUIVO') or os.path.join(app.instance_path, 'limites.db')
+        os.makedirs(os.path.dirname(caminho), exist_ok=True)
+        limitador = LimitadorSQLite(caminho, regras, app.config['LIMITES_TIMEOUT'])
+
+    app.extensions['limitador'] = limitador
+    return limitador
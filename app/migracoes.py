@@ -0,0 +1,213 @@
+"""
+Versão do esquema do banco e migrações (flask esquema ...).
+
+Cada migração é uma função idempotente com um número de versão crescente;
+as aplicadas ficam registradas na tabela esquema_versao. A inicialização
+da aplicação não cria nem inspeciona tabelas: só lê a maior versão
+registrada (uma consulta) e compara com a última migração conhecida.
+
+Com ESQUEMA_MIGRAR_AO_INICIAR (desenvolvimento e testes) as migrações
+pendentes são aplicadas no create_app. Em produção elas rodam de forma
+explícita (`flask --app run:app esquema migrar`, processo release do
+Procfile) e um worker do gunicorn se recusa a subir com o esquema
+desatualizado (gunicorn.conf.py).
+
+Bancos criados antes do versionamento começam na versão 0: todas as
+migrações rodam uma vez e, por serem idempotentes, só criam o que falta.
+"""
+import logging
+from datetime import datetime
+
+import click
+from flask.cli import AppGroup, with_appcontext
+from sqlalchemy import text
+
+from app import db
+
+logger = logging.getLogger('app.migracoes')
+
+DDL_ESQUEMA_VERSAO = """
+    CREATE TABLE IF NOT EXISTS esquema_versao (
+        versao INTEGER PRIMARY KEY,
+        descricao TEXT NOT NULL,
+        aplicada_em TEXT NOT NULL
+    )
+"""
+
+
+class EsquemaDesatualizado(RuntimeError):
+    pass
+
+
+# ==================== MIGRAÇÕES ====================
+
+def _tabelas_dos_modelos():
+    db.create_all()
+
+
+def _sku_produtos():
+    from app.carga_catalogo import garantir_sku_produtos
+    garantir_sku_produtos()
+
+
+def _chaves_carrinho():
+    from app.carrinho import garantir_chaves_carrinho
+    garantir_chaves_carrinho()
+
+
+def _indices_dos_modelos():
+    # create_all não cria índices novos em tabelas que já existiam
+    with db.engine.begin() as conn:
+        for tabela in db.metadata.sorted_tables:
+            for indice in tabela.indexes:
+                indice.create(conn, checkfirst=True)
+
+
+def _indice_busca():
+    from app.busca import garantir_indice_busca
+    garantir_indice_busca()  # sem FTS5 a busca usa LIKE; a migração conta como aplicada
+
+
+def _versao_catalogo():
+    from app.respostas import garantir_versao_catalogo
+    garantir_versao_catalogo()
+
+
+def _tabelas_arquivo_pedidos():
+    from app.models import ItemPedidoArquivado, PagamentoArquivado, PedidoArquivado
+    with db.engine.begin() as conn:
+        for modelo in (PedidoArquivado, ItemPedidoArquivado, PagamentoArquivado):
+            modelo.__table__.create(conn, checkfirst=True)
+
+
+def _agregados_vendas():
+    from app.vendas import garantir_tabelas_vendas
+    garantir_tabelas_vendas()
+
+
+def _colunas_imagem_produtos():
+    from app.imagens import garantir_colunas_imagem
+    garantir_colunas_imagem()
+
+
+def _versao_catalogo_imagem():
+    # A publicação de uma imagem muda a página do catálogo: o ETag precisa mudar junto
+    from app.respostas import recriar_trigger_versao_catalogo
+    recriar_trigger_versao_catalogo()
+
+
+MIGRACOES = [
+    (1, 'tabelas dos modelos', _tabelas_dos_modelos),
+    (2, 'coluna sku em produtos', _sku_produtos),
+    (3, 'chaves únicas de carrinho_compras', _chaves_carrinho),
+    (4, 'índices declarados nos modelos', _indices_dos_modelos),
+    (5, 'índice FTS5 da busca', _indice_busca),
+    (6, 'versão do catálogo (ETag)', _versao_catalogo),
+    (7, 'tabelas de arquivo de pedidos', _tabelas_arquivo_pedidos),
+    (8, 'índice de carrinho_compras por cliente e data_adicao', _indices_dos_modelos),
+    (9, 'agregados de vendas (relatórios)', _agregados_vendas),
+    (10, 'colunas de imagem em produtos', _colunas_imagem_produtos),
+    (11, 'versão do catálogo muda com a imagem do produto', _versao_catalogo_imagem),
+]
+VERSAO_ESQUEMA = MIGRACOES[-1][0]
+
+
+def versao_atual():
+    """Maior versão aplicada no banco (0 se esquema_versao ainda não existe)."""
+    with db.engine.connect() as conn:
+        existe = conn.execute(text(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'esquema_versao'"
+        )).first()
+        if not existe:
+            return 0
+        return conn.execute(text('SELECT COALESCE(MAX(versao), 0) FROM esquema_versao')).scalar()
+
+
+def migrar(ate=None, progresso=None):
+    """Aplica as migrações pendentes (até a versão `ate`); retorna as versões aplicadas."""
+    with db.engine.begin() as conn:
+        conn.execute(text(DDL_ESQUEMA_VERSAO))
+    atual = versao_atual()
+
+    aplicadas = []
+    for versao, descricao, funcao in MIGRACOES:
+        if versao <= atual or (ate is not None and versao > ate):
+            continue
+        if progresso:
+            progresso(versao, descricao)
+        funcao()
+        db.session.commit()
+        # OR IGNORE: outro processo pode ter aplicado a mesma migração em paralelo
+        db.session.execute(text(
+            'INSERT OR IGNORE INTO esquema_versao (versao, descricao, aplicada_em) VALUES (:versao, :descricao, :agora)'
+        ), {'versao': versao, 'descricao': descricao, 'agora': datetime.utcnow().isoformat(timespec='seconds')})
+        db.session.commit()
+        aplicadas.append(versao)
+    return aplicadas
+
+
+def _tabela_existe(nome):
+    return db.session.execute(
+        text("SELECT 1 FROM sqlite_master WHERE type IN ('table', 'view') AND name = :nome"), {'nome': nome}
+    ).first() is not None
+
+
+def verificar_esquema(app):
+    """
+    Verificação feita no create_app: migra (ESQUEMA_MIGRAR_AO_INICIAR) ou
+    registra a pendência em app.extensions['esquema_pendente'].
+    """
+    atual = versao_atual()
+    if atual < VERSAO_ESQUEMA and app.config['ESQUEMA_MIGRAR_AO_INICIAR']:
+        migrar()
+        atual = VERSAO_ESQUEMA
+
+    if atual < VERSAO_ESQUEMA:
+        app.extensions['esquema_pendente'] = (atual, VERSAO_ESQUEMA)
+        logger.error('Esquema do banco na versão %s, a aplicação requer a %s: '
+                     'execute `flask --app run:app esquema migrar`', atual, VERSAO_ESQUEMA)
+    else:
+        app.extensions['esquema_pendente'] = None
+        if atual > VERSAO_ESQUEMA:
+            logger.warning('Esquema do banco (versão %s) é mais novo que a aplicação (%s)', atual, VERSAO_ESQUEMA)
+
+    app.extensions['busca_fts'] = _tabela_existe('produtos_fts')
+    db.session.remove()
+
+
+def exigir_esquema_atualizado(app):
+    """Levanta EsquemaDesatualizado se o create_app encontrou migrações pendentes."""
+    pendente = app.extensions.get('esquema_pendente')
+    if pendente:
+        atual, esperada = pendente
+        raise EsquemaDesatualizado(
+            f'Esquema do banco na versão {atual}, a aplicação requer a {esperada}: '
+            'execute `flask --app run:app esquema migrar`')
+
+
+# ==================== COMANDOS (flask esquema ...) ====================
+
+esquema_cli = AppGroup('esquema', help='Versão do esquema do banco e migrações.')
+
+
+@esquema_cli.command('migrar')
+@click.option('--ate', type=int, default=None, help='Para na versão informada.')
+@with_appcontext
+def comando_migrar(ate):
+    """Aplica as migrações pendentes."""
+    aplicadas = migrar(ate, progresso=lambda versao, descricao: click.echo(f'{versao}: {descricao}'))
+    if aplicadas:
+        click.echo(f'{len(aplicadas)} migração(ões) aplicada(s); esquema na versão {versao_atual()}.')
+    else:
+        click.echo(f'Nada a fazer: esquema na versão {versao_atual()}.')
+
+
+@esquema_cli.command('versao')
+@with_appcontext
+def comando_versao():
+    """Mostra a versão do esquema e as migrações pendentes."""
+    atual = versao_atual()
+    click.echo(f'Banco: versão {atual}  Aplicação: versão {VERSAO_ESQUEMA}')
+    for versao, descricao, _ in MIGRACOES:
+        if versao > atual:
+            click.echo(f'  pendente {versao}: {descricao}')
@@ -1,6 +1,6 @@
 from app import db
 from datetime import datetime
-from werkzeug.security import generate_password_hash, check_password_hash
+from app.senhas import SenhasSobrecarregadas, gerar_hash_senha, hash_desatualizado, verificar_hash_senha
 
 class Cliente(db.Model):
     """Modelo de Cliente"""
@@ -18,12 +18,25 @@ class Cliente(db.Model):
     pedidos = db.relationship('Pedido', backref='cliente', lazy=True, cascade='all, delete-orphan')
     
     def set_senha(self, senha):
-        """Hash da senha e armazena"""
-        self.senha_hash = generate_password_hash(senha)
+        """Hash da senha e armazena (pode levantar SenhasSobrecarregadas)"""
+        self.senha_hash = gerar_hash_senha(senha)
     
     def verificar_senha(self, senha):
-        """Verifica se a senha está correta"""
-        return check_password_hash(self.senha_hash, senha)
+        """Verifica se a senha está correta (pode levantar SenhasSobrecarregadas)"""
+        return verificar_hash_senha(self.senha_hash, senha)
+    
+    def atualizar_hash_senha(self, senha):
+        """
+        Refaz o hash se ele usa parâmetros diferentes de SENHA_METODO.
+        Chamado após um login bem-sucedido; retorna True se o hash mudou.
+        """
+        if not hash_desatualizado(self.senha_hash):
+            return False
+        try:
+            self.set_senha(senha)
+        except SenhasSobrecarregadas:
+            return False  # tenta de novo no próximo login
+        return True
     
     def __repr__(self):
         return f'<Cliente {self.email}>'
@@ -34,11 +47,15 @@ class Produto(db.Model):
     __tablename__ = 'produtos'
     
     id = db.Column(db.Integer, primary_key=True)
-    nome = db.Column(db.String(120), nullable=False)
+    sku = db.Column(db.String(64), unique=True, index=True)  # chave estável para importação/exportação
+    nome = db.Column(db.String(120), nullable=False, index=True)
     descricao = db.Column(db.Text)
-    preco = db.Column(db.Float, nullable=False)
+    preco = db.Column(db.Float, nullable=False, index=True)
     estoque = db.Column(db.Integer, default=0)
-    data_criacao = db.Column(db.DateTime, default=datetime.utcnow)
+    data_criacao = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    # Hash do conteúdo da imagem (app/imagens.py): o original recebido e o que tem derivados publicados
+    imagem_original = db.Column(db.String(32))
+    imagem = db.Column(db.String(32))
     
     # Relacionamentos
     itens_pedido = db.relationship('ItemPedido', backref='produto', lazy=True, cascade='all, delete-orphan')
@@ -58,6 +75,11 @@ class Pedido(db.Model):
     total = db.Column(db.Float, nullable=False)
     status = db.Column(db.String(50), default='pendente')  # pendente, confirmado, enviado, entregue, cancelado
     
+    # Histórico do cliente ordenado por data (perfil)
+    __table_args__ = (
+        db.Index('ix_pedidos_cliente_data', 'cliente_id', 'data_pedido'),
+    )
+    
     # Relacionamentos
     itens = db.relationship('ItemPedido', backref='pedido', lazy=True, cascade='all, delete-orphan')
     pagamento = db.relationship('Pagamento', backref='pedido', uselist=False, lazy=True, cascade='all, delete-orphan')
@@ -71,7 +93,7 @@ class ItemPedido(db.Model):
     __tablename__ = 'itens_pedido'
     
     id = db.Column(db.Integer, primary_key=True)
-    pedido_id = db.Column(db.Integer, db.ForeignKey('pedidos.id'), nullable=False)
+    pedido_id = db.Column(db.Integer, db.ForeignKey('pedidos.id'), nullable=False, index=True)
     produto_id = db.Column(db.Integer, db.ForeignKey('produtos.id'), nullable=False)
     quantidade = db.Column(db.Integer, nullable=False)
     preco_unitario = db.Column(db.Float, nullable=False)
@@ -94,6 +116,122 @@ class Pagamento(db.Model):
         return f'<Pagamento {self.id}>'
 
 
+# ==================== ARQUIVO DE PEDIDOS ====================
+# Pedidos entregues/cancelados antigos são movidos para estas tabelas (app/arquivamento.py).
+# Os atributos usados pelos templates são os mesmos de Pedido, ItemPedido e Pagamento.
+
+class PedidoArquivado(db.Model):
+    """Modelo de Pedido arquivado (mantém o id original do pedido)"""
+    __tablename__ = 'pedidos_arquivo'
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    cliente_id = db.Column(db.Integer, db.ForeignKey('clientes.id'), nullable=False)
+    data_pedido = db.Column(db.DateTime)
+    total = db.Column(db.Float, nullable=False)
+    status = db.Column(db.String(50))
+    arquivado_em = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index('ix_pedidos_arquivo_cliente_data', 'cliente_id', 'data_pedido'),
+    )
+
+    # Relacionamentos
+    cliente = db.relationship('Cliente')
+    itens = db.relationship('ItemPedidoArquivado', backref='pedido', lazy=True, cascade='all, delete-orphan')
+    pagamento = db.relationship('PagamentoArquivado', backref='pedido', uselist=False, lazy=True, cascade='all, delete-orphan')
+
+    def __repr__(self):
+        return f'<PedidoArquivado {self.id}>'
+
+
+class ItemPedidoArquivado(db.Model):
+    """Modelo de Item de Pedido arquivado"""
+    __tablename__ = 'itens_pedido_arquivo'
+
+    id = db.Column(db.Integer, primary_key=True)
+    pedido_id = db.Column(db.Integer, db.ForeignKey('pedidos_arquivo.id'), nullable=False, index=True)
+    produto_id = db.Column(db.Integer, db.ForeignKey('produtos.id'), nullable=False)
+    quantidade = db.Column(db.Integer, nullable=False)
+    preco_unitario = db.Column(db.Float, nullable=False)
+
+    produto = db.relationship('Produto')
+
+    def __repr__(self):
+        return f'<ItemPedidoArquivado {self.id}>'
+
+
+class PagamentoArquivado(db.Model):
+    """Modelo de Pagamento arquivado"""
+    __tablename__ = 'pagamentos_arquivo'
+
+    id = db.Column(db.Integer, primary_key=True)
+    pedido_id = db.Column(db.Integer, db.ForeignKey('pedidos_arquivo.id'), nullable=False, unique=True)
+    metodo = db.Column(db.String(50), nullable=False)
+    status = db.Column(db.String(50))
+    data_pagamento = db.Column(db.DateTime)
+
+    def __repr__(self):
+        return f'<PagamentoArquivado {self.id}>'
+
+
+# ==================== AGREGADOS DE VENDAS ====================
+# Mantidos pelo checkout e pelo cancelamento de pedidos (app/vendas.py); os relatórios leem só estas tabelas.
+
+class VendaDiaria(db.Model):
+    """Pedidos e receita por dia (pedidos cancelados não entram)"""
+    __tablename__ = 'vendas_diarias'
+
+    dia = db.Column(db.Date, primary_key=True)
+    pedidos = db.Column(db.Integer, nullable=False, default=0)
+    receita = db.Column(db.Float, nullable=False, default=0.0)
+
+    def __repr__(self):
+        return f'<VendaDiaria {self.dia}>'
+
+
+class VendaProdutoDiaria(db.Model):
+    """Unidades vendidas e receita por produto e dia"""
+    __tablename__ = 'vendas_produto_diarias'
+
+    dia = db.Column(db.Date, primary_key=True)
+    produto_id = db.Column(db.Integer, db.ForeignKey('produtos.id'), primary_key=True)
+    unidades = db.Column(db.Integer, nullable=False, default=0)
+    receita = db.Column(db.Float, nullable=False, default=0.0)
+
+    # Série de demanda de um produto
+    __table_args__ = (
+        db.Index('ix_vendas_produto_diarias_produto_dia', 'produto_id', 'dia'),
+    )
+
+    def __repr__(self):
+        return f'<VendaProdutoDiaria {self.dia} {self.produto_id}>'
+
+
+class TotalCliente(db.Model):
+    """Pedidos e gasto acumulados por cliente"""
+    __tablename__ = 'totais_clientes'
+
+    cliente_id = db.Column(db.Integer, db.ForeignKey('clientes.id'), primary_key=True)
+    pedidos = db.Column(db.Integer, nullable=False, default=0)
+    gasto = db.Column(db.Float, nullable=False, default=0.0, index=True)  # melhores clientes
+
+    def __repr__(self):
+        return f'<TotalCliente {self.cliente_id}>'
+
+
+class ReconstrucaoVendas(db.Model):
+    """Progresso da reconstrução dos agregados em andamento (no máximo uma linha)"""
+    __tablename__ = 'vendas_reconstrucao'
+
+    id = db.Column(db.Integer, primary_key=True)
+    limite = db.Column(db.Integer, nullable=False)  # maior id de pedido recontado pela reconstrução
+    processado_ate = db.Column(db.Integer, nullable=False, default=0)
+    iniciada_em = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<ReconstrucaoVendas {self.processado_ate}/{self.limite}>'
+
+
 class CarrinhoCompras(db.Model):
     """Modelo de Carrinho de Compras"""
     __tablename__ = 'carrinho_compras'
@@ -105,5 +243,37 @@ class CarrinhoCompras(db.Model):
     data_adicao = db.Column(db.DateTime, default=datetime.utcnow)
     sessao_id = db.Column(db.String(255))  # Para rastrear carrinhos de usuários não logados
     
+    # Um produto aparece no máximo uma vez por carrinho (permite upsert com ON CONFLICT)
+    __table_args__ = (
+        db.Index('uq_carrinho_cliente_produto', 'cliente_id', 'produto_id', unique=True),
+        db.Index('uq_carrinho_sessao_produto', 'sessao_id', 'produto_id', unique=True),
+        db.Index('ix_carrinho_cliente_data', 'cliente_id', 'data_adicao'),  # limpeza de carrinhos abandonados
+    )
+    
     def __repr__(self):
         return f'<CarrinhoCompras {self.id}>'
+
+
+class Tarefa(db.Model):
+    """Modelo de Tarefa da fila de processamento em segundo plano"""
+    __tablename__ = 'tarefas'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    tipo = db.Column(db.String(80), nullable=False)
+    payload = db.Column(db.Text, nullable=False, default='{}')  # argumentos em JSON
+    status = db.Column(db.String(20), nullable=False, default='pendente')  # pendente, executando, concluida, falha
+    tentativas = db.Column(db.Integer, nullable=False, default=0)
+    max_tentativas = db.Column(db.Integer, nullable=False, default=5)
+    disponivel_em = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)  # próxima execução / fim da reserva
+    data_criacao = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    iniciada_em = db.Column(db.DateTime)
+    concluida_em = db.Column(db.DateTime)
+    erro = db.Column(db.Text)
+    
+    # Busca da próxima tarefa pronta para execução
+    __table_args__ = (
+        db.Index('ix_tarefas_status_disponivel', 'status', 'disponivel_em'),
+    )
+    
+    def __repr__(self):
+        return f'<Tarefa {self.id} {self.tipo}>'
@@ -1,95 +1,272 @@
-from flask import session, flash
+import logging
+import random
+import time
+from datetime import datetime
+
+from flask import session, flash, current_app, abort
 from app import db
-from app.models import Cliente, Produto, Pedido, ItemPedido, Pagamento
-from app.carrinho import get_carrinho_itens, limpar_carrinho, calcular_total_carrinho
-from sqlalchemy.exc import SQLAlchemyError
+from app.models import Cliente, Produto, Pedido, ItemPedido, Pagamento, PedidoArquivado, ItemPedidoArquivado
+from app.carrinho import get_carrinho_itens, limpar_carrinho
+from app.catalogo import PaginaCatalogo, invalidar_produtos, invalidar_produtos_apos_commit
+from app.fila import despachar, enfileirar, tarefa
+from app.vendas import estornar_venda, registrar_venda
+from sqlalchemy import case, insert, select, update
+from sqlalchemy.exc import SQLAlchemyError, OperationalError
+from sqlalchemy.orm import joinedload, selectinload
 
-def finalizar_pedido(cliente_id, metodo_pagamento):
+logger = logging.getLogger('app.pedidos')
+
+def _banco_bloqueado(erro):
+    """Indica se o erro é uma contenção de lock do SQLite (passível de nova tentativa)."""
+    mensagem = str(getattr(erro, 'orig', erro)).lower()
+    return 'database is locked' in mensagem or 'database is busy' in mensagem
+
+def _reservar_estoque(quantidades):
     """
-    Processa a finalização do pedido:
-    1. Cria um novo Pedido.
-    2. Move os itens do Carrinho para ItensPedido.
-    3. Atualiza o estoque dos produtos (decrementa).
-    4. Cria um registro de Pagamento.
-    5. Limpa o carrinho.
+    Decrementa o estoque de todos os produtos do pedido com um único UPDATE
+    condicional (estoque >= quantidade). Retorna True somente se todas as
+    linhas foram atualizadas; caso contrário a transação deve ser desfeita.
     """
-    cliente = Cliente.query.get(cliente_id)
-    if not cliente:
-        flash('Cliente não encontrado.', 'danger')
-        return None
+    quantidade_pedida = case(quantidades, value=Produto.id)
+    resultado = db.session.execute(
+        update(Produto)
+        .where(Produto.id.in_(list(quantidades)), Produto.estoque >= quantidade_pedida)
+        .values(estoque=Produto.estoque - quantidade_pedida)
+        .execution_options(synchronize_session=False)
+    )
+    return resultado.rowcount == len(quantidades)
 
+def _finalizar_pedido(cliente_id, metodo_pagamento):
+    """Uma tentativa de checkout, inteira em uma única transação."""
     itens_carrinho = get_carrinho_itens(cliente_id=cliente_id)
     if not itens_carrinho:
         flash('Seu carrinho está vazio.', 'warning')
         return None
 
-    total_pedido = calcular_total_carrinho(itens_carrinho)
-    
-    # 1. Cria um novo Pedido
+    quantidades = {}
+    for item in itens_carrinho:
+        quantidades[item.produto_id] = quantidades.get(item.produto_id, 0) + item.quantidade
+
+    # 1. Reserva o estoque de todo o pedido de forma atômica (tudo ou nada)
+    if not _reservar_estoque(quantidades):
+        db.session.rollback()
+        produto = (Produto.query
+                   .filter(Produto.id.in_(list(quantidades)),
+                           Produto.estoque < case(quantidades, value=Produto.id))
+                   .first())
+        if produto:
+            flash(f'Estoque insuficiente para {produto.nome}. Disponível: {produto.estoque}', 'danger')
+        else:
+            flash('Estoque insuficiente para um dos produtos do carrinho.', 'danger')
+        return None
+
+    # 2. Cria o Pedido e 4. o registro de Pagamento, ambos pendentes até a
+    #    tarefa processar_pagamento rodar no worker
     novo_pedido = Pedido(
         cliente_id=cliente_id,
-        total=total_pedido,
-        status='pendente' # O status será atualizado após o pagamento
+        total=sum(item.produto.preco * item.quantidade for item in itens_carrinho),
+        status='pendente',
+        pagamento=Pagamento(
+            metodo=metodo_pagamento,
+            status='pendente'
+        )
     )
     db.session.add(novo_pedido)
     db.session.flush() # Para obter o ID do pedido antes do commit
 
-    itens_pedido_list = []
-    
-    try:
-        # 2. Move os itens do Carrinho para ItensPedido e 3. Atualiza o estoque
-        for item_carrinho in itens_carrinho:
-            produto = item_carrinho.produto
-            quantidade = item_carrinho.quantidade
-            
-            # Validação final de estoque
-            if produto.estoque < quantidade:
-                db.session.rollback()
-                flash(f'Estoque insuficiente para {produto.nome}. Disponível: {produto.estoque}', 'danger')
-                return None
-            
-            # Cria ItemPedido
-            item_pedido = ItemPedido(
-                pedido_id=novo_pedido.id,
-                produto_id=produto.id,
-                quantidade=quantidade,
-                preco_unitario=produto.preco # Preço no momento da compra
-            )
-            itens_pedido_list.append(item_pedido)
-            
-            # Atualiza o estoque (decrementa)
-            produto.estoque -= quantidade
-            db.session.add(produto)
-        
-        db.session.add_all(itens_pedido_list)
-        
-        # 4. Cria um registro de Pagamento (Simulado)
-        novo_pagamento = Pagamento(
-            pedido_id=novo_pedido.id,
-            metodo=metodo_pagamento,
-            status='aprovado' # Simulação de pagamento aprovado
-        )
-        db.session.add(novo_pagamento)
-        
-        # Atualiza o status do pedido para confirmado
-        novo_pedido.status = 'confirmado'
-        
-        # 5. Limpa o carrinho
-        limpar_carrinho(cliente_id=cliente_id)
-        
-        db.session.commit()
-        flash(f'Pedido #{novo_pedido.id} finalizado com sucesso! Pagamento aprovado.', 'success')
-        return novo_pedido
-        
-    except SQLAlchemyError as e:
-        db.session.rollback()
-        flash(f'Erro ao finalizar o pedido: {str(e)}', 'danger')
+    # 3. Move os itens do Carrinho para ItensPedido com um único INSERT de várias linhas
+    #    (o preço de cada item é o do momento da compra)
+    itens_pedido = [
+        {
+            'pedido_id': novo_pedido.id,
+            'produto_id': item.produto_id,
+            'quantidade': item.quantidade,
+            'preco_unitario': item.produto.preco,
+        }
+        for item in itens_carrinho
+    ]
+    db.session.execute(insert(ItemPedido), itens_pedido)
+
+    # Agregados dos relatórios de vendas (um upsert por tabela)
+    registrar_venda(novo_pedido, itens_pedido)
+
+    # 5. Limpa o carrinho (na mesma transação)
+    limpar_carrinho(cliente_id=cliente_id, commit=False)
+
+    # 6. Enfileira o processamento do pagamento (só fica visível com o commit)
+    enfileirar('processar_pagamento', pedido_id=novo_pedido.id)
+
+    db.session.commit()
+
+    # O UPDATE em massa não passa pelos eventos do ORM: invalida o cache manualmente
+    invalidar_produtos(quantidades)
+    despachar()
+    return novo_pedido
+
+def finalizar_pedido(cliente_id, metodo_pagamento):
+    """
+    Processa a finalização do pedido em uma única transação, com um número
+    fixo de instruções SQL independente da quantidade de itens:
+    1. Reserva o estoque de todos os itens com um UPDATE condicional (tudo ou nada).
+    2. Cria um novo Pedido.
+    3. Move os itens do Carrinho para ItensPedido.
+    4. Cria um registro de Pagamento.
+    5. Limpa o carrinho.
+    6. Enfileira o processamento do pagamento.
+    Os agregados de vendas (app/vendas.py) são atualizados na mesma transação.
+
+    O pedido é gravado como 'pendente' e a requisição retorna em seguida; a
+    confirmação do pagamento, as mudanças de status e a notificação rodam como
+    tarefas da fila (app/fila.py).
+
+    Em caso de contenção ("database is locked") a transação é desfeita e
+    repetida até CHECKOUT_MAX_TENTATIVAS vezes, com espera exponencial.
+    """
+    cliente = Cliente.query.get(cliente_id)
+    if not cliente:
+        flash('Cliente não encontrado.', 'danger')
         return None
 
-def get_pedidos_cliente(cliente_id):
-    """Retorna todos os pedidos de um cliente."""
-    return Pedido.query.filter_by(cliente_id=cliente_id).order_by(Pedido.data_pedido.desc()).all()
+    max_tentativas = current_app.config['CHECKOUT_MAX_TENTATIVAS']
+    espera_base = current_app.config['CHECKOUT_ESPERA_BASE']
+
+    for tentativa in range(1, max_tentativas + 1):
+        try:
+            novo_pedido = _finalizar_pedido(cliente_id, metodo_pagamento)
+            if novo_pedido:
+                flash(f'Pedido #{novo_pedido.id} recebido com sucesso! O pagamento está sendo processado.', 'success')
+            return novo_pedido
+        except OperationalError as e:
+            db.session.rollback()
+            if not _banco_bloqueado(e) or tentativa == max_tentativas:
+                flash(f'Erro ao finalizar o pedido: {str(e)}', 'danger')
+                return None
+            time.sleep(espera_base * (2 ** (tentativa - 1)) * random.uniform(0.5, 1.5))
+        except SQLAlchemyError as e:
+            db.session.rollback()
+            flash(f'Erro ao finalizar o pedido: {str(e)}', 'danger')
+            return None
+
+# ==================== TAREFAS PÓS-CHECKOUT ====================
+
+def _cobrar_pagamento(pagamento):
+    """Envia a cobrança ao provedor de pagamento (simulado: sempre aprova)."""
+    return 'aprovado'
+
+def _devolver_estoque(pedido):
+    """Devolve ao estoque os itens de um pedido cancelado com um único UPDATE atômico."""
+    quantidades = {}
+    for produto_id, quantidade in db.session.execute(
+            select(ItemPedido.produto_id, ItemPedido.quantidade).where(ItemPedido.pedido_id == pedido.id)):
+        quantidades[produto_id] = quantidades.get(produto_id, 0) + quantidade
+    if not quantidades:
+        return
+    db.session.execute(
+        update(Produto)
+        .where(Produto.id.in_(list(quantidades)))
+        .values(estoque=Produto.estoque + case(quantidades, value=Produto.id))
+        .execution_options(synchronize_session=False)
+    )
+    # O UPDATE em massa não passa pelos eventos do ORM: invalida o cache após o commit da tarefa
+    invalidar_produtos_apos_commit(quantidades)
+
+@tarefa('processar_pagamento')
+def processar_pagamento(pedido_id):
+    """Cobra o pagamento de um pedido pendente e atualiza os status (idempotente)."""
+    pedido = Pedido.query.options(joinedload(Pedido.pagamento)).get(pedido_id)
+    if pedido is None or pedido.status != 'pendente':
+        return
+
+    pedido.pagamento.status = _cobrar_pagamento(pedido.pagamento)
+    pedido.pagamento.data_pagamento = datetime.utcnow()
+    if pedido.pagamento.status == 'aprovado':
+        pedido.status = 'confirmado'
+    else:
+        pedido.status = 'cancelado'
+        _devolver_estoque(pedido)
+        estornar_venda(pedido)
+
+    enfileirar('notificar_pedido', pedido_id=pedido.id, status=pedido.status)
+
+@tarefa('notificar_pedido')
+def notificar_pedido(pedido_id, status):
+    """Avisa o cliente sobre a mudança de status do pedido (por ora apenas registra em log)."""
+    pedido = Pedido.query.options(joinedload(Pedido.cliente)).get(pedido_id)
+    if pedido is None:
+        return
+    logger.info('Pedido #%s %s: notificação para %s', pedido.id, status, pedido.cliente.email)
+
+def get_resumo_pedidos_cliente(cliente_id):
+    """
+    Retorna (total_pedidos, gasto_total) do cliente, somando os pedidos
+    arquivados, com uma única consulta agregada.
+    """
+    def agregados(modelo):
+        filtro = modelo.cliente_id == cliente_id
+        return (select(db.func.count(modelo.id)).where(filtro).scalar_subquery(),
+                select(db.func.coalesce(db.func.sum(modelo.total), 0.0)).where(filtro).scalar_subquery())
+
+    (contagem, soma), (contagem_arquivo, soma_arquivo) = agregados(Pedido), agregados(PedidoArquivado)
+    total_pedidos, gasto_total = db.session.execute(select(contagem + contagem_arquivo, soma + soma_arquivo)).one()
+    return total_pedidos, gasto_total
+
+def _pagina_historico(modelo, modelo_item, cliente_id, limite, deslocamento):
+    quantidade_itens = (select(db.func.count(modelo_item.id))
+                        .where(modelo_item.pedido_id == modelo.id)
+                        .correlate(modelo)
+                        .scalar_subquery())
+    linhas = (db.session.query(modelo, quantidade_itens)
+              .filter(modelo.cliente_id == cliente_id)
+              .order_by(modelo.data_pedido.desc(), modelo.id.desc())
+              .limit(limite)
+              .offset(deslocamento)
+              .all())
+    return [tuple(linha) for linha in linhas]
+
+def get_pedidos_cliente(cliente_id, page=1, per_page=10, total=None):
+    """
+    Retorna uma página dos pedidos de um cliente, do mais recente ao mais antigo.
+    Cada item é uma tupla (pedido, quantidade_de_itens), com a contagem de itens
+    calculada na mesma consulta. Se o total de pedidos já for conhecido (resumo),
+    ele é reaproveitado em vez de um novo COUNT.
+
+    Os pedidos arquivados vêm depois dos que estão em pedidos; o arquivo só é
+    consultado quando a página passa do fim da tabela principal.
+    """
+    if total is None:
+        total, _ = get_resumo_pedidos_cliente(cliente_id)
+
+    page = max(page, 1)
+    deslocamento = (page - 1) * per_page
+    itens = _pagina_historico(Pedido, ItemPedido, cliente_id, per_page, deslocamento)
+
+    faltam = per_page - len(itens)
+    if faltam and deslocamento + len(itens) < total:
+        if itens:
+            recentes = deslocamento + len(itens)
+        else:
+            recentes = db.session.query(db.func.count(Pedido.id)).filter(Pedido.cliente_id == cliente_id).scalar()
+        itens += _pagina_historico(PedidoArquivado, ItemPedidoArquivado, cliente_id,
+                                   faltam, max(deslocamento - recentes, 0))
+    return PaginaCatalogo(itens, page, per_page, total)
+
+def _consulta_detalhes(modelo, modelo_item, pedido_id, cliente_id):
+    return (modelo.query
+            .options(
+                selectinload(modelo.itens).joinedload(modelo_item.produto),
+                joinedload(modelo.pagamento),
+                joinedload(modelo.cliente),
+            )
+            .filter_by(id=pedido_id, cliente_id=cliente_id)
+            .first())
 
 def get_detalhes_pedido(pedido_id, cliente_id):
-    """Retorna os detalhes de um pedido específico, garantindo que pertença ao cliente."""
-    return Pedido.query.filter_by(id=pedido_id, cliente_id=cliente_id).first_or_404()
+    """
+    Retorna os detalhes de um pedido específico, garantindo que pertença ao
+    cliente; pedidos que não estão mais em pedidos são buscados no arquivo.
+    """
+    pedido = (_consulta_detalhes(Pedido, ItemPedido, pedido_id, cliente_id)
+              or _consulta_detalhes(PedidoArquivado, ItemPedidoArquivado, pedido_id, cliente_id))
+    if pedido is None:
+        abort(404)
+    return pedido
@@ -0,0 +1,189 @@
+"""
+Políticas de resposta HTTP: requisições condicionais, Cache-Control e compressão.
+
+Páginas do catálogo (vitrine, busca e detalhes de produto) servidas a
+visitantes anônimos recebem ETag e Last-Modified derivados da versão do
+catálogo. Essa versão é um contador mantido por triggers em produtos, então
+também muda com cargas em massa e baixas de estoque feitas fora do ORM.
+Quando o navegador revalida com If-None-Match/If-Modified-Since e nada
+mudou, a view nem é executada e a resposta é um 304 sem corpo. Páginas de
+clientes logados (ou com mensagens flash pendentes) não são cacheadas.
+
+Respostas de texto acima de COMPRESSAO_MIN_BYTES são comprimidas com
+brotli (se o pacote estiver instalado e o cliente aceitar) ou gzip.
+"""
+import gzip
+import hashlib
+import os
+from datetime import datetime, timezone
+from functools import wraps
+
+from flask import current_app, make_response, request, session
+from sqlalchemy import text
+from werkzeug.http import is_resource_modified
+
+from app import db
+
+try:
+    import brotli
+except ImportError:  # compressão brotli é opcional
+    brotli = None
+
+TIPOS_COMPRIMIVEIS = {
+    'text/html', 'text/css', 'text/plain', 'text/csv', 'text/javascript', 'application/javascript',
+    'application/json', 'application/x-ndjson', 'application/xml', 'image/svg+xml',
+}
+
+DDL_VERSAO_CATALOGO = [
+    """
+    CREATE TABLE IF NOT EXISTS catalogo_versao (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        versao INTEGER NOT NULL,
+        atualizado_em INTEGER NOT NULL
+    )
+    """,
+    """
+    INSERT OR IGNORE INTO catalogo_versao (id, versao, atualizado_em)
+    VALUES (1, 0, CAST(strftime('%s', 'now') AS INTEGER))
+    """,
+] + [
+    f"""
+    CREATE TRIGGER IF NOT EXISTS produtos_versao_{sufixo} AFTER {evento} ON produtos BEGIN
+        UPDATE catalogo_versao
+        SET versao = versao + 1, atualizado_em = CAST(strftime('%s', 'now') AS INTEGER)
+        WHERE id = 1;
+    END
+    """
+    for sufixo, evento in (('ai', 'INSERT'), ('ad', 'DELETE'), ('au', 'UPDATE OF nome, descricao, preco, estoque, imagem'))
+]
+
+
+def garantir_versao_catalogo():
+    """Cria a tabela catalogo_versao e os triggers que a incrementam, se não existirem."""
+    for ddl in DDL_VERSAO_CATALOGO:
+        db.session.execute(text(ddl))
+    db.session.commit()
+
+
+def recriar_trigger_versao_catalogo():
+    """Recria o trigger de UPDATE com a lista de colunas atual (bancos criados antes de produtos.imagem)."""
+    db.session.execute(text('DROP TRIGGER IF EXISTS produtos_versao_au'))
+    garantir_versao_catalogo()
+
+
+def get_versao_catalogo():
+    """Retorna (versao, datetime da última alteração) do catálogo."""
+    versao, atualizado_em = db.session.execute(
+        text('SELECT versao, atualizado_em FROM catalogo_versao WHERE id = 1')
+    ).one()
+    return versao, datetime.fromtimestamp(atualizado_em, timezone.utc)
+
+
+def _versao_templates(app):
+    """Hash do conteúdo dos templates: um deploy com HTML novo gera ETags novos."""
+    resumo = hashlib.sha1()
+    pasta = os.path.join(app.root_path, app.template_folder)
+    for raiz, diretorios, arquivos in os.walk(pasta):
+        diretorios.sort()
+        for nome in sorted(arquivos):
+            with open(os.path.join(raiz, nome), 'rb') as arquivo:
+                resumo.update(nome.encode() + arquivo.read())
+    return resumo.hexdigest()[:12]
+
+
+def _visitante_anonimo():
+    """Página igual para todos os visitantes: sem login e sem mensagens flash pendentes."""
+    return 'cliente_id' not in session and '_flashes' not in session
+
+
+def pagina_catalogo(view):
+    """
+    Decorador das páginas do catálogo: responde 304 quando o catálogo não
+    mudou desde a versão que o navegador já tem e define o Cache-Control.
+    """
+    @wraps(view)
+    def decorated_function(*args, **kwargs):
+        if not current_app.config['CACHE_HTTP_ATIVO'] or not _visitante_anonimo():
+            return view(*args, **kwargs)
+
+        versao, modificado_em = get_versao_catalogo()
+        etag = f'{current_app.extensions["versao_aplicacao"]}-{versao}'
+
+        if not is_resource_modified(request.environ, etag=etag, last_modified=modificado_em):
+            resposta = current_app.response_class(status=304)
+        else:
+            resposta = make_response(view(*args, **kwargs))
+            if resposta.status_code != 200:
+                return resposta
+
+        resposta.set_etag(etag, weak=True)
+        resposta.last_modified = modificado_em
+        resposta.cache_control.public = True
+        resposta.cache_control.max_age = current_app.config['CACHE_HTTP_MAX_AGE_CATALOGO']
+        resposta.cache_control.must_revalidate = True
+        return resposta
+    return decorated_function
+
+
+# ==================== COMPRESSÃO ====================
+
+def _escolher_codificacao():
+    aceitas = request.accept_encodings
+    if brotli is not None and aceitas['br']:
+        return 'br'
+    if aceitas['gzip']:
+        return 'gzip'
+    return None
+
+
+def _finalizar_resposta(resposta):
+    # Resposta que grava cookie nunca pode ficar em cache compartilhado
+    if resposta.cache_control.public and 'Set-Cookie' in resposta.headers:
+        resposta.cache_control.public = False
+        resposta.cache_control.private = True
+
+    config = current_app.config
+    if (not config['COMPRESSAO_ATIVA']
+            or resposta.mimetype not in TIPOS_COMPRIMIVEIS
+            or resposta.status_code < 200 or resposta.status_code in (204, 206, 304)
+            or 'Content-Encoding' in resposta.headers):
+        return resposta
+
+    if resposta.direct_passthrough:
+        # Arquivos estáticos: só os pequenos são lidos para a memória e comprimidos
+        if not resposta.content_length or resposta.content_length > config['COMPRESSAO_MAX_BYTES_ESTATICOS']:
+            return resposta
+        resposta.direct_passthrough = False
+    elif resposta.is_streamed:
+        return resposta
+
+    resposta.vary.add('Accept-Encoding')
+    codificacao = _escolher_codificacao()
+    if codificacao is None:
+        return resposta
+
+    dados = resposta.get_data()
+    if len(dados) < config['COMPRESSAO_MIN_BYTES']:
+        return resposta
+
+    if codificacao == 'br':
+        comprimido = brotli.compress(dados, quality=config['COMPRESSAO_QUALIDADE_BROTLI'])
+    else:
+        comprimido = gzip.compress(dados, compresslevel=config['COMPRESSAO_NIVEL_GZIP'], mtime=0)
+    if len(comprimido) >= len(dados):
+        return resposta
+
+    resposta.set_data(comprimido)
+    resposta.headers['Content-Encoding'] = codificacao
+    resposta.headers.pop('Accept-Ranges', None)
+    # O corpo comprimido é outra representação: o ETag passa a ser fraco
+    etag, fraco = resposta.get_etag()
+    if etag and not fraco:
+        resposta.set_etag(etag, weak=True)
+    return resposta
+
+
+def init_respostas(app):
+    """Registra a compressão e calcula a versão da aplicação usada nos ETags."""
+    app.extensions['versao_aplicacao'] = app.config.get('VERSAO_APLICACAO') or _versao_templates(app)
+    app.after_request(_finalizar_resposta)
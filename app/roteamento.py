@@ -0,0 +1,151 @@
+"""
+Roteamento de leituras do catálogo para um bind de leitura separado.
+
+Com BANCO_LEITURA as rotas marcadas com ``@somente_leitura`` (vitrine,
+busca, detalhes de produto e API do catálogo) executam os SELECTs no bind
+``leitura``; todo o resto (carrinho, checkout, perfil, fila, CLI) continua
+no primário. Assim a navegação usa um pool de conexões próprio e não
+disputa conexões nem locks com as escritas do checkout.
+
+    BANCO_LEITURA=somente_leitura   o mesmo arquivo SQLite aberto em modo
+                                    somente leitura (?mode=ro), sem atraso
+    BANCO_LEITURA=replica           DATABASE_URL_LEITURA, por exemplo uma
+                                    cópia local atualizada com
+                                    `flask banco replicar --intervalo 5`
+
+Leia o que você escreveu: mesmo em uma rota de leitura, a sessão do banco
+passa a usar o primário depois de qualquer escrita ou flush, e um navegador
+que gravou algo no primário (carrinho, checkout) lê do primário por
+BANCO_LEITURA_APOS_ESCRITA segundos, o atraso máximo esperado da réplica.
+
+Com BANCO_LEITURA=replica o que foi lido da réplica não é gravado no cache
+do catálogo: uma linha atrasada gravada logo após a invalidação ficaria no
+cache compartilhado até o TTL (veja leitura_na_replica).
+"""
+import os
+import sqlite3
+import time
+from functools import wraps
+
+import click
+from flask import current_app, g, has_request_context, session
+from flask.cli import AppGroup, with_appcontext
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.sql import CompoundSelect, Select, TextClause
+
+BIND_LEITURA = 'leitura'
+CHAVE_ESCRITA = '_escrita_em'  # na sessão do Flask: instante da última escrita do navegador
+
+
+def _eh_leitura(clause):
+    if isinstance(clause, (Select, CompoundSelect)):
+        return True
+    if isinstance(clause, TextClause):
+        return clause.text.lstrip()[:6].upper() in ('SELECT', 'WITH')
+    return False
+
+
+def _leitura_permitida():
+    if not has_request_context() or not g.get('banco_leitura'):
+        return False
+    escrita = session.get(CHAVE_ESCRITA)
+    return escrita is None or time.time() - escrita >= current_app.config['BANCO_LEITURA_APOS_ESCRITA']
+
+
+def leitura_na_replica():
+    """Indica se os SELECTs da requisição atual vão para a réplica (que pode estar atrasada)."""
+    from app import db
+    return (current_app.config['BANCO_LEITURA'] == 'replica' and BIND_LEITURA in db.engines
+            and not db.session.info.get('escreveu') and _leitura_permitida())
+
+
+class SessaoRoteada(Session):
+    """Sessão do Flask-SQLAlchemy que envia as leituras das rotas @somente_leitura ao bind de leitura."""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self._flushing and not self.info.get('escreveu'):
+            engines = self._db.engines
+            if BIND_LEITURA in engines and _eh_leitura(clause) and _leitura_permitida():
+                return engines[BIND_LEITURA]
+        if self._flushing or (clause is not None and not _eh_leitura(clause)):
+            # Daqui em diante esta sessão lê do primário (leia o que você escreveu)
+            self.info['escreveu'] = True
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+@event.listens_for(SessaoRoteada, 'after_commit')
+def _registrar_escrita(sessao):
+    if sessao.info.pop('escreveu', False) and has_request_context() and current_app.config['BANCO_LEITURA']:
+        session[CHAVE_ESCRITA] = time.time()
+
+
+@event.listens_for(SessaoRoteada, 'after_rollback')
+def _descartar_escrita(sessao):
+    sessao.info.pop('escreveu', None)
+
+
+def somente_leitura(view):
+    """Decorador das rotas que só leem o catálogo: os SELECTs vão para o bind de leitura."""
+    @wraps(view)
+    def decorated_function(*args, **kwargs):
+        g.banco_leitura = True
+        return view(*args, **kwargs)
+    return decorated_function
+
+
+def _caminho_sqlite(url, instance_path):
+    url = make_url(url)
+    if not url.drivername.startswith('sqlite') or url.database in (None, '', ':memory:'):
+        raise ValueError('BANCO_LEITURA requer um banco SQLite em arquivo')
+    caminho = url.database[5:] if url.query.get('uri') else url.database
+    # Caminhos relativos são relativos ao instance_path, como no Flask-SQLAlchemy
+    return caminho if os.path.isabs(caminho) else os.path.join(instance_path, caminho)
+
+
+def configurar_bind_leitura(app):
+    """Chamado antes do db.init_app: acrescenta o bind de leitura a SQLALCHEMY_BINDS."""
+    modo = app.config['BANCO_LEITURA']
+    if not modo:
+        return
+    if modo == 'somente_leitura':
+        caminho = _caminho_sqlite(app.config['SQLALCHEMY_DATABASE_URI'], app.instance_path)
+        url = f'sqlite:///file:{caminho}?mode=ro&uri=true'
+    elif modo == 'replica':
+        url = app.config.get('DATABASE_URL_LEITURA')
+        if not url:
+            raise ValueError('BANCO_LEITURA=replica requer DATABASE_URL_LEITURA')
+    else:
+        raise ValueError(f'BANCO_LEITURA inválido: {modo}')
+    app.config['SQLALCHEMY_BINDS'] = dict(app.config.get('SQLALCHEMY_BINDS') or {}, **{BIND_LEITURA: url})
+
+
+def replicar(origem, destino):
+    """Copia o banco primário para a réplica com a API de backup do SQLite; retorna os segundos gastos."""
+    inicio = time.perf_counter()
+    with sqlite3.connect(origem) as conexao_origem, sqlite3.connect(destino) as conexao_destino:
+        conexao_origem.backup(conexao_destino)
+    return time.perf_counter() - inicio
+
+
+# ==================== COMANDOS (flask banco ...) ====================
+
+banco_cli = AppGroup('banco', help='Bind de leitura e réplica local do banco.')
+
+
+@banco_cli.command('replicar')
+@click.option('--intervalo', type=float, default=None, help='Repete a cópia a cada N segundos.')
+@with_appcontext
+def comando_replicar(intervalo):
+    """Atualiza a réplica de DATABASE_URL_LEITURA a partir do banco primário (testes locais)."""
+    app = current_app._get_current_object()
+    if not app.config.get('DATABASE_URL_LEITURA'):
+        raise click.UsageError('Defina DATABASE_URL_LEITURA com o arquivo da réplica.')
+    origem = _caminho_sqlite(app.config['SQLALCHEMY_DATABASE_URI'], app.instance_path)
+    destino = _caminho_sqlite(app.config['DATABASE_URL_LEITURA'], app.instance_path)
+    while True:
+        click.echo(f'Réplica atualizada em {replicar(origem, destino):.2f}s: {destino}', err=True)
+        if not intervalo:
+            break
+        time.sleep(intervalo)
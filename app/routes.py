@@ -1,12 +1,24 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
-from flask import Blueprint, render_template, request, redirect, url_for, session, flash
+from flask import Blueprint, render_template, request, redirect, url_for, session, flash, abort, jsonify, current_app, send_from_directory
 from app import db
 from app.models import Cliente, Produto, Pedido
-from app.carrinho import adicionar_ao_carrinho, remover_do_carrinho, get_carrinho_itens, calcular_total_carrinho, migrar_carrinho_sessao_para_cliente
-from app.pedidos import finalizar_pedido, get_pedidos_cliente
+from app.carrinho import adicionar_ao_carrinho, atualizar_quantidade_carrinho, remover_do_carrinho, get_carrinho_itens, calcular_total_carrinho, migrar_carrinho_sessao_para_cliente
+from app.fila import estatisticas_fila
+from app.limites import limitar
+from app.pedidos import finalizar_pedido, get_pedidos_cliente, get_detalhes_pedido, get_resumo_pedidos_cliente
+from app.catalogo import get_pagina_produtos, get_pagina_produtos_keyset, get_produto, get_cache
+from app.busca import buscar_produtos
+from app.imagens import CACHE_IMUTAVEL, diretorio_imagens
+from app.respostas import pagina_catalogo
+from app.roteamento import somente_leitura
+from app.senhas import SenhasSobrecarregadas
+from app.vendas import demanda_produto, mais_vendidos, melhores_clientes, periodo_padrao, receita_por_dia
+from datetime import date
 from functools import wraps
+import hmac
+import re
 
 # Criar blueprints
 auth_bp = Blueprint('auth', __name__)
@@ -24,9 +36,32 @@ def login_required(f):
         return f(*args, **kwargs)
     return decorated_function
 
+ENDERECOS_LOCAIS = ('127.0.0.1', '::1', 'localhost')
+
+def _admin_autorizado():
+    token = current_app.config.get('ADMIN_TOKEN')
+    if token:
+        esquema, _, enviado = request.headers.get('Authorization', '').partition(' ')
+        if esquema.lower() == 'bearer' and hmac.compare_digest(enviado.encode(), token.encode()):
+            return True
+    return current_app.config['ADMIN_LOCAL_SEM_TOKEN'] and request.remote_addr in ENDERECOS_LOCAIS
+
+def somente_admin(f):
+    """
+    Decorador das rotas de monitoramento e relatórios: exige o ADMIN_TOKEN
+    (Authorization: Bearer) ou, com ADMIN_LOCAL_SEM_TOKEN, uma requisição de localhost
+    """
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if not _admin_autorizado():
+            abort(404)
+        return f(*args, **kwargs)
+    return decorated_function
+
 # ==================== ROTAS DE AUTENTICAÇÃO ====================
 
 @auth_bp.route('/cadastro', methods=['GET', 'POST'])
+@limitar('cadastro')
 def cadastro():
     """Rota para cadastro de novo cliente"""
     if request.method == 'POST':
@@ -53,7 +88,11 @@ def cadastro():
             return redirect(url_for('auth.cadastro'))
         
         novo_cliente = Cliente(nome=nome, email=email)
-        novo_cliente.set_senha(senha)
+        try:
+            novo_cliente.set_senha(senha)
+        except SenhasSobrecarregadas:
+            flash('Muitas solicitações no momento. Tente novamente em instantes.', 'warning')
+            return render_template('cadastro.html'), 503, {'Retry-After': '1'}
         
         try:
             db.session.add(novo_cliente)
@@ -69,6 +108,7 @@ def cadastro():
 
 
 @auth_bp.route('/login', methods=['GET', 'POST'])
+@limitar('login')
 def login():
     """Rota para login de cliente"""
     if request.method == 'POST':
@@ -81,7 +121,17 @@ def login():
         
         cliente = Cliente.query.filter_by(email=email).first()
         
-        if cliente and cliente.verificar_senha(senha):
+        try:
+            senha_correta = cliente is not None and cliente.verificar_senha(senha)
+        except SenhasSobrecarregadas:
+            flash('Muitas solicitações de login no momento. Tente novamente em instantes.', 'warning')
+            return render_template('login.html'), 503, {'Retry-After': '1'}
+        
+        if senha_correta:
+            # Hash com parâmetros antigos de SENHA_METODO: regrava com os atuais
+            if cliente.atualizar_hash_senha(senha):
+                db.session.commit()
+            
             session['cliente_id'] = cliente.id
             session['cliente_nome'] = cliente.nome
             session['cliente_email'] = cliente.email
@@ -109,17 +159,40 @@ def logout():
 # ==================== ROTAS PRINCIPAIS ====================
 
 @main_bp.route('/')
+@somente_leitura
+@pagina_catalogo
 def index():
     """Página inicial - Lista de produtos"""
+    if current_app.config['CATALOGO_PAGINACAO'] == 'keyset':
+        cursor = request.args.get('cursor')
+        ordem = request.args.get('ordem', 'id')
+        produtos = get_pagina_produtos_keyset(cursor, ordem=ordem, per_page=12)
+        return render_template('index.html', produtos=produtos)
+
     page = request.args.get('page', 1, type=int)
-    produtos = Produto.query.paginate(page=page, per_page=12)
+    produtos = get_pagina_produtos(page, per_page=12)
     return render_template('index.html', produtos=produtos)
 
 
+@main_bp.route('/busca')
+@somente_leitura
+@pagina_catalogo
+def busca():
+    """Busca de produtos por nome e descrição (FTS5, ordenada por relevância)"""
+    termo = request.args.get('q', '').strip()
+    page = request.args.get('page', 1, type=int)
+    resultados = buscar_produtos(termo, page=page, per_page=12)
+    return render_template('busca.html', resultados=resultados)
+
+
 @main_bp.route('/produto/<int:produto_id>')
+@somente_leitura
+@pagina_catalogo
 def detalhes_produto(produto_id):
     """Página de detalhes do produto"""
-    produto = Produto.query.get_or_404(produto_id)
+    produto = get_produto(produto_id)
+    if produto is None:
+        abort(404)
     return render_template('detalhes_produto.html', produto=produto)
 
 
@@ -145,11 +218,15 @@ def perfil():
         
         return redirect(url_for('main.perfil'))
 
-    pedidos = get_pedidos_cliente(cliente.id)
-    return render_template('perfil.html', cliente=cliente, pedidos=pedidos)
+    page = request.args.get('page', 1, type=int)
+    total_pedidos, gasto_total = get_resumo_pedidos_cliente(cliente.id)
+    pedidos = get_pedidos_cliente(cliente.id, page=page, per_page=10, total=total_pedidos)
+    return render_template('perfil.html', cliente=cliente, pedidos=pedidos,
+                           total_pedidos=total_pedidos, gasto_total=gasto_total)
 
 
 @main_bp.route('/adicionar_carrinho/<int:produto_id>', methods=['POST'])
+@limitar('carrinho')
 def adicionar_carrinho(produto_id):
     """Adiciona um produto ao carrinho."""
     quantidade = request.form.get('quantidade', 1, type=int)
@@ -157,10 +234,23 @@ def adicionar_carrinho(produto_id):
     return redirect(url_for('main.carrinho'))
 
 
-@main_bp.route('/remover_carrinho/<int:item_carrinho_id>', methods=['POST'])
-def remover_carrinho(item_carrinho_id):
-    """Remove um item do carrinho."""
-    remover_do_carrinho(item_carrinho_id)
+@main_bp.route('/atualizar_carrinho/<int:produto_id>', methods=['POST'])
+@limitar('carrinho')
+def atualizar_carrinho(produto_id):
+    """Altera a quantidade de um produto no carrinho."""
+    quantidade = request.form.get('quantidade', type=int)
+    if quantidade is None:
+        flash('Quantidade inválida.', 'danger')
+    else:
+        atualizar_quantidade_carrinho(produto_id, quantidade)
+    return redirect(url_for('main.carrinho'))
+
+
+@main_bp.route('/remover_carrinho/<int:produto_id>', methods=['POST'])
+@limitar('carrinho')
+def remover_carrinho(produto_id):
+    """Remove um produto do carrinho."""
+    remover_do_carrinho(produto_id)
     return redirect(url_for('main.carrinho'))
 
 
@@ -169,17 +259,17 @@ def carrinho():
     """Página do carrinho de compras."""
     cliente_id = session.get('cliente_id')
     itens_carrinho = get_carrinho_itens(cliente_id)
-    total = calcular_total_carrinho(itens_carrinho)
+    total = calcular_total_carrinho(cliente_id)
     return render_template('carrinho.html', itens_carrinho=itens_carrinho, total=total)
 
 
 @main_bp.route('/checkout', methods=['GET', 'POST'])
 @login_required
+@limitar('checkout')
 def checkout():
     """Página de finalização de pedido."""
     cliente_id = session.get('cliente_id')
     itens_carrinho = get_carrinho_itens(cliente_id)
-    total = calcular_total_carrinho(itens_carrinho)
 
     if not itens_carrinho:
         flash('Seu carrinho está vazio. Adicione produtos para finalizar a compra.', 'warning')
@@ -199,6 +289,7 @@ def checkout():
         else:
             return redirect(url_for('main.carrinho'))
 
+    total = calcular_total_carrinho(cliente_id)
     cliente = Cliente.query.get(cliente_id)
     return render_template('checkout.html', itens_carrinho=itens_carrinho, total=total, cliente=cliente)
 
@@ -219,14 +310,132 @@ def pedido_confirmado(pedido_id):
 @login_required
 def detalhes_pedido(pedido_id):
     """Página de detalhes de um pedido específico."""
-    pedido = Pedido.query.get_or_404(pedido_id)
-    if pedido.cliente_id != session.get('cliente_id'):
-        flash('Você não tem permissão para visualizar este pedido.', 'danger')
-        return redirect(url_for('main.perfil'))
-    
+    pedido = get_detalhes_pedido(pedido_id, session.get('cliente_id'))
     return render_template('detalhes_pedido.html', pedido=pedido)
 
 
+# ==================== IMAGENS DE PRODUTOS ====================
+
+NOME_DERIVADO = re.compile(r'[0-9a-f]{32}-[0-9]+\.jpg')
+
+@main_bp.route('/imagens/<nome>')
+def imagem(nome):
+    """Derivado de imagem de produto: o nome é o hash do conteúdo, então o cache nunca expira"""
+    if not NOME_DERIVADO.fullmatch(nome):
+        abort(404)
+    resposta = send_from_directory(diretorio_imagens(), nome, max_age=31536000)
+    resposta.headers['Cache-Control'] = CACHE_IMUTAVEL
+    return resposta
+
+
+# ==================== ROTAS DE MONITORAMENTO ====================
+
+@main_bp.route('/_stats/cache')
+@somente_admin
+def stats_cache():
+    """Contadores do cache do catálogo (hits, misses, invalidações, ocupação)"""
+    cache = get_cache()
+    if cache is None:
+        return jsonify({'ativo': False})
+    estatisticas = cache.estatisticas()
+    consultas = estatisticas['hits'] + estatisticas['misses']
+    estatisticas['taxa_acerto'] = round(estatisticas['hits'] / consultas, 4) if consultas else 0.0
+    return jsonify(dict(estatisticas, ativo=True))
+
+
+@main_bp.route('/_stats/fragmentos')
+@somente_admin
+def stats_fragmentos():
+    """Acertos do cache de fragmentos de template e tempo de renderização economizado"""
+    cache = current_app.extensions.get('cache_fragmentos')
+    if cache is None:
+        return jsonify({'ativo': False})
+    estatisticas = cache.estatisticas()
+    consultas = estatisticas['hits'] + estatisticas['misses']
+    estatisticas['taxa_acerto'] = round(estatisticas['hits'] / consultas, 4) if consultas else 0.0
+    return jsonify(dict(estatisticas, ativo=True))
+
+@main_bp.route('/_stats/fila')
+@somente_admin
+def stats_fila():
+    """Profundidade e latência da fila de tarefas pós-checkout"""
+    return jsonify(estatisticas_fila())
+
+
+@main_bp.route('/_stats/limites')
+@somente_admin
+def stats_limites():
+    """Decisões do limitador por regra (permitidas e recusadas por motivo) e vagas em uso"""
+    limitador = current_app.extensions.get('limitador')
+    if limitador is None:
+        return jsonify({'ativo': False})
+    return jsonify(dict(limitador.estatisticas(), ativo=True))
+
+
+# ==================== ROTAS DE RELATÓRIOS ====================
+# Leem só os agregados de vendas (app/vendas.py), nunca pedidos/itens_pedido.
+
+def _periodo_relatorio():
+    """Período ?de=AAAA-MM-DD&ate=AAAA-MM-DD (padrão: últimos 30 dias); 400 se inválido."""
+    de, ate = periodo_padrao()
+    try:
+        de = date.fromisoformat(request.args['de']) if request.args.get('de') else de
+        ate = date.fromisoformat(request.args['ate']) if request.args.get('ate') else ate
+    except ValueError:
+        abort(400)
+    if de > ate:
+        abort(400)
+    return de, ate
+
+def _limite_relatorio():
+    return min(max(request.args.get('limite', 10, type=int), 1), 100)
+
+@main_bp.route('/admin/relatorios/vendas')
+@somente_admin
+@somente_leitura
+def relatorio_vendas():
+    """Pedidos e receita por dia no período"""
+    de, ate = _periodo_relatorio()
+    dias = [{'dia': dia.isoformat(), 'pedidos': pedidos, 'receita': round(receita, 2)}
+            for dia, pedidos, receita in receita_por_dia(de, ate)]
+    return jsonify({
+        'de': de.isoformat(), 'ate': ate.isoformat(),
+        'pedidos': sum(d['pedidos'] for d in dias),
+        'receita': round(sum(d['receita'] for d in dias), 2),
+        'dias': dias,
+    })
+
+@main_bp.route('/admin/relatorios/produtos')
+@somente_admin
+@somente_leitura
+def relatorio_mais_vendidos():
+    """Produtos com mais unidades vendidas no período"""
+    de, ate = _periodo_relatorio()
+    produtos = [{'produto_id': produto_id, 'nome': nome, 'unidades': unidades, 'receita': round(receita, 2)}
+                for produto_id, nome, unidades, receita in mais_vendidos(de, ate, _limite_relatorio())]
+    return jsonify({'de': de.isoformat(), 'ate': ate.isoformat(), 'produtos': produtos})
+
+@main_bp.route('/admin/relatorios/produtos/<int:produto_id>')
+@somente_admin
+@somente_leitura
+def relatorio_demanda_produto(produto_id):
+    """Unidades vendidas por dia de um produto no período"""
+    de, ate = _periodo_relatorio()
+    dias = [{'dia': dia.isoformat(), 'unidades': unidades, 'receita': round(receita, 2)}
+            for dia, unidades, receita in demanda_produto(produto_id, de, ate)]
+    return jsonify({'produto_id': produto_id, 'de': de.isoformat(), 'ate': ate.isoformat(),
+                    'unidades': sum(d['unidades'] for d in dias), 'dias': dias})
+
+@main_bp.route('/admin/relatorios/clientes')
+@somente_admin
+@somente_leitura
+def relatorio_clientes():
+    """Clientes de maior gasto acumulado"""
+    clientes = [{'cliente_id': cliente_id, 'nome': nome, 'pedidos': pedidos, 'gasto': round(gasto, 2)}
+                for cliente_id, nome, pedidos, gasto in melhores_clientes(_limite_relatorio())]
+    return jsonify({'clientes': clientes})
+
+
 # ==================== ROTAS DE TESTE ====================
 
 @main_bp.route('/admin/seed')
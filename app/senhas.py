@@ -0,0 +1,132 @@
+"""
+Hash de senhas fora da thread da requisição.
+
+O cálculo do hash (scrypt/pbkdf2) é deliberadamente caro. Em vez de rodar
+na thread que atende a requisição, ele é enviado a um pool de processos
+pequeno (SENHA_PROCESSOS por worker do gunicorn), cujos processos rodam com
+prioridade reduzida (SENHA_NICE). Assim, um pico de logins não disputa a
+CPU em pé de igualdade com a navegação no catálogo. Com workers gthread, a
+thread que espera o hash também não ocupa o GIL e as outras threads do
+worker continuam atendendo. Os processos do pool são iniciados com spawn,
+sem herdar conexões nem locks do worker.
+
+A fila do pool é limitada: além dos hashes em execução, no máximo
+SENHA_MAX_PENDENTES esperam. Acima disso, SenhasSobrecarregadas é levantada
+na hora e a rota responde 503 em vez de acumular requisições.
+
+Os parâmetros do hash vêm de SENHA_METODO (formato do werkzeug, ex.:
+``scrypt:32768:8:1`` ou ``pbkdf2:sha256:600000``). Hashes gravados com
+parâmetros diferentes são refeitos no próximo login bem-sucedido
+(Cliente.atualizar_hash_senha).
+"""
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+from flask import current_app
+from werkzeug.security import DEFAULT_PBKDF2_ITERATIONS, check_password_hash, generate_password_hash
+
+
+class SenhasSobrecarregadas(RuntimeError):
+    """Fila de hashes cheia (ou hash demorando mais que SENHA_TIMEOUT)."""
+
+
+def normalizar_metodo(metodo):
+    """Completa os parâmetros omitidos com os padrões do werkzeug ('scrypt' -> 'scrypt:32768:8:1')."""
+    nome, *parametros = metodo.split(':')
+    if nome == 'scrypt':
+        padroes = ['32768', '8', '1']
+    elif nome == 'pbkdf2':
+        padroes = ['sha256', str(DEFAULT_PBKDF2_ITERATIONS)]
+    else:
+        raise ValueError(f'SENHA_METODO inválido: {metodo!r}')
+    return ':'.join([nome] + parametros + padroes[len(parametros):])
+
+
+class PoolSenhas:
+    """ProcessPoolExecutor com fila limitada, criado sob demanda em cada processo."""
+
+    def __init__(self, processos, max_pendentes, timeout, nice):
+        self.processos = processos
+        self.timeout = timeout
+        self.nice = nice
+        self._vagas = threading.BoundedSemaphore(processos + max_pendentes)
+        self._lock = threading.Lock()
+        self._executor = None
+        self._pid = None
+
+    def _obter_executor(self):
+        with self._lock:
+            # Depois de um fork (gunicorn --preload) o executor herdado não funciona
+            if self._executor is None or self._pid != os.getpid():
+                self._executor = ProcessPoolExecutor(
+                    self.processos,
+                    mp_context=multiprocessing.get_context('spawn'),
+                    initializer=os.nice,
+                    initargs=(self.nice,),
+                )
+                self._pid = os.getpid()
+            return self._executor
+
+    def _descartar_executor(self, executor):
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def executar(self, funcao, *args):
+        if not self._vagas.acquire(blocking=False):
+            raise SenhasSobrecarregadas('fila de hash de senhas cheia')
+
+        executor = self._obter_executor()
+        try:
+            futuro = executor.submit(funcao, *args)
+        except BrokenProcessPool:
+            self._vagas.release()
+            self._descartar_executor(executor)
+            return funcao(*args)
+        # A vaga só é liberada quando o hash termina, mesmo que a requisição desista antes
+        futuro.add_done_callback(lambda _: self._vagas.release())
+
+        try:
+            return futuro.result(timeout=self.timeout)
+        except TimeoutError:
+            raise SenhasSobrecarregadas(f'hash de senha levou mais de {self.timeout}s')
+        except BrokenProcessPool:
+            # Um processo do pool morreu: recria o pool na próxima chamada
+            self._descartar_executor(executor)
+            return funcao(*args)
+
+
+def _executar(funcao, *args):
+    pool = current_app.extensions.get('pool_senhas')
+    if pool is None:
+        return funcao(*args)
+    return pool.executar(funcao, *args)
+
+
+def gerar_hash_senha(senha):
+    """Hash da senha com os parâmetros de SENHA_METODO."""
+    return _executar(generate_password_hash, senha, current_app.extensions['senha_metodo'])
+
+
+def verificar_hash_senha(senha_hash, senha):
+    return _executar(check_password_hash, senha_hash, senha)
+
+
+def hash_desatualizado(senha_hash):
+    """True se o hash foi gerado com parâmetros diferentes de SENHA_METODO."""
+    return senha_hash.split('$', 1)[0] != current_app.extensions['senha_metodo']
+
+
+def init_senhas(app):
+    """Valida SENHA_METODO e prepara o pool em app.extensions['pool_senhas'] (None: hash na requisição)."""
+    app.extensions['senha_metodo'] = normalizar_metodo(app.config['SENHA_METODO'])
+    if app.config['SENHA_PROCESSOS'] > 0:
+        app.extensions['pool_senhas'] = PoolSenhas(
+            app.config['SENHA_PROCESSOS'], app.config['SENHA_MAX_PENDENTES'],
+            app.config['SENHA_TIMEOUT'], app.config['SENHA_NICE'])
+    else:
+        app.extensions['pool_senhas'] = None
@@ -0,0 +1,237 @@
+"""
+Agregados de vendas para relatórios (flask vendas reconstruir).
+
+vendas_diarias (pedidos e receita por dia), vendas_produto_diarias
+(unidades e receita por produto e dia) e totais_clientes (pedidos e gasto
+por cliente) são atualizados de forma incremental, com um upsert por tabela,
+na mesma transação do checkout (registrar_venda) e descontados na transação
+que cancela um pedido com pagamento recusado (estornar_venda). Os relatórios
+(/admin/relatorios/...) leem só essas tabelas: o custo depende do período e
+do número de produtos, não do tamanho do histórico, e não disputam o banco
+com o checkout varrendo itens_pedido.
+
+Pedidos cancelados não entram nos agregados; o dia é o de data_pedido (UTC).
+O arquivamento não altera os agregados: pedidos arquivados continuam contados.
+
+A reconstrução recalcula tudo a partir de pedidos e pedidos_arquivo em faixas
+de VENDAS_RECONSTRUCAO_LOTE ids de pedido, uma transação curta por faixa com
+pausa (VENDAS_RECONSTRUCAO_PAUSA) entre elas, e pode rodar com a loja no ar:
+os agregados são zerados na mesma transação em que se lê o maior id de pedido
+(os pedidos seguintes continuam incrementais) e o progresso fica em
+vendas_reconstrucao, para que o cancelamento de um pedido ainda não recontado
+não seja descontado duas vezes. Até ela terminar os relatórios são parciais;
+se for interrompida, basta rodá-la de novo.
+"""
+import time
+from datetime import datetime, timedelta
+
+import click
+from flask import current_app
+from flask.cli import AppGroup, with_appcontext
+from sqlalchemy import delete, select, union_all, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from app import db
+from app.models import (Cliente, ItemPedido, ItemPedidoArquivado, Pedido, PedidoArquivado, Produto,
+                        ReconstrucaoVendas, TotalCliente, VendaDiaria, VendaProdutoDiaria)
+
+DIAS_RELATORIO_PADRAO = 30
+STATUS_FORA_DAS_VENDAS = ('cancelado',)
+
+
+def _somar(modelo, chaves, colunas, linhas=None, consulta=None):
+    """Upsert que soma as colunas às linhas existentes (linhas: lista de dicts; consulta: INSERT ... SELECT)."""
+    insercao = sqlite_insert(modelo)
+    if consulta is not None:
+        insercao = insercao.from_select(chaves + colunas, consulta)
+    insercao = insercao.on_conflict_do_update(
+        index_elements=chaves,
+        set_={coluna: getattr(modelo, coluna) + insercao.excluded[coluna] for coluna in colunas},
+    )
+    if consulta is not None:
+        db.session.execute(insercao)
+    elif linhas:
+        db.session.execute(insercao, linhas)
+
+
+def _aplicar(cliente_id, data_pedido, total, itens, sinal):
+    dia = data_pedido.date()
+    por_produto = {}
+    for item in itens:
+        unidades, receita = por_produto.get(item['produto_id'], (0, 0.0))
+        por_produto[item['produto_id']] = (unidades + item['quantidade'],
+                                           receita + item['quantidade'] * item['preco_unitario'])
+
+    _somar(VendaDiaria, ['dia'], ['pedidos', 'receita'],
+           [{'dia': dia, 'pedidos': sinal, 'receita': sinal * total}])
+    _somar(VendaProdutoDiaria, ['dia', 'produto_id'], ['unidades', 'receita'],
+           [{'dia': dia, 'produto_id': produto_id, 'unidades': sinal * unidades, 'receita': sinal * receita}
+            for produto_id, (unidades, receita) in por_produto.items()])
+    _somar(TotalCliente, ['cliente_id'], ['pedidos', 'gasto'],
+           [{'cliente_id': cliente_id, 'pedidos': sinal, 'gasto': sinal * total}])
+
+
+def registrar_venda(pedido, itens):
+    """
+    Soma um pedido novo aos agregados, na transação do checkout (sem commit).
+    itens: dicts com produto_id, quantidade e preco_unitario (as linhas de itens_pedido).
+    """
+    _aplicar(pedido.cliente_id, pedido.data_pedido, pedido.total, itens, 1)
+
+
+def estornar_venda(pedido):
+    """Desconta dos agregados um pedido que acabou de ser cancelado (sem commit)."""
+    reconstrucao = db.session.execute(
+        select(ReconstrucaoVendas.processado_ate, ReconstrucaoVendas.limite)
+    ).first()
+    if reconstrucao and reconstrucao.processado_ate < pedido.id <= reconstrucao.limite:
+        return  # a reconstrução ainda vai ler este pedido, já com o status cancelado
+
+    itens = db.session.execute(
+        select(ItemPedido.produto_id, ItemPedido.quantidade, ItemPedido.preco_unitario)
+        .where(ItemPedido.pedido_id == pedido.id)
+    ).mappings().all()
+    _aplicar(pedido.cliente_id, pedido.data_pedido, pedido.total, itens, -1)
+
+
+# ==================== RECONSTRUÇÃO ====================
+
+def _da_faixa(modelo, inicio, fim):
+    return modelo.id > inicio, modelo.id <= fim, modelo.status.notin_(STATUS_FORA_DAS_VENDAS)
+
+
+def _somar_faixa(inicio, fim):
+    """Soma aos agregados os pedidos com id em (inicio, fim], ativos e arquivados."""
+    pedidos = union_all(*(
+        select(modelo.cliente_id, modelo.data_pedido, modelo.total).where(*_da_faixa(modelo, inicio, fim))
+        for modelo in (Pedido, PedidoArquivado)
+    )).subquery()
+    dia = db.func.date(pedidos.c.data_pedido)
+    _somar(VendaDiaria, ['dia'], ['pedidos', 'receita'], consulta=(
+        select(dia, db.func.count(), db.func.sum(pedidos.c.total)).group_by(dia)))
+    _somar(TotalCliente, ['cliente_id'], ['pedidos', 'gasto'], consulta=(
+        select(pedidos.c.cliente_id, db.func.count(), db.func.sum(pedidos.c.total)).group_by(pedidos.c.cliente_id)))
+
+    itens = union_all(*(
+        select(modelo.data_pedido, modelo_item.produto_id, modelo_item.quantidade, modelo_item.preco_unitario)
+        .join(modelo, modelo_item.pedido_id == modelo.id)
+        .where(*_da_faixa(modelo, inicio, fim))
+        for modelo, modelo_item in ((Pedido, ItemPedido), (PedidoArquivado, ItemPedidoArquivado))
+    )).subquery()
+    dia = db.func.date(itens.c.data_pedido)
+    _somar(VendaProdutoDiaria, ['dia', 'produto_id'], ['unidades', 'receita'], consulta=(
+        select(dia, itens.c.produto_id, db.func.sum(itens.c.quantidade),
+               db.func.sum(itens.c.quantidade * itens.c.preco_unitario))
+        .group_by(dia, itens.c.produto_id)))
+
+
+def reconstruir_vendas(tamanho_lote=None, pausa=None, progresso=None):
+    """Recalcula os agregados a partir do histórico em lotes; retorna quantos ids de pedido foram percorridos."""
+    config = current_app.config
+    tamanho_lote = tamanho_lote or config['VENDAS_RECONSTRUCAO_LOTE']
+    pausa = config['VENDAS_RECONSTRUCAO_PAUSA'] if pausa is None else pausa
+
+    # Os DELETEs vêm antes da leitura do maior id: com o lock de escrita já obtido,
+    # nenhum checkout grava entre a leitura e o início da reconstrução
+    for modelo in (VendaDiaria, VendaProdutoDiaria, TotalCliente, ReconstrucaoVendas):
+        db.session.execute(delete(modelo))
+    limite = max(db.session.execute(select(db.func.max(modelo.id))).scalar() or 0
+                 for modelo in (Pedido, PedidoArquivado))
+    db.session.add(ReconstrucaoVendas(id=1, limite=limite, processado_ate=0))
+    db.session.commit()
+
+    inicio = 0
+    while inicio < limite:
+        fim = min(inicio + tamanho_lote, limite)
+        _somar_faixa(inicio, fim)
+        db.session.execute(update(ReconstrucaoVendas).values(processado_ate=fim))
+        db.session.commit()
+        if progresso:
+            progresso(fim, limite)
+        inicio = fim
+        if inicio < limite:
+            time.sleep(pausa)
+
+    db.session.execute(delete(ReconstrucaoVendas))
+    db.session.commit()
+    return limite
+
+
+def garantir_tabelas_vendas():
+    """Cria as tabelas de agregados (migração) e as preenche a partir do histórico."""
+    with db.engine.begin() as conn:
+        for modelo in (VendaDiaria, VendaProdutoDiaria, TotalCliente, ReconstrucaoVendas):
+            modelo.__table__.create(conn, checkfirst=True)
+    reconstruir_vendas()
+
+
+# ==================== RELATÓRIOS ====================
+
+def periodo_padrao():
+    """Últimos DIAS_RELATORIO_PADRAO dias, incluindo hoje (UTC)."""
+    hoje = datetime.utcnow().date()
+    return hoje - timedelta(days=DIAS_RELATORIO_PADRAO - 1), hoje
+
+
+def receita_por_dia(de, ate):
+    """[(dia, pedidos, receita)] dos dias com vendas no período."""
+    return db.session.execute(
+        select(VendaDiaria.dia, VendaDiaria.pedidos, VendaDiaria.receita)
+        .where(VendaDiaria.dia.between(de, ate), VendaDiaria.pedidos > 0)
+        .order_by(VendaDiaria.dia)
+    ).all()
+
+
+def mais_vendidos(de, ate, limite=10):
+    """[(produto_id, nome, unidades, receita)] dos produtos com mais unidades vendidas no período."""
+    unidades = db.func.sum(VendaProdutoDiaria.unidades).label('unidades')
+    vendas = (select(VendaProdutoDiaria.produto_id, unidades,
+                     db.func.sum(VendaProdutoDiaria.receita).label('receita'))
+              .where(VendaProdutoDiaria.dia.between(de, ate))
+              .group_by(VendaProdutoDiaria.produto_id)
+              .having(unidades > 0)
+              .order_by(unidades.desc(), VendaProdutoDiaria.produto_id)
+              .limit(limite)
+              .subquery())
+    return db.session.execute(
+        select(vendas.c.produto_id, Produto.nome, vendas.c.unidades, vendas.c.receita)
+        .outerjoin(Produto, Produto.id == vendas.c.produto_id)
+        .order_by(vendas.c.unidades.desc(), vendas.c.produto_id)
+    ).all()
+
+
+def demanda_produto(produto_id, de, ate):
+    """[(dia, unidades, receita)] de um produto no período (índice produto_id, dia)."""
+    return db.session.execute(
+        select(VendaProdutoDiaria.dia, VendaProdutoDiaria.unidades, VendaProdutoDiaria.receita)
+        .where(VendaProdutoDiaria.produto_id == produto_id, VendaProdutoDiaria.dia.between(de, ate),
+               VendaProdutoDiaria.unidades > 0)
+        .order_by(VendaProdutoDiaria.dia)
+    ).all()
+
+
+def melhores_clientes(limite=10):
+    """[(cliente_id, nome, pedidos, gasto)] dos clientes de maior gasto acumulado."""
+    return db.session.execute(
+        select(TotalCliente.cliente_id, Cliente.nome, TotalCliente.pedidos, TotalCliente.gasto)
+        .outerjoin(Cliente, Cliente.id == TotalCliente.cliente_id)
+        .where(TotalCliente.pedidos > 0)
+        .order_by(TotalCliente.gasto.desc())
+        .limit(limite)
+    ).all()
+
+
+# ==================== COMANDOS (flask vendas ...) ====================
+
+vendas_cli = AppGroup('vendas', help='Agregados de vendas dos relatórios.')
+
+
+@vendas_cli.command('reconstruir')
+@click.option('--lote', type=int, default=None, help='Ids de pedido por transação (padrão: VENDAS_RECONSTRUCAO_LOTE).')
+@click.option('--pausa', type=float, default=None, help='Segundos entre lotes (padrão: VENDAS_RECONSTRUCAO_PAUSA).')
+@with_appcontext
+def comando_reconstruir(lote, pausa):
+    """Recalcula vendas_diarias, vendas_produto_diarias e totais_clientes a partir dos pedidos."""
+    inicio = time.perf_counter()
+    limite = reconstruir_vendas(lote, pausa, progresso=lambda fim, limite: click.echo(f'{fim}/{limite}', err=True))
+    click.echo(f'Agregados reconstruídos até o pedido #{limite} em {time.perf_counter() - inicio:.1f}s.', err=True)
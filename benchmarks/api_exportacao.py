@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+"""
+Benchmark da exportação do catálogo pela API (/api/produtos/exportar).
+
+Para cada tamanho de catálogo em --produtos, gera os produtos em um banco
+SQLite temporário e consome a resposta em streaming pelo test client (sem
+bufferizar), medindo produtos/s, tamanho da resposta e o pico de memória
+alocada (tracemalloc). Como referência, mede também a abordagem ingênua:
+carregar os objetos Produto e montar a lista inteira com jsonify.
+
+Uso:
+    python benchmarks/api_exportacao.py --produtos 10000 100000
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from config import config, TestingConfig  # noqa: E402
+
+
+def preparar(produtos):
+    from app import create_app, db
+    from app.models import Produto
+
+    caminho_db = os.path.join(tempfile.mkdtemp(prefix='bench_api_'), 'loja.db')
+    config['benchmark'] = type('BenchmarkConfig', (TestingConfig,), {
+        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{caminho_db}',
+        'CACHE_HTTP_ATIVO': False,
+    })
+    app = create_app('benchmark')
+    with app.app_context():
+        for inicio in range(0, produtos, 10000):
+            db.session.execute(db.insert(Produto), [
+                {'sku': f'SKU-{i}', 'nome': f'Produto {i}', 'descricao': f'Descrição do produto {i}',
+                 'preco': 10.0 + i % 500, 'estoque': i % 7}
+                for i in range(inicio, min(inicio + 10000, produtos))
+            ])
+        db.session.commit()
+    return app
+
+
+def _medir(funcao):
+    tracemalloc.start()
+    inicio = time.perf_counter()
+    tamanho = funcao()
+    duracao = time.perf_counter() - inicio
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return duracao, tamanho, pico
+
+
+def exportar_streaming(app, formato):
+    def funcao():
+        resposta = app.test_client().get(f'/api/produtos/exportar?formato={formato}', buffered=False)
+        tamanho = sum(len(pedaco) for pedaco in resposta.response)
+        resposta.close()
+        return tamanho
+    return funcao
+
+
+def exportar_lista(app):
+    from flask import jsonify
+    from app.models import Produto
+
+    def funcao():
+        with app.test_request_context():
+            produtos = Produto.query.order_by(Produto.id).all()
+            resposta = jsonify([{'id': p.id, 'sku': p.sku, 'nome': p.nome, 'preco': p.preco, 'estoque': p.estoque}
+                                for p in produtos])
+            return len(resposta.get_data())
+    return funcao
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--produtos', type=int, nargs='+', default=[10000, 100000])
+    args = parser.parse_args()
+
+    print(f'{"produtos":>9} {"método":22} {"produtos/s":>11} {"MiB":>8} {"pico MiB":>9}')
+    for produtos in args.produtos:
+        app = preparar(produtos)
+        metodos = [
+            ('streaming ndjson', exportar_streaming(app, 'ndjson')),
+            ('streaming json', exportar_streaming(app, 'json')),
+            ('lista + jsonify', exportar_lista(app)),
+        ]
+        for nome, funcao in metodos:
+            duracao, tamanho, pico = _medir(funcao)
+            print(f'{produtos:>9} {nome:22} {produtos / duracao:>11.0f} {tamanho / 2**20:>8.1f} {pico / 2**20:>9.1f}')
+
+
+if __name__ == '__main__':
+    main()
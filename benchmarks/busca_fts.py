@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+"""
+Benchmark da busca de produtos: índice FTS5 x LIKE '%termo%'.
+
+Gera um catálogo sintético (100 mil produtos por padrão) em um banco SQLite
+temporário e mede a latência média de cada termo nas duas estratégias, usando
+as mesmas funções da rota /busca.
+
+Uso:
+    python benchmarks/busca_fts.py --produtos 100000 --repeticoes 20
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from config import config, TestingConfig  # noqa: E402
+
+CATEGORIAS = ['Notebook', 'Mouse', 'Teclado', 'Monitor', 'Webcam', 'Headset', 'Cadeira', 'Impressora',
+              'Roteador', 'Caixa de Som', 'Microfone', 'Tablet', 'Smartphone', 'SSD', 'Memória']
+ADJETIVOS = ['Gamer', 'Pro', 'Ultra', 'Slim', 'Ergonômico', 'Sem Fio', 'RGB', 'Compacto', 'Premium',
+             'Básico', 'Mecânico', 'Portátil', 'Silencioso', 'Turbo', 'Max']
+PALAVRAS = ['alta', 'performance', 'bateria', 'longa', 'duração', 'design', 'moderno', 'conexão',
+            'bluetooth', 'usb', 'resolução', 'garantia', 'iluminação', 'confortável', 'resistente',
+            'leve', 'rápido', 'potente', 'escritório', 'jogos', 'profissional', 'som', 'imagem']
+
+TERMOS = ['notebook gamer', 'mouse', 'ergonomico', 'teclado mec', 'bluetooth bateria', 'monitor ultra',
+          'profissional', 'inexistente']
+
+
+def gerar_catalogo(app, quantidade):
+    from app import db
+    rnd = random.Random(42)
+    linhas = []
+    for i in range(quantidade):
+        nome = f'{rnd.choice(CATEGORIAS)} {rnd.choice(ADJETIVOS)} {i}'
+        descricao = ' '.join(rnd.choice(PALAVRAS) for _ in range(20))
+        linhas.append({'nome': nome, 'descricao': descricao, 'preco': round(rnd.uniform(10, 9000), 2),
+                       'estoque': rnd.randint(0, 100)})
+    with app.app_context():
+        conn = db.session.connection()
+        conn.exec_driver_sql(
+            'INSERT INTO produtos (nome, descricao, preco, estoque) VALUES (:nome, :descricao, :preco, :estoque)',
+            linhas,
+        )
+        db.session.commit()
+
+
+def medir(app, estrategia, termo, repeticoes):
+    from app.busca import buscar_produtos
+    with app.test_request_context():
+        app.extensions['busca_fts'] = (estrategia == 'fts')
+        buscar_produtos(termo)  # aquecimento
+        inicio = time.perf_counter()
+        for _ in range(repeticoes):
+            pagina = buscar_produtos(termo)
+        return (time.perf_counter() - inicio) / repeticoes * 1000.0, pagina.total
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--produtos', type=int, default=100000)
+    parser.add_argument('--repeticoes', type=int, default=20)
+    args = parser.parse_args()
+
+    caminho_db = os.path.join(tempfile.mkdtemp(prefix='bench_busca_'), 'loja.db')
+    config['benchmark'] = type('BenchmarkConfig', (TestingConfig,), {
+        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{caminho_db}',
+        'CACHE_CATALOGO_BACKEND': 'memoria',
+    })
+
+    from app import create_app
+    app = create_app('benchmark')
+    inicio = time.perf_counter()
+    gerar_catalogo(app, args.produtos)
+    print(f'{args.produtos} produtos gerados (índice FTS5 mantido por triggers) em '
+          f'{time.perf_counter() - inicio:.1f}s\n')
+
+    print(f'{"termo":<22}{"resultados":>12}{"FTS5 (ms)":>12}{"LIKE (ms)":>12}{"ganho":>9}')
+    for termo in TERMOS:
+        ms_fts, total_fts = medir(app, 'fts', termo, args.repeticoes)
+        ms_like, total_like = medir(app, 'like', termo, args.repeticoes)
+        print(f'{termo:<22}{total_fts:>12}{ms_fts:>12.2f}{ms_like:>12.2f}{ms_like / ms_fts:>8.1f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,172 @@
+#!/usr/bin/env python
+"""
+Benchmark de checkout concorrente com vários processos.
+
+Cria um banco SQLite temporário com um produto "disputado" de estoque
+limitado e N clientes com esse produto (e mais alguns) no carrinho, e dispara os checkouts em
+paralelo a partir de vários processos (como workers do gunicorn).
+
+Ao final verifica se houve venda acima do estoque (overselling) e informa
+pedidos por segundo. O modo "legado" reproduz o checkout anterior
+(leitura + verificação em Python + "estoque -= quantidade" por item) para
+comparação.
+
+Uso:
+    python benchmarks/checkout_concorrente.py --processos 8 --clientes 400 --estoque 250
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from config import config, TestingConfig  # noqa: E402
+
+
+def registrar_config(caminho_db):
+    """Registra uma configuração de benchmark apontando para o arquivo informado."""
+    config['benchmark'] = type('BenchmarkConfig', (TestingConfig,), {
+        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{caminho_db}',
+        'CACHE_CATALOGO_BACKEND': 'memoria',
+        'FILA_SINCRONA': False,  # mede só o checkout; as tarefas ficam na fila
+    })
+
+
+def finalizar_pedido_legado(cliente_id, metodo_pagamento):
+    """Checkout anterior: read-modify-write do estoque item a item."""
+    from app import db
+    from app.models import Cliente, Pedido, ItemPedido, Pagamento
+    from app.carrinho import get_carrinho_itens, limpar_carrinho
+
+    if not Cliente.query.get(cliente_id):
+        return None
+    itens_carrinho = get_carrinho_itens(cliente_id=cliente_id)
+    if not itens_carrinho:
+        return None
+    total = sum(item.produto.preco * item.quantidade for item in itens_carrinho)
+    pedido = Pedido(cliente_id=cliente_id, total=total, status='pendente')
+    db.session.add(pedido)
+    db.session.flush()
+    try:
+        for item in itens_carrinho:
+            produto = item.produto
+            if produto.estoque < item.quantidade:
+                db.session.rollback()
+                return None
+            db.session.add(ItemPedido(pedido_id=pedido.id, produto_id=produto.id,
+                                      quantidade=item.quantidade, preco_unitario=produto.preco))
+            produto.estoque -= item.quantidade
+        db.session.add(Pagamento(pedido_id=pedido.id, metodo=metodo_pagamento, status='aprovado'))
+        pedido.status = 'confirmado'
+        limpar_carrinho(cliente_id=cliente_id)
+        db.session.commit()
+        return pedido
+    except Exception:
+        db.session.rollback()
+        return None
+
+
+def preparar_banco(caminho_db, clientes, estoque, quantidade, linhas):
+    from app import create_app, db
+    from app.models import Cliente, Produto, CarrinhoCompras
+
+    if os.path.exists(caminho_db):
+        os.remove(caminho_db)
+    app = create_app('benchmark')
+    with app.app_context():
+        disputado = Produto(nome='Produto Disputado', descricao='', preco=100.0, estoque=estoque)
+        acessorios = [Produto(nome=f'Acessório {i}', descricao='', preco=10.0, estoque=clientes * 10)
+                      for i in range(linhas - 1)]
+        db.session.add_all([disputado] + acessorios)
+        db.session.flush()
+        for i in range(clientes):
+            cliente = Cliente(nome=f'Cliente {i}', email=f'cliente{i}@bench.local', senha_hash='-')
+            db.session.add(cliente)
+            db.session.flush()
+            db.session.add(CarrinhoCompras(cliente_id=cliente.id, produto_id=disputado.id, quantidade=quantidade))
+            db.session.add_all([CarrinhoCompras(cliente_id=cliente.id, produto_id=acessorio.id, quantidade=1)
+                                for acessorio in acessorios])
+        db.session.commit()
+        ids = [c.id for c in Cliente.query.order_by(Cliente.id)]
+        db.engine.dispose()
+    return ids
+
+
+def worker(args):
+    modo, cliente_ids = args
+    from app import create_app, db
+    from app.pedidos import finalizar_pedido
+
+    funcao = finalizar_pedido_legado if modo == 'legado' else finalizar_pedido
+    app = create_app('benchmark')
+    sucesso = falha = 0
+    with app.test_request_context():
+        for cliente_id in cliente_ids:
+            try:
+                pedido = funcao(cliente_id, 'pix')
+            except Exception:
+                db.session.rollback()
+                pedido = None
+            if pedido:
+                sucesso += 1
+            else:
+                falha += 1
+        db.engine.dispose()
+    return sucesso, falha
+
+
+def executar(modo, processos, clientes, estoque, quantidade, linhas):
+    caminho_db = os.path.join(tempfile.mkdtemp(prefix='bench_checkout_'), 'loja.db')
+    registrar_config(caminho_db)
+    ids = preparar_banco(caminho_db, clientes, estoque, quantidade, linhas)
+    fatias = [(modo, ids[i::processos]) for i in range(processos)]
+
+    ctx = multiprocessing.get_context('fork')
+    inicio = time.perf_counter()
+    with ctx.Pool(processos) as pool:
+        resultados = pool.map(worker, fatias)
+    duracao = time.perf_counter() - inicio
+
+    from app import create_app, db
+    from app.models import Produto, ItemPedido
+    app = create_app('benchmark')
+    with app.app_context():
+        disputado = Produto.query.filter_by(nome='Produto Disputado').one()
+        vendido = (db.session.query(db.func.coalesce(db.func.sum(ItemPedido.quantidade), 0))
+                   .filter(ItemPedido.produto_id == disputado.id).scalar())
+        estoque_final = disputado.estoque
+
+    sucesso = sum(r[0] for r in resultados)
+    falha = sum(r[1] for r in resultados)
+    # Vendas que não baixaram o estoque (atualizações perdidas) e vendas além do estoque inicial
+    perdidas = vendido - (estoque - estoque_final)
+    oversell = max(vendido - estoque, 0)
+    print(f'[{modo}] processos={processos} clientes={clientes} linhas/carrinho={linhas} estoque_inicial={estoque}')
+    print(f'  pedidos confirmados: {sucesso}  recusados/falhos: {falha}')
+    print(f'  unidades vendidas: {vendido}  estoque final: {estoque_final}')
+    print(f'  vendido acima do estoque: {oversell}  baixas de estoque perdidas: {perdidas}')
+    print(f'  tempo: {duracao:.2f}s  pedidos/s: {sucesso / duracao:.1f}')
+    return {'modo': modo, 'pedidos': sucesso, 'falhas': falha, 'vendido': vendido,
+            'estoque_final': estoque_final, 'oversell': oversell, 'perdidas': perdidas, 'pedidos_por_s': sucesso / duracao}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--processos', type=int, default=8)
+    parser.add_argument('--clientes', type=int, default=400)
+    parser.add_argument('--estoque', type=int, default=250)
+    parser.add_argument('--quantidade', type=int, default=1)
+    parser.add_argument('--linhas', type=int, default=5, help='produtos distintos por carrinho')
+    parser.add_argument('--modo', choices=['atual', 'legado', 'ambos'], default='ambos')
+    args = parser.parse_args()
+
+    modos = ['legado', 'atual'] if args.modo == 'ambos' else [args.modo]
+    for modo in modos:
+        executar(modo, args.processos, args.clientes, args.estoque, args.quantidade, args.linhas)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,137 @@
+#!/usr/bin/env python
+"""
+Benchmark do tempo de inicialização de um worker.
+
+Em --repeticoes processos Python novos, sobre um banco SQLite já existente
+(com catálogo), mede:
+
+    importacao         import do pacote app e das rotas
+    create_app         create_app() (configuração, extensões e verificação do esquema)
+    primeira_req       primeira requisição à vitrine (test client)
+
+Também sobe um gunicorn local com e sem --preload e mede o tempo até a
+primeira resposta e, depois de matar todos os workers, até o master
+repô-los e voltar a responder.
+
+Uso:
+    python benchmarks/inicializacao.py --repeticoes 10 --workers 4
+"""
+import argparse
+import json
+import os
+import signal
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+
+RAIZ = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, RAIZ)
+
+MEDICAO = r"""
+import json, os, time
+inicio = time.perf_counter()
+import app, app.routes
+from app import create_app
+importado = time.perf_counter()
+aplicacao = create_app(os.environ['FLASK_ENV'])
+criado = time.perf_counter()
+resposta = aplicacao.test_client().get('/')
+assert resposta.status_code == 200, resposta.status_code
+fim = time.perf_counter()
+print(json.dumps({
+    'importacao': (importado - inicio) * 1000.0,
+    'create_app': (criado - importado) * 1000.0,
+    'primeira_req': (fim - criado) * 1000.0,
+}))
+"""
+
+
+def preparar_banco(produtos):
+    from app import create_app, db
+    from app.models import Produto
+
+    app = create_app(os.environ['FLASK_ENV'])
+    with app.app_context():
+        db.session.execute(db.insert(Produto), [
+            {'nome': f'Produto {i}', 'descricao': f'Descrição do produto {i}', 'preco': 10.0 + i, 'estoque': 10}
+            for i in range(produtos)
+        ])
+        db.session.commit()
+        db.engine.dispose()
+
+
+def medir_processos(repeticoes, ambiente):
+    medicoes = []
+    for _ in range(repeticoes):
+        saida = subprocess.run([sys.executable, '-c', MEDICAO], cwd=RAIZ, env=ambiente,
+                               capture_output=True, text=True, check=True).stdout
+        medicoes.append(json.loads(saida.strip().splitlines()[-1]))
+    print(f'processo novo ({repeticoes} repetições, mediana / máximo):')
+    for etapa in ('importacao', 'create_app', 'primeira_req'):
+        valores = [m[etapa] for m in medicoes]
+        print(f'  {etapa:14} {statistics.median(valores):8.1f} / {max(valores):8.1f} ms')
+
+
+def _aguardar(base, limite=60):
+    inicio = time.perf_counter()
+    while time.perf_counter() - inicio < limite:
+        try:
+            urllib.request.urlopen(base + '/', timeout=2).read()
+            return (time.perf_counter() - inicio) * 1000.0
+        except (urllib.error.URLError, OSError):
+            time.sleep(0.02)
+    raise SystemExit(f'gunicorn não respondeu em {limite}s')
+
+
+def medir_gunicorn(args, ambiente, preload):
+    comando = ['gunicorn', '--workers', str(args.workers), '--bind', f'127.0.0.1:{args.porta}',
+               '--log-level', 'warning']
+    if preload:
+        comando.append('--preload')
+    base = f'http://127.0.0.1:{args.porta}'
+    ambiente = dict(ambiente, GUNICORN_PRELOAD='1' if preload else '0')  # gunicorn.conf.py
+    processo = subprocess.Popen(comando + ['run:app'], cwd=RAIZ, env=ambiente)
+    try:
+        primeira = _aguardar(base)
+        time.sleep(1.0)
+        # Workers mortos (OOM, max_requests, reinício): o master precisa repor todos
+        workers = subprocess.run(['pgrep', '-P', str(processo.pid)], capture_output=True, text=True).stdout.split()
+        for pid in workers:
+            os.kill(int(pid), signal.SIGKILL)
+        time.sleep(0.05)
+        reposicao = _aguardar(base) + 50.0
+    finally:
+        processo.terminate()
+        processo.wait(timeout=30)
+    print(f'gunicorn {"com" if preload else "sem"} --preload ({args.workers} workers): '
+          f'primeira resposta {primeira:.0f} ms, reposição dos workers {reposicao:.0f} ms')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeticoes', type=int, default=10)
+    parser.add_argument('--produtos', type=int, default=2000)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--porta', type=int, default=8767)
+    args = parser.parse_args()
+
+    diretorio = tempfile.mkdtemp(prefix='bench_inicio_')
+    ambiente = dict(os.environ,
+                    FLASK_ENV='development',
+                    DATABASE_URL=f'sqlite:///{os.path.join(diretorio, "loja.db")}',
+                    CACHE_CATALOGO_ARQUIVO=os.path.join(diretorio, 'cache_catalogo.db'),
+                    SQLITE_JOURNAL_MODE='WAL')
+    os.environ.update(ambiente)
+    preparar_banco(args.produtos)
+
+    medir_processos(args.repeticoes, ambiente)
+    medir_gunicorn(args, ambiente, preload=False)
+    medir_gunicorn(args, ambiente, preload=True)
+
+
+if __name__ == '__main__':
+    main()
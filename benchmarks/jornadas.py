@@ -0,0 +1,348 @@
+#!/usr/bin/env python
+"""
+Benchmark de ponta a ponta das jornadas da loja.
+
+Gera um catálogo e uma base de clientes sintéticos em um banco SQLite
+temporário e executa a jornada completa de compra, uma vez por cliente
+virtual:
+
+    vitrine (main.index) -> detalhes_produto -> adicionar_carrinho (x2, como
+    visitante) -> carrinho -> login (migra o carrinho) -> checkout (GET e
+    POST) -> logout
+
+A aplicação roda no próprio processo (test client, sequencial) ou em um
+gunicorn local com vários workers, acionado por várias threads.
+Para cada rota são medidos vazão, latência p50/p95/p99 e instruções SQL
+por requisição. As instruções vêm do cabeçalho Server-Timing da
+instrumentação (INSTRUMENTACAO_ATIVA). O resultado é gravado em JSON para
+comparar execuções (--comparar).
+
+Uso:
+    python benchmarks/jornadas.py --produtos 2000 --clientes 200
+    python benchmarks/jornadas.py --modo gunicorn --workers 4 --concorrencia 8 --saida atual.json
+    python benchmarks/jornadas.py --comparar atual.json
+"""
+import argparse
+import http.cookiejar
+import json
+import os
+import random
+import re
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+RAIZ = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, RAIZ)
+
+from config import config, Config, TestingConfig  # noqa: E402
+
+SENHA = 'senha-benchmark'
+RE_SQL = re.compile(r'desc="(\d+) SQL"')
+
+
+# ==================== DADOS SINTÉTICOS ====================
+
+def registrar_config(caminho_db, caminho_cache):
+    config['benchmark'] = type('BenchmarkConfig', (TestingConfig,), {
+        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{caminho_db}',
+        'CACHE_CATALOGO_BACKEND': 'sqlite',
+        'CACHE_CATALOGO_ARQUIVO': caminho_cache,
+        'INSTRUMENTACAO_ATIVA': True,
+        'LIMITE_REQUISICAO_LENTA_MS': float('inf'),
+        'LIMITE_CONSULTA_LENTA_MS': float('inf'),
+        'FILA_SINCRONA': False,
+        'SENHA_METODO': Config.SENHA_METODO,  # custo real do login (TestingConfig usa um hash barato)
+    })
+
+
+def gerar_dados(produtos, clientes):
+    from werkzeug.security import generate_password_hash
+    from app import create_app, db
+    from app.models import Cliente, Produto
+
+    rnd = random.Random(42)
+    app = create_app('benchmark')
+    with app.app_context():
+        db.session.execute(db.insert(Produto), [
+            {'nome': f'Produto {i}', 'descricao': f'Descrição sintética do produto {i}',
+             'preco': round(rnd.uniform(10, 5000), 2), 'estoque': 1_000_000}
+            for i in range(produtos)
+        ])
+        # Um único hash para todos: gerar milhares de hashes levaria minutos
+        senha_hash = generate_password_hash(SENHA, Config.SENHA_METODO)
+        db.session.execute(db.insert(Cliente), [
+            {'nome': f'Cliente {i}', 'email': f'cliente{i}@bench.local', 'senha_hash': senha_hash,
+             'endereco': f'Rua {i}', 'telefone': '0000-0000'}
+            for i in range(clientes)
+        ])
+        db.session.commit()
+        db.engine.dispose()
+    return app
+
+
+# ==================== CLIENTES HTTP ====================
+
+class ClienteTeste:
+    """Navegador sobre o test client do Flask (aplicação no próprio processo)."""
+
+    def __init__(self, app):
+        self.cliente = app.test_client()
+
+    def requisitar(self, metodo, caminho, dados=None):
+        resposta = self.cliente.open(caminho, method=metodo, data=dados)
+        return resposta.status_code, resposta.headers.get('Server-Timing', '')
+
+
+class _SemRedirecionamento(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class ClienteHTTP:
+    """Navegador HTTP com cookies que não segue redirecionamentos (cada requisição é medida)."""
+
+    def __init__(self, base):
+        self.base = base
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()), _SemRedirecionamento())
+
+    def requisitar(self, metodo, caminho, dados=None):
+        corpo = urllib.parse.urlencode(dados).encode() if dados is not None else None
+        requisicao = urllib.request.Request(self.base + caminho, data=corpo, method=metodo)
+        try:
+            with self.opener.open(requisicao, timeout=30) as resposta:
+                resposta.read()
+                return resposta.status, resposta.headers.get('Server-Timing', '')
+        except urllib.error.HTTPError as e:
+            e.read()
+            return e.code, e.headers.get('Server-Timing', '')
+
+
+# ==================== JORNADA ====================
+
+def jornada(navegador, indice, produtos, clientes):
+    """Executa a jornada de compra; retorna [(rota, ms, status, instrucoes_sql)]."""
+    rnd = random.Random(indice)
+    produto_a, produto_b = rnd.sample(range(1, produtos + 1), 2)
+    passos = [
+        ('GET main.index', 'GET', '/', None),
+        ('GET main.detalhes_produto', 'GET', f'/produto/{produto_a}', None),
+        ('POST main.adicionar_carrinho', 'POST', f'/adicionar_carrinho/{produto_a}', {'quantidade': 1}),
+        ('POST main.adicionar_carrinho', 'POST', f'/adicionar_carrinho/{produto_b}', {'quantidade': 2}),
+        ('GET main.carrinho', 'GET', '/carrinho', None),
+        ('POST auth.login', 'POST', '/login',
+         {'email': f'cliente{indice % clientes}@bench.local', 'senha': SENHA}),
+        ('GET main.checkout', 'GET', '/checkout', None),
+        ('POST main.checkout', 'POST', '/checkout', {'metodo_pagamento': 'pix'}),
+        ('GET auth.logout', 'GET', '/logout', None),
+    ]
+    medicoes = []
+    for rota, metodo, caminho, dados in passos:
+        inicio = time.perf_counter()
+        status, server_timing = navegador.requisitar(metodo, caminho, dados)
+        duracao_ms = (time.perf_counter() - inicio) * 1000.0
+        sql = RE_SQL.search(server_timing)
+        medicoes.append((rota, duracao_ms, status, int(sql.group(1)) if sql else None))
+    return medicoes
+
+
+# ==================== EXECUÇÃO ====================
+
+def _percentil(valores, p):
+    if not valores:
+        return 0.0
+    indice = min(len(valores) - 1, max(0, int(round(p / 100.0 * len(valores) + 0.5)) - 1))
+    return round(valores[indice], 3)
+
+
+def resumir(medicoes, duracao):
+    por_rota = {}
+    for rota, ms, status, sql in medicoes:
+        por_rota.setdefault(rota, []).append((ms, status, sql))
+
+    rotas = {}
+    for rota, linhas in sorted(por_rota.items()):
+        latencias = sorted(ms for ms, _, _ in linhas)
+        instrucoes = [sql for _, _, sql in linhas if sql is not None]
+        rotas[rota] = {
+            'requisicoes': len(linhas),
+            'por_segundo': round(len(linhas) / duracao, 2),
+            'erros': sum(1 for _, status, _ in linhas if status >= 400),
+            'p50_ms': _percentil(latencias, 50),
+            'p95_ms': _percentil(latencias, 95),
+            'p99_ms': _percentil(latencias, 99),
+            'media_ms': round(sum(latencias) / len(latencias), 3),
+            'sql_por_requisicao': round(sum(instrucoes) / len(instrucoes), 2) if instrucoes else None,
+        }
+    latencias = sorted(ms for _, ms, _, _ in medicoes)
+    total = {
+        'requisicoes': len(medicoes),
+        'duracao_s': round(duracao, 3),
+        'por_segundo': round(len(medicoes) / duracao, 2),
+        'erros': sum(1 for _, _, status, _ in medicoes if status >= 400),
+        'p50_ms': _percentil(latencias, 50),
+        'p95_ms': _percentil(latencias, 95),
+        'p99_ms': _percentil(latencias, 99),
+    }
+    return rotas, total
+
+
+def executar_no_processo(app, args):
+    for i in range(args.aquecimento):
+        jornada(ClienteTeste(app), i, args.produtos, args.clientes)
+    medicoes = []
+    inicio = time.perf_counter()
+    for i in range(args.jornadas):
+        medicoes.extend(jornada(ClienteTeste(app), i, args.produtos, args.clientes))
+    return medicoes, time.perf_counter() - inicio
+
+
+def iniciar_gunicorn(args, caminho_db, caminho_cache):
+    ambiente = dict(os.environ,
+                    FLASK_ENV='development',
+                    DATABASE_URL=f'sqlite:///{caminho_db}',
+                    CACHE_CATALOGO_ARQUIVO=caminho_cache,
+                    INSTRUMENTACAO_ATIVA='1',
+                    LIMITE_REQUISICAO_LENTA_MS='1e12',
+                    LIMITE_CONSULTA_LENTA_MS='1e12',
+                    LIMITES_ATIVOS='0')  # todas as jornadas vêm do mesmo endereço
+    ambiente.setdefault('SQLITE_JOURNAL_MODE', 'WAL')
+    processo = subprocess.Popen(
+        ['gunicorn', '--workers', str(args.workers), '--bind', f'127.0.0.1:{args.porta}',
+         '--log-level', 'warning', 'run:app'],
+        cwd=RAIZ, env=ambiente,
+    )
+    base = f'http://127.0.0.1:{args.porta}'
+    limite = time.time() + 30
+    while time.time() < limite:
+        try:
+            urllib.request.urlopen(base + '/', timeout=2).read()
+            return processo, base
+        except (urllib.error.URLError, ConnectionError):
+            if processo.poll() is not None:
+                raise SystemExit('gunicorn terminou antes de aceitar conexões')
+            time.sleep(0.2)
+    processo.terminate()
+    raise SystemExit('gunicorn não respondeu em 30s')
+
+
+def executar_gunicorn(args, caminho_db, caminho_cache):
+    processo, base = iniciar_gunicorn(args, caminho_db, caminho_cache)
+    try:
+        for i in range(args.aquecimento):
+            jornada(ClienteHTTP(base), i, args.produtos, args.clientes)
+        medicoes = []
+        lock = threading.Lock()
+
+        def executar_jornada(i):
+            resultado = jornada(ClienteHTTP(base), i, args.produtos, args.clientes)
+            with lock:
+                medicoes.extend(resultado)
+
+        inicio = time.perf_counter()
+        with ThreadPoolExecutor(args.concorrencia) as executor:
+            list(executor.map(executar_jornada, range(args.jornadas)))
+        return medicoes, time.perf_counter() - inicio
+    finally:
+        processo.terminate()
+        processo.wait(timeout=30)
+
+
+def _commit_atual():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=RAIZ, capture_output=True,
+                              text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def imprimir(rotas, total):
+    print(f'{"rota":32} {"req":>6} {"req/s":>8} {"p50":>8} {"p95":>8} {"p99":>8} {"SQL":>6} {"erros":>6}')
+    for rota, r in rotas.items():
+        sql = '-' if r['sql_por_requisicao'] is None else f'{r["sql_por_requisicao"]:.1f}'
+        print(f'{rota:32} {r["requisicoes"]:>6} {r["por_segundo"]:>8.1f} {r["p50_ms"]:>8.2f} '
+              f'{r["p95_ms"]:>8.2f} {r["p99_ms"]:>8.2f} {sql:>6} {r["erros"]:>6}')
+    print(f'{"total":32} {total["requisicoes"]:>6} {total["por_segundo"]:>8.1f} {total["p50_ms"]:>8.2f} '
+          f'{total["p95_ms"]:>8.2f} {total["p99_ms"]:>8.2f} {"":>6} {total["erros"]:>6}')
+
+
+def comparar(atual, caminho_base):
+    with open(caminho_base, encoding='utf-8') as arquivo:
+        base = json.load(arquivo)
+    print(f'\nComparação com {caminho_base} (commit {base["meta"].get("commit")}):')
+    print(f'{"rota":32} {"p95 base":>10} {"p95 atual":>10} {"Δ p95":>8} {"SQL base":>9} {"SQL atual":>9}')
+    for rota, r in atual['rotas'].items():
+        anterior = base['rotas'].get(rota)
+        if anterior is None:
+            continue
+        delta = ((r['p95_ms'] - anterior['p95_ms']) / anterior['p95_ms'] * 100.0) if anterior['p95_ms'] else 0.0
+        print(f'{rota:32} {anterior["p95_ms"]:>10.2f} {r["p95_ms"]:>10.2f} {delta:>+7.1f}% '
+              f'{str(anterior["sql_por_requisicao"]):>9} {str(r["sql_por_requisicao"]):>9}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--modo', choices=['processo', 'gunicorn'], default='processo')
+    parser.add_argument('--produtos', type=int, default=2000)
+    parser.add_argument('--clientes', type=int, default=200)
+    parser.add_argument('--jornadas', type=int, default=None, help='padrão: uma por cliente')
+    parser.add_argument('--aquecimento', type=int, default=5, help='jornadas descartadas antes da medição')
+    parser.add_argument('--workers', type=int, default=4, help='workers do gunicorn')
+    parser.add_argument('--concorrencia', type=int, default=8, help='threads clientes (modo gunicorn)')
+    parser.add_argument('--porta', type=int, default=8765)
+    parser.add_argument('--saida', default=None, help='arquivo JSON (padrão: jornadas_<data>.json)')
+    parser.add_argument('--comparar', default=None, help='JSON de uma execução anterior')
+    args = parser.parse_args()
+    args.jornadas = args.jornadas or args.clientes
+
+    diretorio = tempfile.mkdtemp(prefix='bench_jornadas_')
+    caminho_db = os.path.join(diretorio, 'loja.db')
+    caminho_cache = os.path.join(diretorio, 'cache_catalogo.db')
+    registrar_config(caminho_db, caminho_cache)
+    app = gerar_dados(args.produtos, args.clientes)
+    print(f'{args.produtos} produtos e {args.clientes} clientes gerados em {diretorio}')
+
+    if args.modo == 'processo':
+        medicoes, duracao = executar_no_processo(app, args)
+    else:
+        medicoes, duracao = executar_gunicorn(args, caminho_db, caminho_cache)
+
+    rotas, total = resumir(medicoes, duracao)
+    resultado = {
+        'meta': {
+            'data': datetime.now().isoformat(timespec='seconds'),
+            'commit': _commit_atual(),
+            'modo': args.modo,
+            'produtos': args.produtos,
+            'clientes': args.clientes,
+            'jornadas': args.jornadas,
+            'workers': args.workers if args.modo == 'gunicorn' else 1,
+            'concorrencia': args.concorrencia if args.modo == 'gunicorn' else 1,
+            'python': sys.version.split()[0],
+            'sqlite': sqlite3.sqlite_version,
+        },
+        'rotas': rotas,
+        'total': total,
+    }
+    imprimir(rotas, total)
+
+    saida = args.saida or f'jornadas_{datetime.now():%Y%m%d_%H%M%S}.json'
+    with open(saida, 'w', encoding='utf-8') as arquivo:
+        json.dump(resultado, arquivo, indent=2, ensure_ascii=False)
+    print(f'\nResultados gravados em {saida}')
+
+    if args.comparar:
+        comparar(resultado, args.comparar)
+
+
+if __name__ == '__main__':
+    main()
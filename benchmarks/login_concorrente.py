@@ -0,0 +1,166 @@
+#!/usr/bin/env python
+"""
+Benchmark de login sob carga e seu efeito na latência do catálogo.
+
+Sobe um gunicorn local (workers gthread) sobre um banco SQLite temporário e,
+durante --duracao segundos, dispara logins contínuos (--logins threads)
+enquanto outras threads (--navegacao) percorrem a vitrine e páginas de
+produto. Cada cenário roda em um gunicorn novo:
+
+    sem_login  só navegação (referência)
+    requisicao hash calculado na thread da requisição (SENHA_PROCESSOS=0)
+    pool       hash no pool de processos com fila limitada (app/senhas.py)
+
+Mostra logins/s, logins recusados com 503 (a thread espera o Retry-After
+antes de tentar de novo) e p50/p95/p99 do catálogo.
+
+Uso:
+    python benchmarks/login_concorrente.py --workers 2 --threads 4 --logins 8 --navegacao 4
+"""
+import argparse
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+
+RAIZ = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, RAIZ)
+
+from config import config, Config, TestingConfig  # noqa: E402
+from jornadas import ClienteHTTP, _percentil  # noqa: E402
+
+SENHA = 'senha-benchmark'
+CENARIOS = {
+    'sem_login': {'SENHA_PROCESSOS': '0'},
+    'requisicao': {'SENHA_PROCESSOS': '0'},
+    'pool': {},
+}
+
+
+def gerar_dados(caminho_db, produtos, clientes):
+    from werkzeug.security import generate_password_hash
+    from app import create_app, db
+    from app.models import Cliente, Produto
+
+    config['benchmark'] = type('BenchmarkConfig', (TestingConfig,), {
+        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{caminho_db}',
+        'SENHA_METODO': Config.SENHA_METODO,
+    })
+    app = create_app('benchmark')
+    with app.app_context():
+        db.session.execute(db.insert(Produto), [
+            {'nome': f'Produto {i}', 'descricao': f'Descrição sintética do produto {i}',
+             'preco': 10.0 + i % 500, 'estoque': 1000}
+            for i in range(produtos)
+        ])
+        senha_hash = generate_password_hash(SENHA, Config.SENHA_METODO)
+        db.session.execute(db.insert(Cliente), [
+            {'nome': f'Cliente {i}', 'email': f'cliente{i}@bench.local', 'senha_hash': senha_hash}
+            for i in range(clientes)
+        ])
+        db.session.commit()
+        db.engine.dispose()
+
+
+def iniciar_gunicorn(args, caminho_db, variaveis):
+    # LIMITES_ATIVOS=0: todos os logins vêm do mesmo endereço e seriam recusados com 429
+    ambiente = dict(os.environ, FLASK_ENV='development', DATABASE_URL=f'sqlite:///{caminho_db}',
+                    CACHE_CATALOGO_BACKEND='memoria', SQLITE_JOURNAL_MODE='WAL', LIMITES_ATIVOS='0', **variaveis)
+    processo = subprocess.Popen(
+        ['gunicorn', '--workers', str(args.workers), '--worker-class', 'gthread',
+         '--threads', str(args.threads), '--bind', f'127.0.0.1:{args.porta}',
+         '--log-level', 'warning', 'run:app'],
+        cwd=RAIZ, env=ambiente,
+    )
+    base = f'http://127.0.0.1:{args.porta}'
+    limite = time.time() + 30
+    while time.time() < limite:
+        try:
+            urllib.request.urlopen(base + '/', timeout=2).read()
+            return processo, base
+        except (urllib.error.URLError, ConnectionError):
+            if processo.poll() is not None:
+                raise SystemExit('gunicorn terminou antes de aceitar conexões')
+            time.sleep(0.2)
+    processo.terminate()
+    raise SystemExit('gunicorn não respondeu em 30s')
+
+
+def executar(cenario, args, caminho_db):
+    processo, base = iniciar_gunicorn(args, caminho_db, CENARIOS[cenario])
+    fim = time.perf_counter() + args.duracao
+    catalogo = []
+    logins = {'ok': 0, 'recusados': 0, 'latencias': []}
+    lock = threading.Lock()
+
+    def navegar(semente):
+        rnd = random.Random(semente)
+        navegador = ClienteHTTP(base)
+        while time.perf_counter() < fim:
+            caminho = '/' if rnd.random() < 0.3 else f'/produto/{rnd.randrange(1, args.produtos + 1)}'
+            inicio = time.perf_counter()
+            navegador.requisitar('GET', caminho)
+            with lock:
+                catalogo.append((time.perf_counter() - inicio) * 1000.0)
+
+    def logar(semente):
+        rnd = random.Random(semente)
+        while time.perf_counter() < fim:
+            dados = {'email': f'cliente{rnd.randrange(args.clientes)}@bench.local', 'senha': SENHA}
+            inicio = time.perf_counter()
+            status, _ = ClienteHTTP(base).requisitar('POST', '/login', dados)
+            with lock:
+                logins['latencias'].append((time.perf_counter() - inicio) * 1000.0)
+                logins['ok' if status == 302 else 'recusados'] += 1
+            if status == 503:
+                time.sleep(1.0)  # Retry-After
+
+    threads = [threading.Thread(target=navegar, args=(i,)) for i in range(args.navegacao)]
+    if cenario != 'sem_login':
+        threads += [threading.Thread(target=logar, args=(1000 + i,)) for i in range(args.logins)]
+    try:
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        processo.terminate()
+        processo.wait(timeout=30)
+
+    catalogo.sort()
+    latencias_login = sorted(logins['latencias'])
+    print(f'[{cenario}]')
+    print(f'  catálogo: {len(catalogo) / args.duracao:.1f} req/s  p50/p95/p99: '
+          f'{_percentil(catalogo, 50):.1f}/{_percentil(catalogo, 95):.1f}/{_percentil(catalogo, 99):.1f} ms')
+    if cenario != 'sem_login':
+        print(f'  login: {logins["ok"] / args.duracao:.1f} ok/s  recusados (503): {logins["recusados"]}  '
+              f'p50/p95: {_percentil(latencias_login, 50):.1f}/{_percentil(latencias_login, 95):.1f} ms')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--cenario', choices=list(CENARIOS) + ['todos'], default='todos')
+    parser.add_argument('--duracao', type=float, default=10.0, help='segundos por cenário')
+    parser.add_argument('--workers', type=int, default=2, help='workers do gunicorn')
+    parser.add_argument('--threads', type=int, default=4, help='threads por worker (gthread)')
+    parser.add_argument('--logins', type=int, default=8, help='threads fazendo login')
+    parser.add_argument('--navegacao', type=int, default=4, help='threads navegando no catálogo')
+    parser.add_argument('--produtos', type=int, default=2000)
+    parser.add_argument('--clientes', type=int, default=200)
+    parser.add_argument('--porta', type=int, default=8766)
+    args = parser.parse_args()
+
+    caminho_db = os.path.join(tempfile.mkdtemp(prefix='bench_login_'), 'loja.db')
+    gerar_dados(caminho_db, args.produtos, args.clientes)
+    cenarios = list(CENARIOS) if args.cenario == 'todos' else [args.cenario]
+    for cenario in cenarios:
+        executar(cenario, args, caminho_db)
+
+
+if __name__ == '__main__':
+    main()
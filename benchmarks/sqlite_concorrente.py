@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+"""
+Benchmark de leitura/escrita concorrente no SQLite com vários processos.
+
+Compara o perfil padrão do SQLite (journal DELETE, synchronous FULL) com o
+perfil de produção de config.py (WAL, synchronous NORMAL, cache e mmap
+maiores). Cada processo simula um worker do gunicorn: durante --duracao
+segundos executa leituras da listagem/detalhes de produto e, na proporção
+--escritas, transações de escrita pelo ORM (lê o produto e altera o estoque).
+
+Mostra operações por segundo, latências p50/p95 por tipo e quantas
+operações falharam com "database is locked".
+
+Uso:
+    python benchmarks/sqlite_concorrente.py --processos 8 --duracao 10 --escritas 0.2
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from config import config, Config, ProductionConfig, TestingConfig  # noqa: E402
+
+OPCOES_SQLITE = ('SQLITE_JOURNAL_MODE', 'SQLITE_BUSY_TIMEOUT_MS', 'SQLITE_SYNCHRONOUS',
+                 'SQLITE_CACHE_SIZE_KB', 'SQLITE_MMAP_SIZE_MB', 'SQLITE_TEMP_STORE_MEMORIA')
+
+PERFIS = {
+    'padrao': Config,
+    'producao': ProductionConfig,
+}
+
+
+def registrar_config(perfil, caminho_db):
+    """Configuração de benchmark com as opções de SQLite do perfil informado."""
+    origem = PERFIS[perfil]
+    atributos = {opcao: getattr(origem, opcao) for opcao in OPCOES_SQLITE}
+    atributos.update({
+        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{caminho_db}',
+        'SQLALCHEMY_ENGINE_OPTIONS': getattr(origem, 'SQLALCHEMY_ENGINE_OPTIONS', {}),
+        'CACHE_CATALOGO_BACKEND': 'memoria',
+    })
+    config['benchmark'] = type('BenchmarkConfig', (TestingConfig,), atributos)
+
+
+def preparar_banco(produtos):
+    from app import create_app, db
+    from app.models import Produto
+
+    app = create_app('benchmark')
+    with app.app_context():
+        db.session.execute(db.insert(Produto), [
+            {'nome': f'Produto {i}', 'descricao': 'Descrição ' * 20, 'preco': 10.0 + i % 500, 'estoque': 1000}
+            for i in range(produtos)
+        ])
+        db.session.commit()
+        db.engine.dispose()
+
+
+def _percentil(valores, p):
+    if not valores:
+        return 0.0
+    valores = sorted(valores)
+    return valores[min(len(valores) - 1, int(round(p / 100.0 * (len(valores) - 1))))]
+
+
+def worker(args):
+    semente, duracao, proporcao_escritas, produtos = args
+    from sqlalchemy.exc import OperationalError
+    from app import create_app, db
+    from app.models import Produto
+
+    rnd = random.Random(semente)
+    app = create_app('benchmark')
+    latencias = {'leitura': [], 'escrita': []}
+    bloqueios = 0
+    with app.app_context():
+        fim = time.perf_counter() + duracao
+        while time.perf_counter() < fim:
+            tipo = 'escrita' if rnd.random() < proporcao_escritas else 'leitura'
+            inicio = time.perf_counter()
+            try:
+                if tipo == 'leitura':
+                    pagina = rnd.randrange(max(produtos // 12, 1))
+                    Produto.query.order_by(Produto.id).limit(12).offset(pagina * 12).all()
+                    db.session.get(Produto, rnd.randrange(1, produtos + 1))
+                else:
+                    produto = db.session.get(Produto, rnd.randrange(1, produtos + 1))
+                    produto.estoque += rnd.choice((-1, 1))
+                    db.session.commit()
+                latencias[tipo].append((time.perf_counter() - inicio) * 1000.0)
+            except OperationalError:
+                db.session.rollback()
+                bloqueios += 1
+            finally:
+                db.session.remove()
+        db.engine.dispose()
+    return latencias, bloqueios
+
+
+def executar(perfil, processos, duracao, proporcao_escritas, produtos):
+    caminho_db = os.path.join(tempfile.mkdtemp(prefix='bench_sqlite_'), 'loja.db')
+    registrar_config(perfil, caminho_db)
+    preparar_banco(produtos)
+
+    ctx = multiprocessing.get_context('fork')
+    argumentos = [(i, duracao, proporcao_escritas, produtos) for i in range(processos)]
+    with ctx.Pool(processos) as pool:
+        resultados = pool.map(worker, argumentos)
+
+    leituras = [ms for latencias, _ in resultados for ms in latencias['leitura']]
+    escritas = [ms for latencias, _ in resultados for ms in latencias['escrita']]
+    bloqueios = sum(b for _, b in resultados)
+
+    print(f'[{perfil}] processos={processos} duracao={duracao}s escritas={proporcao_escritas:.0%}')
+    print(f'  operações/s: {(len(leituras) + len(escritas)) / duracao:.1f} '
+          f'(leituras/s: {len(leituras) / duracao:.1f}  escritas/s: {len(escritas) / duracao:.1f})')
+    print(f'  leitura p50/p95: {_percentil(leituras, 50):.2f}/{_percentil(leituras, 95):.2f} ms  '
+          f'escrita p50/p95: {_percentil(escritas, 50):.2f}/{_percentil(escritas, 95):.2f} ms')
+    print(f'  falhas "database is locked": {bloqueios}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--processos', type=int, default=8)
+    parser.add_argument('--duracao', type=float, default=10.0, help='segundos por perfil')
+    parser.add_argument('--escritas', type=float, default=0.2, help='proporção de operações de escrita')
+    parser.add_argument('--produtos', type=int, default=2000)
+    parser.add_argument('--perfil', choices=['padrao', 'producao', 'ambos'], default='ambos')
+    args = parser.parse_args()
+
+    perfis = ['padrao', 'producao'] if args.perfil == 'ambos' else [args.perfil]
+    for perfil in perfis:
+        executar(perfil, args.processos, args.duracao, args.escritas, args.produtos)
+
+
+if __name__ == '__main__':
+    main()
@@ -2,12 +2,141 @@ import os
 
 class Config:
     """Configuração base da aplicação"""
-    SQLALCHEMY_DATABASE_URI = 'sqlite:///loja_online.db'
+    SQLALCHEMY_DATABASE_URI = os.getenv('DATABASE_URL', 'sqlite:///loja_online.db')
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     SECRET_KEY = 'sua-chave-secreta-super-segura-aqui'
     SESSION_COOKIE_SECURE = False  # Mude para True em produção com HTTPS
     SESSION_COOKIE_HTTPONLY = True
     PERMANENT_SESSION_LIFETIME = 3600  # 1 hora
+    # Proxies reversos à frente da aplicação: com N > 0 o IP, o esquema e o host vêm dos cabeçalhos X-Forwarded-*
+    PROXY_SALTOS = int(os.getenv('PROXY_SALTOS', 0))
+    # Monitoramento (/_stats/*) e relatórios (/admin/relatorios/*): cabeçalho Authorization: Bearer <ADMIN_TOKEN>
+    ADMIN_TOKEN = os.getenv('ADMIN_TOKEN')
+    # Sem o token, aceita requisições de localhost (atrás de um proxy no mesmo host, todas vêm de 127.0.0.1)
+    ADMIN_LOCAL_SEM_TOKEN = os.getenv('ADMIN_LOCAL_SEM_TOKEN', '1') == '1'
+
+    # Perfil do SQLite: PRAGMAs aplicados em toda conexão (app/banco.py); None mantém o padrão do SQLite
+    SQLITE_JOURNAL_MODE = os.getenv('SQLITE_JOURNAL_MODE')  # DELETE (padrão do SQLite) ou WAL
+    SQLITE_BUSY_TIMEOUT_MS = int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', 5000))
+    SQLITE_SYNCHRONOUS = os.getenv('SQLITE_SYNCHRONOUS')  # FULL (padrão do SQLite) ou NORMAL
+    SQLITE_CACHE_SIZE_KB = os.getenv('SQLITE_CACHE_SIZE_KB')
+    SQLITE_MMAP_SIZE_MB = os.getenv('SQLITE_MMAP_SIZE_MB')
+    SQLITE_TEMP_STORE_MEMORIA = os.getenv('SQLITE_TEMP_STORE_MEMORIA', '0') == '1'
+
+    # Migrações pendentes do esquema (app/migracoes.py) aplicadas no create_app; em produção: flask esquema migrar
+    ESQUEMA_MIGRAR_AO_INICIAR = os.getenv('ESQUEMA_MIGRAR_AO_INICIAR', '1') == '1'
+
+    # Bind de leitura das rotas do catálogo (app/roteamento.py): vazio (desativado), somente_leitura ou replica
+    BANCO_LEITURA = os.getenv('BANCO_LEITURA', '')
+    DATABASE_URL_LEITURA = os.getenv('DATABASE_URL_LEITURA')  # réplica, com BANCO_LEITURA=replica
+    BANCO_LEITURA_APOS_ESCRITA = float(os.getenv('BANCO_LEITURA_APOS_ESCRITA', 10))  # segundos lendo do primário
+
+    # Instrumentação (SQL/templates por requisição, Server-Timing e log de lentidão)
+    INSTRUMENTACAO_ATIVA = os.getenv('INSTRUMENTACAO_ATIVA', '0') == '1'
+    INSTRUMENTACAO_BACKEND = os.getenv('INSTRUMENTACAO_BACKEND', 'sqlite')  # sqlite (todos os workers) ou memoria
+    INSTRUMENTACAO_ARQUIVO = os.getenv('INSTRUMENTACAO_ARQUIVO')  # padrão: instance/instrumentacao.db
+    INSTRUMENTACAO_GRAVACAO_INTERVALO = float(os.getenv('INSTRUMENTACAO_GRAVACAO_INTERVALO', 5))  # segundos
+    LIMITE_REQUISICAO_LENTA_MS = float(os.getenv('LIMITE_REQUISICAO_LENTA_MS', 500))
+    LIMITE_CONSULTA_LENTA_MS = float(os.getenv('LIMITE_CONSULTA_LENTA_MS', 100))
+
+    # Cache do catálogo (listagem e detalhes de produto)
+    CACHE_CATALOGO_ATIVO = os.getenv('CACHE_CATALOGO_ATIVO', '1') == '1'
+    CACHE_CATALOGO_BACKEND = os.getenv('CACHE_CATALOGO_BACKEND', 'sqlite')  # sqlite (compartilhado) ou memoria
+    CACHE_CATALOGO_ARQUIVO = os.getenv('CACHE_CATALOGO_ARQUIVO')  # padrão: instance/cache_catalogo.db
+    CACHE_CATALOGO_MAX_ITENS = int(os.getenv('CACHE_CATALOGO_MAX_ITENS', 5000))
+    CACHE_CATALOGO_TTL = int(os.getenv('CACHE_CATALOGO_TTL', 300))  # segundos
+    # Backend sqlite: regrava o acesso (LRU) e os contadores no máximo a cada N segundos
+    CACHE_CATALOGO_ACESSO_INTERVALO = float(os.getenv('CACHE_CATALOGO_ACESSO_INTERVALO', 30))
+
+    # Cache HTTP: ETag/Last-Modified nas páginas do catálogo para visitantes anônimos
+    CACHE_HTTP_ATIVO = os.getenv('CACHE_HTTP_ATIVO', '1') == '1'
+    CACHE_HTTP_MAX_AGE_CATALOGO = int(os.getenv('CACHE_HTTP_MAX_AGE_CATALOGO', 0))  # 0: sempre revalida (304)
+    SEND_FILE_MAX_AGE_DEFAULT = int(os.getenv('CACHE_HTTP_MAX_AGE_ESTATICOS', 3600))  # app/static
+    VERSAO_APLICACAO = os.getenv('VERSAO_APLICACAO')  # entra no ETag; padrão: hash dos templates
+
+    # Compressão das respostas (brotli se o pacote estiver instalado, senão gzip)
+    COMPRESSAO_ATIVA = os.getenv('COMPRESSAO_ATIVA', '1') == '1'
+    COMPRESSAO_MIN_BYTES = int(os.getenv('COMPRESSAO_MIN_BYTES', 1024))
+    COMPRESSAO_MAX_BYTES_ESTATICOS = int(os.getenv('COMPRESSAO_MAX_BYTES_ESTATICOS', 1024 * 1024))
+    COMPRESSAO_NIVEL_GZIP = int(os.getenv('COMPRESSAO_NIVEL_GZIP', 6))
+    COMPRESSAO_QUALIDADE_BROTLI = int(os.getenv('COMPRESSAO_QUALIDADE_BROTLI', 4))
+
+    # Cache de fragmentos de template ({% cache %}), em memória por processo
+    FRAGMENTOS_ATIVO = os.getenv('FRAGMENTOS_ATIVO', '1') == '1'
+    FRAGMENTOS_MAX_ITENS = int(os.getenv('FRAGMENTOS_MAX_ITENS', 2000))
+    FRAGMENTOS_TTL = int(os.getenv('FRAGMENTOS_TTL', 3600))  # segundos
+
+    # API JSON do catálogo (/api/produtos)
+    API_LIMITE_PADRAO = int(os.getenv('API_LIMITE_PADRAO', 50))
+    API_LIMITE_MAXIMO = int(os.getenv('API_LIMITE_MAXIMO', 500))
+    API_EXPORTACAO_LOTE = int(os.getenv('API_EXPORTACAO_LOTE', 1000))  # produtos por pedaço do streaming
+
+    # Paginação da listagem: keyset (cursor opaco, custo constante) ou offset (?page=N)
+    CATALOGO_PAGINACAO = os.getenv('CATALOGO_PAGINACAO', 'keyset')
+
+    # Carrinho de visitantes: cookie (sessão assinada), memoria (um único worker) ou banco (carrinho_compras)
+    CARRINHO_ANONIMO_BACKEND = os.getenv('CARRINHO_ANONIMO_BACKEND', 'cookie')
+    CARRINHO_ANONIMO_MAX_ITENS = int(os.getenv('CARRINHO_ANONIMO_MAX_ITENS', 50))  # limita o tamanho do cookie
+    CARRINHO_ANONIMO_MAX_SESSOES = int(os.getenv('CARRINHO_ANONIMO_MAX_SESSOES', 10000))  # backend memoria
+    CARRINHO_MAX_OPERACOES = int(os.getenv('CARRINHO_MAX_OPERACOES', 50))  # por requisição em /api/carrinho
+
+    # Limpeza de carrinhos abandonados em carrinho_compras (flask carrinhos limpar ou tarefa periódica da fila)
+    CARRINHO_VISITANTE_EXPIRACAO = int(os.getenv('CARRINHO_VISITANTE_EXPIRACAO', PERMANENT_SESSION_LIFETIME))  # segundos
+    CARRINHO_CLIENTE_EXPIRACAO_DIAS = int(os.getenv('CARRINHO_CLIENTE_EXPIRACAO_DIAS', 30))
+    CARRINHO_LIMPEZA_LOTE = int(os.getenv('CARRINHO_LIMPEZA_LOTE', 500))  # linhas por transação
+    CARRINHO_LIMPEZA_PAUSA = float(os.getenv('CARRINHO_LIMPEZA_PAUSA', 0.05))  # segundos entre lotes
+    CARRINHO_LIMPEZA_INTERVALO = int(os.getenv('CARRINHO_LIMPEZA_INTERVALO', 900))  # segundos; 0 desativa a tarefa
+
+    # Checkout: novas tentativas em caso de "database is locked"
+    CHECKOUT_MAX_TENTATIVAS = int(os.getenv('CHECKOUT_MAX_TENTATIVAS', 5))
+    CHECKOUT_ESPERA_BASE = float(os.getenv('CHECKOUT_ESPERA_BASE', 0.05))  # segundos
+
+    # Arquivamento de pedidos entregues/cancelados (flask pedidos arquivar)
+    PEDIDOS_ARQUIVAR_APOS_DIAS = int(os.getenv('PEDIDOS_ARQUIVAR_APOS_DIAS', 180))
+    PEDIDOS_ARQUIVO_LOTE = int(os.getenv('PEDIDOS_ARQUIVO_LOTE', 500))  # pedidos por transação
+    PEDIDOS_ARQUIVO_PAUSA = float(os.getenv('PEDIDOS_ARQUIVO_PAUSA', 0.05))  # segundos entre lotes
+
+    # Agregados de vendas dos relatórios (app/vendas.py): reconstrução com flask vendas reconstruir
+    VENDAS_RECONSTRUCAO_LOTE = int(os.getenv('VENDAS_RECONSTRUCAO_LOTE', 2000))  # ids de pedido por transação
+    VENDAS_RECONSTRUCAO_PAUSA = float(os.getenv('VENDAS_RECONSTRUCAO_PAUSA', 0.05))  # segundos entre lotes
+
+    # Imagens de produtos (app/imagens.py): originais e derivados JPEG com nome pelo hash do conteúdo
+    IMAGENS_DIR = os.getenv('IMAGENS_DIR')  # padrão: instance/imagens
+    IMAGENS_TAMANHOS = {  # lado máximo, em pixels, de cada derivado
+        'miniatura': int(os.getenv('IMAGENS_MINIATURA', 160)),  # carrinho
+        'card': int(os.getenv('IMAGENS_CARD', 480)),  # listagem e busca
+        'detalhe': int(os.getenv('IMAGENS_DETALHE', 1200)),  # página do produto
+    }
+    IMAGENS_QUALIDADE = int(os.getenv('IMAGENS_QUALIDADE', 82))  # JPEG
+    IMAGENS_PROCESSOS = int(os.getenv('IMAGENS_PROCESSOS', 0))  # pool da geração em lote; 0: nº de CPUs
+
+    # Fila de tarefas pós-checkout (tabela tarefas no próprio banco + `flask fila worker`)
+    FILA_SINCRONA = os.getenv('FILA_SINCRONA', '0') == '1'  # executa as tarefas na própria requisição (sem worker)
+    FILA_PROCESSOS = int(os.getenv('FILA_PROCESSOS', 2))
+    FILA_INTERVALO = float(os.getenv('FILA_INTERVALO', 1.0))  # segundos entre consultas quando a fila está vazia
+    FILA_MAX_TENTATIVAS = int(os.getenv('FILA_MAX_TENTATIVAS', 5))
+    FILA_ESPERA_BASE = float(os.getenv('FILA_ESPERA_BASE', 2.0))  # segundos; dobra a cada nova tentativa
+    FILA_TEMPO_RESERVA = int(os.getenv('FILA_TEMPO_RESERVA', 300))  # segundos até uma tarefa travada ser retomada
+
+    # Limites de requisições das rotas caras (app/limites.py), compartilhados pelos workers em instance/limites.db.
+    # Baldes "capacidade/segundos" por IP, sessão e rota; "simultaneas" limita as requisições em andamento (503)
+    LIMITES_ATIVOS = os.getenv('LIMITES_ATIVOS', '1') == '1'
+    LIMITES_BACKEND = os.getenv('LIMITES_BACKEND', 'sqlite')  # sqlite (compartilhado) ou memoria
+    LIMITES_ARQUIVO = os.getenv('LIMITES_ARQUIVO')  # padrão: instance/limites.db
+    LIMITES_TIMEOUT = float(os.getenv('LIMITES_TIMEOUT', 1.0))  # segundos de espera pelo lock do SQLite
+    LIMITES_REGRAS = {
+        'login': os.getenv('LIMITES_LOGIN', 'ip=20/60 sessao=10/60 rota=200/10 simultaneas=6'),
+        'cadastro': os.getenv('LIMITES_CADASTRO', 'ip=5/300 sessao=3/300 rota=50/10 simultaneas=4'),
+        'carrinho': os.getenv('LIMITES_CARRINHO', 'ip=120/60 sessao=60/60'),
+        'checkout': os.getenv('LIMITES_CHECKOUT', 'ip=10/60 sessao=5/60 rota=100/10 simultaneas=4'),
+    }
+
+    # Hash de senhas (app/senhas.py): parâmetros no formato do werkzeug e pool de processos por worker
+    SENHA_METODO = os.getenv('SENHA_METODO', 'scrypt:32768:8:1')  # hashes antigos são refeitos no login
+    SENHA_PROCESSOS = int(os.getenv('SENHA_PROCESSOS', 1))  # 0: calcula o hash na própria requisição
+    SENHA_MAX_PENDENTES = int(os.getenv('SENHA_MAX_PENDENTES', 2))  # acima disso o login responde 503
+    SENHA_TIMEOUT = float(os.getenv('SENHA_TIMEOUT', 10))  # segundos
+    SENHA_NICE = int(os.getenv('SENHA_NICE', 5))  # prioridade reduzida dos processos de hash
 
 class DevelopmentConfig(Config):
     """Configuração para desenvolvimento"""
@@ -19,11 +148,37 @@ class ProductionConfig(Config):
     DEBUG = False
     TESTING = False
     SESSION_COOKIE_SECURE = True
+    ADMIN_LOCAL_SEM_TOKEN = os.getenv('ADMIN_LOCAL_SEM_TOKEN', '0') == '1'  # produção: só com ADMIN_TOKEN
+
+    # SQLite com vários workers do gunicorn: WAL (leitores não bloqueiam o escritor),
+    # synchronous=NORMAL (seguro com WAL), 64 MiB de cache e 256 MiB de mmap por conexão
+    SQLITE_JOURNAL_MODE = os.getenv('SQLITE_JOURNAL_MODE', 'WAL')
+    SQLITE_SYNCHRONOUS = os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL')
+    SQLITE_CACHE_SIZE_KB = int(os.getenv('SQLITE_CACHE_SIZE_KB', 65536))
+    SQLITE_MMAP_SIZE_MB = int(os.getenv('SQLITE_MMAP_SIZE_MB', 256))
+    SQLITE_TEMP_STORE_MEMORIA = os.getenv('SQLITE_TEMP_STORE_MEMORIA', '1') == '1'
+
+    # Workers não migram o banco ao subir: processo release do Procfile
+    ESQUEMA_MIGRAR_AO_INICIAR = os.getenv('ESQUEMA_MIGRAR_AO_INICIAR', '0') == '1'
+
+    # Pool por processo: um worker síncrono usa uma conexão por vez; aumente com --threads
+    SQLALCHEMY_ENGINE_OPTIONS = {
+        'pool_size': int(os.getenv('DB_POOL_SIZE', 5)),
+        'max_overflow': int(os.getenv('DB_POOL_MAX_OVERFLOW', 5)),
+        'pool_timeout': int(os.getenv('DB_POOL_TIMEOUT', 30)),
+    }
 
 class TestingConfig(Config):
     """Configuração para testes"""
     TESTING = True
     SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
+    CACHE_CATALOGO_BACKEND = 'memoria'
+    FILA_SINCRONA = True  # banco em memória: não há worker separado
+    SENHA_METODO = 'pbkdf2:sha256:1000'  # hash barato: testes criam muitos clientes
+    SENHA_PROCESSOS = 0
+    LIMITES_ATIVOS = False  # testes fazem muitos logins seguidos do mesmo endereço
+    LIMITES_BACKEND = 'memoria'
+    INSTRUMENTACAO_BACKEND = 'memoria'
 
 config = {
     'development': DevelopmentConfig,
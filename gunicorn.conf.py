@@ -0,0 +1,39 @@
+"""
+Configuração do gunicorn (lida automaticamente de ./gunicorn.conf.py).
+
+Com preload_app (padrão) a aplicação é importada e criada uma única vez no
+master e os workers nascem por fork, já com os módulos carregados e os
+templates compilados: subir ou repor um worker custa milissegundos em vez
+de importar Flask/SQLAlchemy de novo. Depois do fork cada worker descarta
+o pool de conexões herdado e confere a versão do esquema do banco.
+
+Variáveis: PORT, WEB_CONCURRENCY (workers), GUNICORN_THREADS (>1 usa
+workers gthread), GUNICORN_PRELOAD (1/0), GUNICORN_TIMEOUT.
+"""
+import os
+
+bind = f'0.0.0.0:{os.getenv("PORT", "8000")}'
+workers = int(os.getenv('WEB_CONCURRENCY', 2))
+threads = int(os.getenv('GUNICORN_THREADS', 1))
+preload_app = os.getenv('GUNICORN_PRELOAD', '1') == '1'
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 30))
+
+
+def when_ready(server):
+    # Com preload, compila os templates no master: os workers herdam o cache do Jinja
+    if server.cfg.preload_app:
+        app = server.app.wsgi()
+        for nome in app.jinja_env.list_templates():
+            app.jinja_env.get_template(nome)
+
+
+def post_fork(server, worker):
+    if server.cfg.preload_app:
+        from app.banco import descartar_conexoes_herdadas
+        descartar_conexoes_herdadas(worker.app.wsgi())
+
+
+def post_worker_init(worker):
+    # Esquema desatualizado: o worker não sobe (rode `flask --app run:app esquema migrar`)
+    from app.migracoes import exigir_esquema_atualizado
+    exigir_esquema_atualizado(worker.wsgi)
@@ -0,0 +1,30 @@
+import pytest
+from sqlalchemy import event
+
+from app import create_app, db
+
+
+@pytest.fixture
+def app():
+    app = create_app('testing')
+    with app.app_context():
+        yield app
+        db.session.remove()
+
+
+@pytest.fixture
+def contar_consultas(app):
+    """Retorna uma função que executa `funcao` e devolve quantas instruções SQL ela emitiu."""
+    def contar(funcao, *args, **kwargs):
+        contador = [0]
+
+        def _antes(*_):
+            contador[0] += 1
+
+        event.listen(db.engine, 'before_cursor_execute', _antes)
+        try:
+            funcao(*args, **kwargs)
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', _antes)
+        return contador[0]
+    return contar
@@ -0,0 +1,32 @@
+"""
+Rotas administrativas (/_stats/*, /admin/relatorios/*): ADMIN_TOKEN ou,
+com ADMIN_LOCAL_SEM_TOKEN, localhost.
+"""
+import pytest
+
+ROTAS = ['/_stats/fila', '/_stats/cache', '/admin/relatorios/vendas', '/admin/relatorios/clientes']
+EXTERNO = {'REMOTE_ADDR': '203.0.113.9'}
+
+
+@pytest.mark.parametrize('rota', ROTAS)
+def test_localhost_sem_token_so_quando_permitido(app, rota):
+    cliente = app.test_client()
+    assert cliente.get(rota).status_code == 200
+    assert cliente.get(rota, environ_base=EXTERNO).status_code == 404
+
+    app.config['ADMIN_LOCAL_SEM_TOKEN'] = False  # padrão de ProductionConfig
+    assert cliente.get(rota).status_code == 404
+
+
+@pytest.mark.parametrize('rota', ROTAS)
+def test_token_libera_de_qualquer_endereco(app, rota):
+    app.config.update(ADMIN_TOKEN='segredo', ADMIN_LOCAL_SEM_TOKEN=False)
+    cliente = app.test_client()
+    assert cliente.get(rota, environ_base=EXTERNO, headers={'Authorization': 'Bearer segredo'}).status_code == 200
+    assert cliente.get(rota, environ_base=EXTERNO, headers={'Authorization': 'Bearer outro'}).status_code == 404
+    assert cliente.get(rota, headers={'Authorization': 'segredo'}).status_code == 404
+
+
+def test_producao_nao_aceita_localhost_sem_token():
+    from config import ProductionConfig
+    assert ProductionConfig.ADMIN_LOCAL_SEM_TOKEN is False
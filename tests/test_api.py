@@ -0,0 +1,15 @@
+"""
+Parâmetros da API do catálogo: valores inválidos são recusados com 400.
+"""
+import pytest
+
+
+@pytest.mark.parametrize('valor', ['nan', 'inf', '-Infinity', 'abc'])
+def test_preco_nao_finito_e_recusado(app, valor):
+    resposta = app.test_client().get(f'/api/produtos?preco_min={valor}')
+    assert resposta.status_code == 400
+    assert 'preco_min' in resposta.get_json()['erro']
+
+
+def test_preco_finito_e_aceito(app):
+    assert app.test_client().get('/api/produtos?preco_min=1.5&preco_max=10').status_code == 200
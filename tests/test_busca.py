@@ -0,0 +1,29 @@
+"""
+Busca sem FTS5 (LIKE): os caracteres curinga digitados são literais.
+"""
+import pytest
+
+from app import db
+from app.busca import buscar_produtos
+from app.models import Produto
+
+
+@pytest.fixture
+def busca_like(app):
+    app.extensions['busca_fts'] = False
+    db.session.add_all([
+        Produto(nome='Caneca', descricao='porcelana', preco=10.0, estoque=1),
+        Produto(nome='Cabo_USB', descricao='100% cobre', preco=5.0, estoque=1),
+        Produto(nome='Mochila', descricao='lona', preco=50.0, estoque=1),
+    ])
+    db.session.commit()
+
+
+@pytest.mark.parametrize('termo, nomes', [
+    ('_', ['Cabo_USB']),
+    ('100%', ['Cabo_USB']),
+    ('0% c', ['Cabo_USB']),
+    ('ca', ['Caneca', 'Cabo_USB']),
+])
+def test_curingas_digitados_sao_literais(busca_like, termo, nomes):
+    assert [item.nome for item in buscar_produtos(termo).items] == nomes
@@ -0,0 +1,45 @@
+"""
+Invalidação do cache do catálogo: páginas por cursor ordenadas por uma
+coluna do produto acompanham as mudanças dessa coluna.
+"""
+import pytest
+
+from app import db
+from app.catalogo import get_pagina_produtos_keyset
+from app.models import Produto
+
+
+@pytest.fixture
+def produtos(app):
+    produtos = [Produto(nome=f'p{i:02d}', descricao='d', preco=10.0 + i, estoque=5) for i in range(30)]
+    db.session.add_all(produtos)
+    db.session.commit()
+    return produtos
+
+
+def _nomes(pagina):
+    return [item.nome for item in pagina.items]
+
+
+@pytest.mark.parametrize('ordem, coluna, valor', [
+    ('preco', 'preco', 0.5),
+    ('nome', 'nome', 'a00'),
+])
+def test_pagina_por_cursor_acompanha_a_coluna_da_ordenacao(produtos, ordem, coluna, valor):
+    assert _nomes(get_pagina_produtos_keyset(ordem=ordem, per_page=5))[0] == 'p00'
+
+    setattr(produtos[29], coluna, valor)
+    db.session.commit()
+
+    assert _nomes(get_pagina_produtos_keyset(ordem=ordem, per_page=5))[0] == produtos[29].nome
+
+
+def test_mudanca_fora_da_ordenacao_mantem_a_pagina_no_cache(app, produtos):
+    cache = app.extensions['cache_catalogo']
+    get_pagina_produtos_keyset(ordem='preco', per_page=5)
+    produtos[29].estoque = 1
+    db.session.commit()
+
+    hits = cache.estatisticas()['hits']
+    get_pagina_produtos_keyset(ordem='preco', per_page=5)
+    assert cache.estatisticas()['hits'] == hits + 1
@@ -0,0 +1,93 @@
+"""
+O número de consultas de carrinho e pedidos não cresce com o número de
+linhas (sem N+1): o mesmo código é medido com 1 e com N linhas.
+"""
+from app import db
+from app.carrinho import calcular_total_carrinho, get_carrinho_itens
+from app.models import CarrinhoCompras, Cliente, ItemPedido, Pagamento, Pedido, Produto
+from app.pedidos import get_detalhes_pedido, get_pedidos_cliente
+
+N = 25
+
+
+def _cliente(email):
+    cliente = Cliente(nome=email, email=email, senha_hash='x')
+    db.session.add(cliente)
+    db.session.flush()
+    return cliente
+
+
+def _produtos(quantidade):
+    produtos = [Produto(nome=f'P{i}', descricao='d', preco=10.0 + i, estoque=100) for i in range(quantidade)]
+    db.session.add_all(produtos)
+    db.session.flush()
+    return produtos
+
+
+def _cliente_com_carrinho(email, linhas):
+    cliente = _cliente(email)
+    for produto in _produtos(linhas):
+        db.session.add(CarrinhoCompras(cliente_id=cliente.id, produto_id=produto.id, quantidade=2))
+    db.session.commit()
+    return cliente.id
+
+
+def _cliente_com_pedidos(email, pedidos, itens_por_pedido):
+    cliente = _cliente(email)
+    produtos = _produtos(itens_por_pedido)
+    ultimo = None
+    for _ in range(pedidos):
+        ultimo = Pedido(cliente_id=cliente.id, total=1.0, status='confirmado',
+                        pagamento=Pagamento(metodo='pix', status='aprovado'))
+        ultimo.itens = [ItemPedido(produto_id=p.id, quantidade=1, preco_unitario=p.preco) for p in produtos]
+        db.session.add(ultimo)
+    db.session.commit()
+    return cliente.id, ultimo.id
+
+
+def _percorrer_carrinho(cliente_id):
+    for item in get_carrinho_itens(cliente_id=cliente_id):
+        item.produto.nome, item.produto.preco
+    calcular_total_carrinho(cliente_id=cliente_id)
+
+
+def _percorrer_historico(cliente_id):
+    for pedido, _quantidade_itens in get_pedidos_cliente(cliente_id, per_page=N).items:
+        pedido.status, pedido.total
+
+
+def _percorrer_detalhes(pedido_id, cliente_id):
+    pedido = get_detalhes_pedido(pedido_id, cliente_id)
+    pedido.pagamento.status, pedido.cliente.nome
+    for item in pedido.itens:
+        item.produto.nome
+
+
+def test_carrinho_consultas_constantes(app, contar_consultas):
+    um = _cliente_com_carrinho('um@x', 1)
+    varios = _cliente_com_carrinho('varios@x', N)
+    db.session.expire_all()
+    consultas_um = contar_consultas(_percorrer_carrinho, um)
+    db.session.expire_all()
+    consultas_varios = contar_consultas(_percorrer_carrinho, varios)
+    assert consultas_um == consultas_varios
+
+
+def test_historico_de_pedidos_consultas_constantes(app, contar_consultas):
+    um, _ = _cliente_com_pedidos('um@x', 1, 1)
+    varios, _ = _cliente_com_pedidos('varios@x', N, 3)
+    db.session.expire_all()
+    consultas_um = contar_consultas(_percorrer_historico, um)
+    db.session.expire_all()
+    consultas_varios = contar_consultas(_percorrer_historico, varios)
+    assert consultas_um == consultas_varios
+
+
+def test_detalhes_do_pedido_consultas_constantes(app, contar_consultas):
+    um, pedido_um = _cliente_com_pedidos('um@x', 1, 1)
+    varios, pedido_varios = _cliente_com_pedidos('varios@x', 1, N)
+    db.session.expire_all()
+    consultas_um = contar_consultas(_percorrer_detalhes, pedido_um, um)
+    db.session.expire_all()
+    consultas_varios = contar_consultas(_percorrer_detalhes, pedido_varios, varios)
+    assert consultas_um == consultas_varios
@@ -0,0 +1,115 @@
+"""
+Fila durável (app/fila.py) sem FILA_SINCRONA: as tarefas só rodam quando
+processar_pendentes é chamada, como em um worker.
+"""
+from datetime import datetime, timedelta
+
+import pytest
+
+from app import db
+from app import fila
+from app.models import Tarefa
+
+ESPERA_BASE = 10.0
+
+
+@pytest.fixture
+def fila_assincrona(app, monkeypatch):
+    app.config.update(FILA_SINCRONA=False, FILA_ESPERA_BASE=ESPERA_BASE, INTERVALO_PERIODICA_TESTE=60)
+    # Os registros de handlers são globais: desfeitos ao fim de cada teste
+    monkeypatch.setattr(fila, 'HANDLERS', dict(fila.HANDLERS))
+    monkeypatch.setattr(fila, 'PERIODICAS', dict(fila.PERIODICAS))
+    return app
+
+
+def _liberar_esperas():
+    """Antecipa as tarefas pendentes como se a espera da nova tentativa já tivesse passado."""
+    db.session.query(Tarefa).filter(Tarefa.status == 'pendente').update(
+        {Tarefa.disponivel_em: datetime.utcnow() - timedelta(seconds=1)})
+    db.session.commit()
+
+
+def _tarefas(tipo):
+    db.session.expire_all()
+    return Tarefa.query.filter_by(tipo=tipo).order_by(Tarefa.id).all()
+
+
+def test_falhas_sao_repetidas_com_espera_exponencial_ate_o_limite(fila_assincrona):
+    chamadas = []
+
+    @fila.tarefa('teste_quebra')
+    def quebra():
+        chamadas.append(1)
+        raise RuntimeError('indisponível')
+
+    fila.enfileirar('teste_quebra', max_tentativas=3)
+    db.session.commit()
+
+    for tentativa in (1, 2):
+        antes = datetime.utcnow()
+        assert fila.processar_pendentes() == 1
+        assert fila.processar_pendentes() == 0  # aguardando a espera
+        [tarefa] = _tarefas('teste_quebra')
+        assert (tarefa.status, tarefa.tentativas) == ('pendente', tentativa)
+        espera = ESPERA_BASE * 2 ** (tentativa - 1)
+        assert timedelta(seconds=espera) <= tarefa.disponivel_em - antes < timedelta(seconds=espera + 5)
+        assert 'indisponível' in tarefa.erro
+        _liberar_esperas()
+
+    assert fila.processar_pendentes() == 1
+    [tarefa] = _tarefas('teste_quebra')
+    assert (tarefa.status, tarefa.tentativas) == ('falha', 3)
+    assert len(chamadas) == 3
+    _liberar_esperas()
+    assert fila.processar_pendentes() == 0
+
+
+@pytest.mark.parametrize('falha', [False, True])
+def test_periodica_e_reagendada_apos_sucesso_ou_falha_definitiva(fila_assincrona, falha):
+    @fila.tarefa_periodica('teste_periodica', 'INTERVALO_PERIODICA_TESTE')
+    def periodica():
+        if falha:
+            raise RuntimeError('quebrou')
+
+    fila.enfileirar('teste_periodica', max_tentativas=1)
+    db.session.commit()
+    antes = datetime.utcnow()
+    assert fila.processar_pendentes() == 1
+
+    executada, proxima = _tarefas('teste_periodica')
+    assert executada.status == ('falha' if falha else 'concluida')
+    assert proxima.status == 'pendente'
+    assert proxima.disponivel_em - antes >= timedelta(seconds=60)
+
+
+def test_reserva_expirada_e_retomada(fila_assincrona):
+    executadas = []
+
+    @fila.tarefa('teste_retomada')
+    def retomada(pedido_id):
+        executadas.append(pedido_id)
+
+    # Worker morreu no meio da execução: a reserva venceu e a tarefa continua "executando"
+    agora = datetime.utcnow()
+    db.session.add(Tarefa(tipo='teste_retomada', payload='{"pedido_id": 7}', status='executando',
+                          tentativas=1, max_tentativas=3, iniciada_em=agora - timedelta(minutes=10),
+                          disponivel_em=agora - timedelta(seconds=1)))
+    db.session.commit()
+
+    assert fila.processar_pendentes() == 1
+    [tarefa] = _tarefas('teste_retomada')
+    assert (tarefa.status, tarefa.tentativas) == ('concluida', 2)
+    assert executadas == [7]
+
+
+def test_reserva_em_andamento_nao_e_retomada(fila_assincrona):
+    @fila.tarefa('teste_em_andamento')
+    def em_andamento():
+        pass
+
+    agora = datetime.utcnow()
+    db.session.add(Tarefa(tipo='teste_em_andamento', payload='{}', status='executando', tentativas=1,
+                          max_tentativas=3, iniciada_em=agora, disponivel_em=agora + timedelta(minutes=5)))
+    db.session.commit()
+
+    assert fila.processar_pendentes() == 0
@@ -0,0 +1,38 @@
+"""
+Troca da imagem de um produto pela fila (flask imagens definir).
+"""
+import pytest
+
+from app import db
+from app.imagens import imagens_cli
+from app.models import Produto
+
+Image = pytest.importorskip('PIL.Image')
+
+
+def test_definir_gera_os_derivados_pela_fila(app, tmp_path):
+    # FILA_SINCRONA: a tarefa gerar_imagens_produto roda logo após o commit
+    app.config['IMAGENS_DIR'] = str(tmp_path / 'imagens')
+    produto = Produto(sku='CANECA', nome='Caneca', descricao='d', preco=10.0, estoque=1)
+    db.session.add(produto)
+    db.session.commit()
+    arquivo = tmp_path / 'caneca.png'
+    Image.new('RGB', (640, 480), (200, 30, 30)).save(arquivo)
+
+    resultado = app.test_cli_runner().invoke(imagens_cli, ['definir', 'CANECA', str(arquivo)])
+
+    assert resultado.exit_code == 0, resultado.output
+    db.session.expire_all()
+    produto = db.session.get(Produto, produto.id)
+    assert produto.imagem_original is not None
+    assert produto.imagem == produto.imagem_original
+    for lado in app.config['IMAGENS_TAMANHOS'].values():
+        assert (tmp_path / 'imagens' / f'{produto.imagem}-{lado}.jpg').exists()
+
+
+def test_definir_sku_inexistente(app, tmp_path):
+    arquivo = tmp_path / 'x.png'
+    Image.new('RGB', (10, 10)).save(arquivo)
+    resultado = app.test_cli_runner().invoke(imagens_cli, ['definir', 'NAO-EXISTE', str(arquivo)])
+    assert resultado.exit_code != 0
+    assert 'NAO-EXISTE' in resultado.output
@@ -0,0 +1,88 @@
+"""
+Reserva de estoque do checkout: um único UPDATE condicional, tudo ou nada,
+e devolução do estoque quando o pagamento é recusado.
+"""
+from types import SimpleNamespace
+
+import pytest
+
+from app import db
+from app import pedidos
+from app.models import CarrinhoCompras, Cliente, ItemPedido, Pagamento, Pedido, Produto
+
+
+@pytest.fixture
+def requisicao(app):
+    with app.test_request_context():
+        yield
+
+
+def _cliente():
+    cliente = Cliente(nome='c', email='c@x', senha_hash='x')
+    db.session.add(cliente)
+    db.session.flush()
+    return cliente
+
+
+def _cliente_com_carrinho(*linhas):
+    """linhas: (estoque, quantidade no carrinho) por produto; retorna (cliente_id, [produto_id])."""
+    cliente = _cliente()
+    produtos = [Produto(nome=f'P{i}', descricao='d', preco=10.0, estoque=estoque)
+                for i, (estoque, _) in enumerate(linhas)]
+    db.session.add_all(produtos)
+    db.session.flush()
+    for produto, (_, quantidade) in zip(produtos, linhas):
+        db.session.add(CarrinhoCompras(cliente_id=cliente.id, produto_id=produto.id, quantidade=quantidade))
+    db.session.commit()
+    return cliente.id, [produto.id for produto in produtos]
+
+
+def _estoques(produto_ids):
+    db.session.expire_all()
+    return [db.session.get(Produto, produto_id).estoque for produto_id in produto_ids]
+
+
+def test_falta_de_um_produto_nao_reserva_nada(app, requisicao):
+    cliente_id, produto_ids = _cliente_com_carrinho((5, 2), (1, 3), (5, 1))
+
+    assert pedidos.finalizar_pedido(cliente_id, 'pix') is None
+
+    assert _estoques(produto_ids) == [5, 1, 5]
+    assert Pedido.query.count() == 0
+    assert ItemPedido.query.count() == 0
+    assert Pagamento.query.count() == 0
+    assert CarrinhoCompras.query.filter_by(cliente_id=cliente_id).count() == 3
+
+
+def test_mesmo_produto_em_duas_linhas_soma_as_quantidades(app, requisicao, monkeypatch):
+    cliente_id = _cliente().id
+    produto = Produto(nome='P', descricao='d', preco=10.0, estoque=5)
+    db.session.add(produto)
+    db.session.commit()
+
+    def carrinho(quantidades):
+        # O banco não guarda duas linhas do mesmo produto; o checkout não deve depender disso
+        itens = [SimpleNamespace(produto_id=produto.id, produto=produto, quantidade=q) for q in quantidades]
+        monkeypatch.setattr(pedidos, 'get_carrinho_itens', lambda cliente_id: itens)
+
+    carrinho([3, 3])  # cada linha cabe no estoque, a soma não
+    assert pedidos.finalizar_pedido(cliente_id, 'pix') is None
+    assert _estoques([produto.id]) == [5]
+
+    carrinho([2, 3])
+    pedido = pedidos.finalizar_pedido(cliente_id, 'pix')
+    assert pedido is not None
+    assert _estoques([produto.id]) == [0]
+    assert sorted(item.quantidade for item in ItemPedido.query.filter_by(pedido_id=pedido.id)) == [2, 3]
+
+
+def test_pagamento_recusado_devolve_o_estoque(app, requisicao, monkeypatch):
+    cliente_id, produto_ids = _cliente_com_carrinho((5, 2), (3, 3))
+    monkeypatch.setattr(pedidos, '_cobrar_pagamento', lambda pagamento: 'recusado')
+
+    # FILA_SINCRONA: processar_pagamento roda logo após o commit do checkout
+    pedido = pedidos.finalizar_pedido(cliente_id, 'pix')
+
+    db.session.expire_all()
+    assert db.session.get(Pedido, pedido.id).status == 'cancelado'
+    assert _estoques(produto_ids) == [5, 3]
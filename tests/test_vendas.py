@@ -0,0 +1,102 @@
+"""
+Os agregados de vendas mantidos pelo checkout (registrar_venda/estornar_venda)
+são iguais aos recalculados por reconstruir_vendas, inclusive com pedidos
+arquivados e cancelamentos durante a reconstrução.
+"""
+import pytest
+from sqlalchemy import select
+
+from app import db
+from app import pedidos
+from app.arquivamento import arquivar_pedidos
+from app.models import (CarrinhoCompras, Cliente, Pedido, PedidoArquivado, Produto, TotalCliente, VendaDiaria,
+                        VendaProdutoDiaria)
+from app.vendas import estornar_venda, reconstruir_vendas
+
+AGREGADOS = (VendaDiaria, VendaProdutoDiaria, TotalCliente)
+
+
+@pytest.fixture
+def requisicao(app):
+    with app.test_request_context():
+        yield
+
+
+def _retrato():
+    """Linhas dos agregados, sem as zeradas por estornos e com a receita arredondada."""
+    retrato = []
+    for modelo in AGREGADOS:
+        linhas = set()
+        for linha in db.session.execute(select(*modelo.__table__.c)):
+            valores = tuple(round(v, 2) if isinstance(v, float) else v for v in linha)
+            if any(valores[-2:]):
+                linhas.add(valores)
+        retrato.append(sorted(linhas))
+    return retrato
+
+
+def _checkout(cliente_id, itens, monkeypatch, pagamento='aprovado'):
+    for produto_id, quantidade in itens:
+        db.session.add(CarrinhoCompras(cliente_id=cliente_id, produto_id=produto_id, quantidade=quantidade))
+    db.session.commit()
+    monkeypatch.setattr(pedidos, '_cobrar_pagamento', lambda _: pagamento)
+    pedido = pedidos.finalizar_pedido(cliente_id, 'pix')
+    assert pedido is not None
+    return pedido.id
+
+
+@pytest.fixture
+def historico(app, requisicao, monkeypatch):
+    """Checkouts de dois clientes, um pagamento recusado e um pedido entregue arquivado."""
+    produtos = [Produto(nome=f'P{i}', descricao='d', preco=10.0 * i + 0.1, estoque=1000) for i in range(1, 5)]
+    clientes = [Cliente(nome=f'c{i}', email=f'c{i}@x', senha_hash='x') for i in range(2)]
+    db.session.add_all(produtos + clientes)
+    db.session.commit()
+    p = [produto.id for produto in produtos]
+    a, b = (cliente.id for cliente in clientes)
+
+    ids = [
+        _checkout(a, [(p[0], 2), (p[1], 1)], monkeypatch),
+        _checkout(b, [(p[1], 3)], monkeypatch),
+        _checkout(a, [(p[2], 1), (p[3], 4)], monkeypatch, pagamento='recusado'),
+        _checkout(b, [(p[0], 1), (p[3], 1)], monkeypatch),
+        _checkout(a, [(p[2], 5)], monkeypatch),
+    ]
+    db.session.expire_all()
+    assert db.session.get(Pedido, ids[2]).status == 'cancelado'
+
+    db.session.get(Pedido, ids[0]).status = 'entregue'
+    db.session.commit()
+    assert arquivar_pedidos(dias=0, pausa=0) == 2  # o entregue e o cancelado
+    assert db.session.get(PedidoArquivado, ids[0]) is not None
+    return ids
+
+
+def test_incremental_igual_a_reconstrucao(historico):
+    incremental = _retrato()
+    assert all(incremental)
+
+    reconstruir_vendas(tamanho_lote=1, pausa=0)
+
+    assert _retrato() == incremental
+
+
+def test_cancelamento_durante_a_reconstrucao(historico):
+    # Um pedido já recontado e outro ainda não: os dois são estornados uma única vez
+    cancelar = [historico[1], historico[4]]
+
+    def progresso(fim, limite):
+        for pedido_id in list(cancelar):
+            pedido = db.session.get(Pedido, pedido_id)
+            if pedido_id <= fim or pedido_id == historico[4]:
+                pedido.status = 'cancelado'
+                estornar_venda(pedido)
+                db.session.commit()
+                cancelar.remove(pedido_id)
+
+    reconstruir_vendas(tamanho_lote=2, pausa=0, progresso=progresso)
+    assert not cancelar
+    durante = _retrato()
+
+    reconstruir_vendas(tamanho_lote=1, pausa=0)
+    assert _retrato() == durante